@@ -90,6 +90,10 @@ def create_app(config_name='development'):
     def forbidden(error):
         return render_template('errors/403.html'), 403
     
+    # {% cache %} fragments
+    from app.services.fragment_cache import FragmentCacheExtension
+    app.jinja_env.add_extension(FragmentCacheExtension)
+    
     # Template filters
     @app.template_filter('currency')
     def currency_filter(value):
@@ -106,4 +110,41 @@ def create_app(config_name='development'):
             return ''
         return value.strftime(format)
     
+    @app.template_global('page_url')
+    def page_url(cursor):
+        """Current URL with the pagination cursor replaced (filters kept)"""
+        from flask import url_for
+        args = {k: v for k, v in request.args.items() if k not in ('cursor', 'page')}
+        return url_for(request.endpoint, **(request.view_args or {}), **args, cursor=cursor)
+    
+    @app.template_global('srcset')
+    def srcset(url, widths=None):
+        """Responsive srcset for a storage image URL ('' when not available)"""
+        from app.services.supabase import image_srcset, IMAGE_SRCSET_WIDTHS
+        return image_srcset(url, widths or IMAGE_SRCSET_WIDTHS)
+    
     return app
+
+
+def warm_caches(app):
+    """Compile the templates and fill the reference-data caches.
+    
+    With gunicorn's preload_app this runs once in the master (gunicorn.conf.py),
+    so every worker forks with them in memory instead of paying for them on
+    its first requests. Upstream errors only leave a cache cold.
+    """
+    from app.blueprints.main import get_active_banners
+    from app.services.products import ProductService
+    
+    for name in app.jinja_env.list_templates():
+        try:
+            app.jinja_env.get_template(name)
+        except Exception as e:
+            print(f"Error compiling template {name}: {e}")
+    
+    with app.app_context():
+        ProductService.get_categories()
+        ProductService.get_brands()
+        ProductService.get_featured_products(limit=8)
+        ProductService.get_catalog_version()
+        get_active_banners()
@@ -1,12 +1,14 @@
 """
 Admin Blueprint - Administration panel
 """
-from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify
+from flask import Blueprint, Response, render_template, request, redirect, url_for, flash, jsonify
 from app.services.auth import admin_required, AuthService
 from app.services.products import ProductService
 from app.services.orders import OrderService
+from app.services.reports import ReportService
 from app.services.storage import StorageService
 from app.services.supabase import get_supabase_admin_client
+from app.services.cache import invalidate_catalog_cache
 from datetime import datetime, timedelta
 import json
 
@@ -18,42 +20,15 @@ admin_bp = Blueprint('admin', __name__)
 def dashboard():
     """Admin dashboard"""
     try:
-        supabase = get_supabase_admin_client()
-        
-        # Get statistics
-        # Total products
-        products_count = supabase.table('products').select('id', count='exact').execute()
-        total_products = products_count.count if hasattr(products_count, 'count') else 0
-        
-        # Total orders
-        orders_count = supabase.table('orders').select('id', count='exact').execute()
-        total_orders = orders_count.count if hasattr(orders_count, 'count') else 0
-        
-        # Total revenue
-        orders = supabase.table('orders').select('total').eq('status', 'pagado').execute()
-        total_revenue = sum(float(order['total']) for order in orders.data) if orders.data else 0
-        
-        # Recent orders
-        recent_orders = OrderService.get_all_orders(limit=10)
-        
-        # Low stock products
-        low_stock = supabase.table('product_variants').select(
-            '*, product:products(name)'
-        ).lte('stock', 10).order('stock').limit(10).execute()
-        low_stock_products = low_stock.data if low_stock.data else []
-        
-        # Orders by status
-        orders_by_status = {}
-        for status in ['nuevo', 'pagado', 'procesando', 'enviado', 'entregado', 'cancelado']:
-            count = supabase.table('orders').select('id', count='exact').eq('status', status).execute()
-            orders_by_status[status] = count.count if hasattr(count, 'count') else 0
+        stats = OrderService.get_dashboard_stats()
+        orders_by_status = stats.get('orders_by_status') or {}
         
         return render_template('admin/dashboard.html',
-                             total_products=total_products,
-                             total_orders=total_orders,
-                             total_revenue=total_revenue,
-                             recent_orders=recent_orders,
-                             low_stock_products=low_stock_products,
+                             total_products=stats.get('total_products', 0),
+                             total_orders=stats.get('total_orders', 0),
+                             total_revenue=float(stats.get('total_revenue') or 0),
+                             recent_orders=stats.get('recent_orders') or [],
+                             low_stock_products=stats.get('low_stock') or [],
                              orders_by_status=orders_by_status)
     
     except Exception as e:
@@ -69,23 +44,24 @@ def dashboard():
 @admin_required
 def products():
     """Products list"""
-    page = int(request.args.get('page', 1))
+    cursor = request.args.get('cursor')
     per_page = 20
-    offset = (page - 1) * per_page
     
     status = request.args.get('status')
     search = request.args.get('search')
     
-    products = ProductService.get_products(
+    page = ProductService.get_products_page(
+        cursor=cursor,
+        per_page=per_page,
+        projection='admin_row',
         status=status if status else None,
-        search=search,
-        limit=per_page,
-        offset=offset
+        search=search
     )
     
     return render_template('admin/products/index.html',
-                         products=products,
-                         page=page,
+                         products=page['items'],
+                         next_cursor=page['next_cursor'],
+                         prev_cursor=page['prev_cursor'],
                          per_page=per_page)
 
 
@@ -127,6 +103,7 @@ def create_product():
             result = ProductService.create_product(product_data, user['id'])
             
             if result['success']:
+                invalidate_catalog_cache()
                 flash('Producto creado exitosamente', 'success')
                 return redirect(url_for('admin.edit_product', product_id=result['data']['id']))
             else:
@@ -192,6 +169,7 @@ def edit_product(product_id):
             result = ProductService.update_product(product_id, update_data, user['id'])
             
             if result['success']:
+                invalidate_catalog_cache()
                 flash('Producto actualizado exitosamente', 'success')
                 return redirect(url_for('admin.edit_product', product_id=product_id))
             else:
@@ -217,6 +195,7 @@ def delete_product(product_id):
     result = ProductService.delete_product(product_id)
     
     if result['success']:
+        invalidate_catalog_cache()
         flash('Producto eliminado exitosamente', 'success')
     else:
         flash(f'Error al eliminar producto: {result["error"]}', 'error')
@@ -257,6 +236,7 @@ def upload_product_image(product_id):
             }
             
             supabase.table('product_images').insert(image_data).execute()
+            invalidate_catalog_cache()
             
             return jsonify({'success': True, 'url': result['url']})
         
@@ -284,6 +264,7 @@ def delete_product_image(product_id, image_id):
         
         # Delete from database
         supabase.table('product_images').delete().eq('id', image_id).execute()
+        invalidate_catalog_cache()
         
         return jsonify({'success': True})
     
@@ -299,17 +280,17 @@ def delete_product_image(product_id, image_id):
 @admin_required
 def orders():
     """Orders list"""
-    page = int(request.args.get('page', 1))
+    cursor = request.args.get('cursor')
     per_page = 20
-    offset = (page - 1) * per_page
     
     status = request.args.get('status')
     
-    orders = OrderService.get_all_orders(status=status, limit=per_page, offset=offset)
+    page = OrderService.get_orders_page(status=status, cursor=cursor, per_page=per_page)
     
     return render_template('admin/orders/index.html',
-                         orders=orders,
-                         page=page,
+                         orders=page['items'],
+                         next_cursor=page['next_cursor'],
+                         prev_cursor=page['prev_cursor'],
                          per_page=per_page)
 
 
@@ -374,37 +355,65 @@ def reports():
     return render_template('admin/reports/index.html')
 
 
+def _report_dates():
+    """start_date/end_date query args (YYYY-MM-DD), defaulting to the last 30 days"""
+    today = datetime.now()
+    dates = []
+    for arg, default in (('start_date', today - timedelta(days=30)), ('end_date', today)):
+        try:
+            dates.append(datetime.strptime(request.args.get(arg, ''), '%Y-%m-%d').strftime('%Y-%m-%d'))
+        except ValueError:
+            dates.append(default.strftime('%Y-%m-%d'))
+    return tuple(dates)
+
+
 @admin_bp.route('/reportes/ventas')
 @admin_required
 def sales_report():
     """Sales report"""
-    start_date = request.args.get('start_date')
-    end_date = request.args.get('end_date')
-    
-    if not start_date:
-        start_date = (datetime.now() - timedelta(days=30)).strftime('%Y-%m-%d')
-    
-    if not end_date:
-        end_date = datetime.now().strftime('%Y-%m-%d')
+    start_date, end_date = _report_dates()
+    bucket = request.args.get('bucket', 'day')
     
     try:
-        supabase = get_supabase_admin_client()
-        
-        # Get orders in date range
-        orders = supabase.table('orders').select('*').gte('created_at', start_date).lte('created_at', end_date).eq('status', 'pagado').execute()
-        
-        total_sales = sum(float(order['total']) for order in orders.data) if orders.data else 0
-        total_orders = len(orders.data) if orders.data else 0
-        average_order = total_sales / total_orders if total_orders > 0 else 0
+        summary = ReportService.get_sales_summary(start_date, end_date, bucket)
+        page = ReportService.get_sales_page(start_date, end_date, cursor=request.args.get('cursor'))
         
         return render_template('admin/reports/sales.html',
                              start_date=start_date,
                              end_date=end_date,
-                             total_sales=total_sales,
-                             total_orders=total_orders,
-                             average_order=average_order,
-                             orders=orders.data if orders.data else [])
+                             bucket=bucket,
+                             total_sales=float(summary.get('total_sales') or 0),
+                             total_orders=summary.get('total_orders', 0),
+                             average_order=float(summary.get('average_order') or 0),
+                             buckets=summary.get('buckets') or [],
+                             top_products=summary.get('top_products') or [],
+                             orders=page['items'],
+                             next_cursor=page['next_cursor'],
+                             prev_cursor=page['prev_cursor'])
     
     except Exception as e:
         flash(f'Error al generar reporte: {str(e)}', 'error')
         return render_template('admin/reports/sales.html')
+
+
+@admin_bp.route('/reportes/ventas/exportar')
+@admin_required
+def export_sales_report():
+    """Download the paid orders in range as CSV or XLSX (streamed)"""
+    start_date, end_date = _report_dates()
+    export_format = request.args.get('format', 'csv')
+    rows = ReportService.iter_sales(start_date, end_date)
+    
+    if export_format == 'xlsx':
+        body = ReportService.export_xlsx(rows)
+        mimetype = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+    else:
+        export_format = 'csv'
+        body = ReportService.export_csv(rows)
+        mimetype = 'text/csv'
+    
+    filename = f'ventas_{start_date}_{end_date}.{export_format}'
+    return Response(body, mimetype=mimetype, headers={
+        'Content-Disposition': f'attachment; filename="{filename}"',
+        'X-Accel-Buffering': 'no'
+    })
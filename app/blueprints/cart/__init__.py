@@ -35,9 +35,8 @@ def add():
     
     if result['success']:
         if request.headers.get('HX-Request'):
-            # Return updated cart count for HTMX
-            cart_count = CartService.get_cart_count()
-            return jsonify({'success': True, 'cart_count': cart_count})
+            # The RPC already returned the updated counters
+            return jsonify({'success': True, 'cart_count': result['cart_count'], 'cart_total': result['cart_total']})
         
         flash('Producto agregado al carrito', 'success')
         return redirect(url_for('cart.index'))
@@ -78,9 +77,8 @@ def remove(item_id):
     
     if result['success']:
         if request.headers.get('HX-Request'):
-            cart_count = CartService.get_cart_count()
-            cart_total = CartService.get_cart_total()
-            return jsonify({'success': True, 'cart_count': cart_count, 'cart_total': cart_total})
+            summary = CartService.get_cart_summary()
+            return jsonify({'success': True, 'cart_count': summary['count'], 'cart_total': summary['total']})
         
         flash('Producto eliminado del carrito', 'success')
     else:
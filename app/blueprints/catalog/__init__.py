@@ -3,6 +3,8 @@ Catalog Blueprint - Products and categories
 """
 from flask import Blueprint, render_template, request, abort
 from app.services.products import ProductService
+from app.services.http_cache import cached_page
+from app.services.concurrency import gather
 
 catalog_bp = Blueprint('catalog', __name__)
 
@@ -10,9 +12,8 @@ catalog_bp = Blueprint('catalog', __name__)
 @catalog_bp.route('/')
 def index():
     """Catalog home - all products"""
-    page = int(request.args.get('page', 1))
+    cursor = request.args.get('cursor')
     per_page = 20
-    offset = (page - 1) * per_page
     
     # Get filters
     category_id = request.args.get('categoria')
@@ -22,28 +23,33 @@ def index():
     order_by = request.args.get('orden', 'created_at')
     order_dir = request.args.get('dir', 'desc')
     
-    # Get products
-    products = ProductService.get_products(
-        category_id=category_id,
-        brand_id=brand_id,
-        min_price=min_price,
-        max_price=max_price,
-        order_by=order_by,
-        order_dir=order_dir,
-        limit=per_page,
-        offset=offset
-    )
-    
-    # Get categories and brands for filters
-    categories = ProductService.get_categories()
-    brands = ProductService.get_brands()
-    
-    return render_template('catalog/index.html',
-                         products=products,
-                         categories=categories,
-                         brands=brands,
-                         page=page,
-                         per_page=per_page)
+    def render():
+        # Products, and categories and brands for filters, fetched concurrently
+        data = gather(
+            page=lambda: ProductService.get_products_page(
+                cursor=cursor,
+                order_by=order_by,
+                order_dir=order_dir,
+                per_page=per_page,
+                category_id=category_id,
+                brand_id=brand_id,
+                min_price=min_price,
+                max_price=max_price
+            ),
+            categories=ProductService.get_categories,
+            brands=ProductService.get_brands
+        )
+        page = data['page']
+        
+        return render_template('catalog/index.html',
+                             products=page['items'],
+                             categories=data['categories'],
+                             brands=data['brands'],
+                             next_cursor=page['next_cursor'],
+                             prev_cursor=page['prev_cursor'],
+                             per_page=per_page)
+    
+    return cached_page(ProductService.get_catalog_version(category_id or None, brand_id or None), render)
 
 
 @catalog_bp.route('/categoria/<slug>')
@@ -54,9 +60,8 @@ def category(slug):
     if not category:
         abort(404)
     
-    page = int(request.args.get('page', 1))
+    cursor = request.args.get('cursor')
     per_page = 20
-    offset = (page - 1) * per_page
     
     # Get filters
     brand_id = request.args.get('marca')
@@ -65,72 +70,66 @@ def category(slug):
     order_by = request.args.get('orden', 'created_at')
     order_dir = request.args.get('dir', 'desc')
     
-    # Get products
-    products = ProductService.get_products(
-        category_id=category['id'],
-        brand_id=brand_id,
-        min_price=min_price,
-        max_price=max_price,
-        order_by=order_by,
-        order_dir=order_dir,
-        limit=per_page,
-        offset=offset
-    )
-    
-    # Get subcategories
-    subcategories = ProductService.get_categories(parent_id=category['id'])
-    
-    # Get brands for filters
-    brands = ProductService.get_brands()
-    
-    return render_template('catalog/category.html',
-                         category=category,
-                         subcategories=subcategories,
-                         products=products,
-                         brands=brands,
-                         page=page,
-                         per_page=per_page)
+    def render():
+        # Products, subcategories and brands for filters, fetched concurrently
+        data = gather(
+            page=lambda: ProductService.get_products_page(
+                cursor=cursor,
+                order_by=order_by,
+                order_dir=order_dir,
+                per_page=per_page,
+                category_id=category['id'],
+                brand_id=brand_id,
+                min_price=min_price,
+                max_price=max_price
+            ),
+            subcategories=lambda: ProductService.get_categories(parent_id=category['id']),
+            brands=ProductService.get_brands
+        )
+        page = data['page']
+        
+        return render_template('catalog/category.html',
+                             category=category,
+                             subcategories=data['subcategories'],
+                             products=page['items'],
+                             brands=data['brands'],
+                             next_cursor=page['next_cursor'],
+                             prev_cursor=page['prev_cursor'],
+                             per_page=per_page)
+    
+    return cached_page(ProductService.get_catalog_version(category['id'], brand_id or None), render)
 
 
 @catalog_bp.route('/producto/<slug>')
 def product(slug):
-    """Product detail page"""
-    product = ProductService.get_product_by_slug(slug)
-    if not product:
+    """Product detail page (one product_page RPC, cached, plus live stock)"""
+    page = ProductService.get_product_page(slug)
+    if not page:
         abort(404)
-
-    # Imágenes y variantes desde Supabase
-    try:
-        images = ProductService.get_product_images(product['id']) or []
-    except Exception:
-        images = []
-    try:
-        variants = ProductService.get_product_variants(product['id']) or []
-    except Exception:
-        variants = []
-
-    # Relacionados (tu lógica actual)
-    related_products = ProductService.get_related_products(product['id'])
-    if not related_products:
-        related_products = ProductService.get_products(
-            category_id=product['category_id'],
-            limit=4
-        )
-        related_products = [p for p in related_products if p['id'] != product['id']]
-
+    
+    product = page['product']
+    stock = ProductService.get_product_stock(product['id'])
+    variants = [dict(variant, stock=(stock or {}).get(variant['id'], 0)) for variant in page['variants']]
+    
+    # The cached page version does not follow stock: the ETag also hashes the
+    # stock shown, and caches revalidate it on every view. Unknown stock is
+    # rendered privately
+    validators = None
+    if stock is not None:
+        stock_token = ','.join(f"{variant['id']}={variant['stock']}" for variant in variants)
+        validators = {'etag': f"{page['etag']}:{stock_token}"}
+    
     # Fallback de precio
     visible_price = product.get('sale_price') or product.get('base_price') or 0
-
-    # ⚠️ Importante: usar la plantilla que SÍ tienes: catalog/product_detail.html
-    return render_template(
+    
+    return cached_page(validators, lambda: render_template(
         'catalog/product_detail.html',
         product=product,
-        images=images,
+        images=page['images'],
         variants=variants,
-        related_products=related_products,
+        related_products=page['related'],
         visible_price=visible_price,
-    )
-
+    ), revalidate=True)
 
 
 @catalog_bp.route('/marca/<slug>')
@@ -148,9 +147,8 @@ def brand(slug):
     if not brand:
         abort(404)
     
-    page = int(request.args.get('page', 1))
+    cursor = request.args.get('cursor')
     per_page = 20
-    offset = (page - 1) * per_page
     
     # Get filters
     category_id = request.args.get('categoria')
@@ -159,24 +157,29 @@ def brand(slug):
     order_by = request.args.get('orden', 'created_at')
     order_dir = request.args.get('dir', 'desc')
     
-    # Get products
-    products = ProductService.get_products(
-        brand_id=brand['id'],
-        category_id=category_id,
-        min_price=min_price,
-        max_price=max_price,
-        order_by=order_by,
-        order_dir=order_dir,
-        limit=per_page,
-        offset=offset
-    )
-    
-    # Get categories for filters
-    categories = ProductService.get_categories()
-    
-    return render_template('catalog/brand.html',
-                         brand=brand,
-                         products=products,
-                         categories=categories,
-                         page=page,
-                         per_page=per_page)
+    def render():
+        # Products and categories for filters, fetched concurrently
+        data = gather(
+            page=lambda: ProductService.get_products_page(
+                cursor=cursor,
+                order_by=order_by,
+                order_dir=order_dir,
+                per_page=per_page,
+                brand_id=brand['id'],
+                category_id=category_id,
+                min_price=min_price,
+                max_price=max_price
+            ),
+            categories=ProductService.get_categories
+        )
+        page = data['page']
+        
+        return render_template('catalog/brand.html',
+                             brand=brand,
+                             products=page['items'],
+                             categories=data['categories'],
+                             next_cursor=page['next_cursor'],
+                             prev_cursor=page['prev_cursor'],
+                             per_page=per_page)
+    
+    return cached_page(ProductService.get_catalog_version(category_id or None, brand['id']), render)
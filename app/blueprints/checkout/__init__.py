@@ -4,6 +4,7 @@ Checkout Blueprint - Order checkout process
 from flask import Blueprint, render_template, request, redirect, url_for, flash, session
 from app.services.cart import CartService
 from app.services.orders import OrderService
+from app.services.inventory import InventoryService
 from app.services.auth import AuthService, login_required
 from app.services.supabase import get_supabase_client
 import urllib.parse
@@ -136,6 +137,16 @@ def review():
         flash('Tu carrito está vacío', 'warning')
         return redirect(url_for('catalog.index'))
     
+    # Hold stock while the customer reviews the order
+    cart = CartService.get_or_create_cart()
+    reservation = InventoryService.reserve_cart(cart['id'], cart_items) if cart else {'success': True}
+    
+    if not reservation['success']:
+        shortage = next((item for item in cart_items if item.get('variant_id') == reservation.get('variant_id')), None)
+        name = shortage['product']['name'] if shortage else 'un producto'
+        flash(f'Stock insuficiente para {name}: quedan {reservation.get("available", 0)} unidades', 'error')
+        return redirect(url_for('cart.index'))
+    
     customer = session.get('checkout_customer')
     shipping = session.get('checkout_shipping')
     
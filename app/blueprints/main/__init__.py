@@ -1,99 +1,115 @@
 """
 Main Blueprint - Home and static pages
 """
-from flask import Blueprint, render_template, request
+from flask import Blueprint, render_template, request, jsonify, url_for
 from app.services.products import ProductService
 from app.services.supabase import get_supabase_client
+from app.services.cache import get_cache
+from app.services.http_cache import cached_page
+from app.services.concurrency import gather
 
 main_bp = Blueprint('main', __name__)
 
 
-@main_bp.route('/')
-def index():
-    """Home page"""
-    # Get featured products
-    featured_products = ProductService.get_featured_products(limit=8)
+def get_active_banners():
+    """Get active banners (cached)"""
+    def load():
+        supabase = get_supabase_client()
+        banners = supabase.table('banners').select('*').eq('is_active', True).order('display_order').execute()
+        return banners.data if banners.data else []
     
-    # Get active banners
     try:
+        return get_cache().get_or_set('banners:active', load)
+    except:
+        return []
+
+
+def get_published_page(slug):
+    """Get a published content page by slug (cached)"""
+    def load():
         supabase = get_supabase_client()
-        banners = supabase.table('banners').select('*').eq('is_active', True).order('display_order').execute()
-        banners = banners.data if banners.data else []
+        page = supabase.table('pages').select('*').eq('slug', slug).eq('is_published', True).single().execute()
+        return page.data if page.data else None
+    
+    try:
+        return get_cache().get_or_set(f'pages:{slug}', load)
     except:
-        banners = []
+        return None
+
+
+def page_validators(page):
+    """Validators of a content page for cached_page"""
+    if not page:
+        return None
+    return {'etag': f"{page['id']}:{page.get('updated_at')}", 'version': page.get('updated_at')}
+
+
+@main_bp.route('/')
+def index():
+    """Home page"""
+    # Active banners and the catalog version, fetched concurrently
+    versions = gather(banners=get_active_banners, catalog=ProductService.get_catalog_version)
+    banners, catalog = versions['banners'], versions['catalog']
     
-    # Get main categories
-    categories = ProductService.get_categories()
+    # The catalog version plus the banners shown (and when they last changed)
+    validators = catalog and {
+        'etag': ':'.join([catalog['etag']] + [f"{b['id']}@{b.get('updated_at')}" for b in banners]),
+        'version': max([catalog['version']] + [b['updated_at'] for b in banners if b.get('updated_at')])
+    }
+    
+    def render():
+        # Featured products and main categories, fetched concurrently
+        data = gather(
+            featured_products=lambda: ProductService.get_featured_products(limit=8),
+            categories=ProductService.get_categories
+        )
+        
+        return render_template('main/index.html',
+                             featured_products=data['featured_products'],
+                             banners=banners,
+                             categories=data['categories'])
     
-    return render_template('main/index.html',
-                         featured_products=featured_products,
-                         banners=banners,
-                         categories=categories)
+    return cached_page(validators, render)
 
 
 @main_bp.route('/nosotros')
 def about():
     """About us page"""
-    try:
-        supabase = get_supabase_client()
-        page = supabase.table('pages').select('*').eq('slug', 'nosotros').eq('is_published', True).single().execute()
-        page = page.data if page.data else None
-    except:
-        page = None
+    page = get_published_page('nosotros')
     
-    return render_template('main/page.html', page=page)
+    return cached_page(page_validators(page), lambda: render_template('main/page.html', page=page))
 
 
 @main_bp.route('/contacto')
 def contact():
     """Contact page"""
-    try:
-        supabase = get_supabase_client()
-        page = supabase.table('pages').select('*').eq('slug', 'contacto').eq('is_published', True).single().execute()
-        page = page.data if page.data else None
-    except:
-        page = None
+    page = get_published_page('contacto')
     
-    return render_template('main/contact.html', page=page)
+    return cached_page(page_validators(page), lambda: render_template('main/contact.html', page=page))
 
 
 @main_bp.route('/terminos')
 def terms():
     """Terms and conditions"""
-    try:
-        supabase = get_supabase_client()
-        page = supabase.table('pages').select('*').eq('slug', 'terminos').eq('is_published', True).single().execute()
-        page = page.data if page.data else None
-    except:
-        page = None
+    page = get_published_page('terminos')
     
-    return render_template('main/page.html', page=page)
+    return cached_page(page_validators(page), lambda: render_template('main/page.html', page=page))
 
 
 @main_bp.route('/privacidad')
 def privacy():
     """Privacy policy"""
-    try:
-        supabase = get_supabase_client()
-        page = supabase.table('pages').select('*').eq('slug', 'privacidad').eq('is_published', True).single().execute()
-        page = page.data if page.data else None
-    except:
-        page = None
+    page = get_published_page('privacidad')
     
-    return render_template('main/page.html', page=page)
+    return cached_page(page_validators(page), lambda: render_template('main/page.html', page=page))
 
 
 @main_bp.route('/devoluciones')
 def returns():
     """Returns policy"""
-    try:
-        supabase = get_supabase_client()
-        page = supabase.table('pages').select('*').eq('slug', 'devoluciones').eq('is_published', True).single().execute()
-        page = page.data if page.data else None
-    except:
-        page = None
+    page = get_published_page('devoluciones')
     
-    return render_template('main/page.html', page=page)
+    return cached_page(page_validators(page), lambda: render_template('main/page.html', page=page))
 
 
 @main_bp.route('/buscar')
@@ -101,12 +117,29 @@ def search():
     """Search page"""
     query = request.args.get('q', '')
     
-    if query:
-        products = ProductService.search_products(query, limit=50)
-    else:
-        products = []
+    def render():
+        if query:
+            products = ProductService.search_products(query, limit=50)
+        else:
+            products = []
+        
+        return render_template('main/search.html', query=query, products=products)
+    
+    return cached_page(ProductService.get_catalog_version(), render)
+
+
+@main_bp.route('/buscar/sugerencias')
+def search_suggestions():
+    """Autocomplete for the header search box (JSON)"""
+    query = request.args.get('q', '')
     
-    return render_template('main/search.html', query=query, products=products)
+    return jsonify({
+        'query': query,
+        'results': [
+            dict(item, url=url_for('catalog.product', slug=item['slug']))
+            for item in ProductService.suggest_products(query)
+        ]
+    })
 
 
 @main_bp.route('/health')
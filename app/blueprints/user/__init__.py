@@ -54,15 +54,15 @@ def profile():
 def orders():
     """User orders"""
     user = AuthService.get_current_user()
-    page = int(request.args.get('page', 1))
+    cursor = request.args.get('cursor')
     per_page = 10
-    offset = (page - 1) * per_page
     
-    orders = OrderService.get_user_orders(user['id'], limit=per_page, offset=offset)
+    page = OrderService.get_user_orders_page(user['id'], cursor=cursor, per_page=per_page)
     
     return render_template('user/orders.html',
-                         orders=orders,
-                         page=page,
+                         orders=page['items'],
+                         next_cursor=page['next_cursor'],
+                         prev_cursor=page['prev_cursor'],
                          per_page=per_page)
 
 
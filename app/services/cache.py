@@ -0,0 +1,250 @@
+"""
+Cache Service - two-tier read-through cache for reference data
+"""
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional
+
+# Default TTL (seconds) per key namespace; the namespace is the text before the first ':'
+CACHE_TTLS = {
+    'categories': 600,
+    'brands': 600,
+    'banners': 300,
+    'pages': 3600,
+    'products': 120,
+    'catalog_version': 120,
+    'search': 60,
+    'dashboard': 30,
+    # Rendered template fragments (app/services/fragment_cache.py); keys carry
+    # the ids and versions they render, the TTL only bounds unused entries
+    'product_cards': 600,
+    'category_nav': 600,
+    'footer': 3600,
+}
+DEFAULT_TTL = 300
+
+# When a shared tier exists, local copies (and namespace generations) live at
+# most this long so that an invalidation issued by another worker is picked up
+# quickly
+LOCAL_TTL_WITH_SHARED = 30
+
+_MISS = object()
+
+
+class LRUCache:
+    """Thread-safe in-process LRU with per-entry expiry"""
+    
+    def __init__(self, maxsize: int = 512):
+        self.maxsize = maxsize
+        self._data: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def get(self, key: str):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return _MISS
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return _MISS
+            self._data.move_to_end(key)
+            return value
+    
+    def set(self, key: str, value: Any, ttl: int):
+        with self._lock:
+            self._data[key] = (time.monotonic() + ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+    
+    def delete_prefix(self, prefix: str):
+        with self._lock:
+            for key in [k for k in self._data if k.startswith(prefix)]:
+                del self._data[key]
+    
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class LocalSharedStore:
+    """Process-local stand-in for Redis (used with CACHE_STORAGE_URL=memory://)"""
+    
+    def __init__(self):
+        self._data: Dict[str, tuple] = {}
+        self._lock = threading.Lock()
+    
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                self._data.pop(key, None)
+                return None
+            return entry[1]
+    
+    def setex(self, key: str, ttl: int, value: bytes):
+        with self._lock:
+            self._data[key] = (time.monotonic() + ttl, value)
+    
+    def incr(self, key: str) -> int:
+        with self._lock:
+            entry = self._data.get(key)
+            value = int(entry[1]) + 1 if entry else 1
+            self._data[key] = (float('inf'), str(value).encode())
+            return value
+
+
+def _connect_shared(url: Optional[str]):
+    """Build the shared tier from a storage URL (None disables it)"""
+    if not url:
+        return None
+    
+    if url.startswith('memory://'):
+        return LocalSharedStore()
+    
+    try:
+        import redis
+    except ImportError:
+        raise ValueError("CACHE_STORAGE_URL points to Redis but the 'redis' package is not installed")
+    
+    return redis.Redis.from_url(url)
+
+
+class TieredCache:
+    """In-process LRU in front of an optional shared (Redis) tier.
+    
+    Shared keys carry a per-namespace generation: invalidating a namespace
+    bumps its counter and the old keys are left to expire, so no index of
+    keys has to be kept (or grows) in Redis.
+    """
+    
+    def __init__(self, maxsize: int = 512, shared=None):
+        self.local = LRUCache(maxsize)
+        self.shared = shared
+    
+    @staticmethod
+    def ttl_for(key: str) -> int:
+        return CACHE_TTLS.get(key.split(':', 1)[0], DEFAULT_TTL)
+    
+    def _shared_key(self, key: str) -> str:
+        """key with the current generation of its namespace (cached locally briefly)"""
+        namespace, _, rest = key.partition(':')
+        generation_key = f'_gen:{namespace}'
+        generation = self.local.get(generation_key)
+        if generation is _MISS:
+            generation = int(self.shared.get(generation_key) or 0)
+            self.local.set(generation_key, generation, LOCAL_TTL_WITH_SHARED)
+        return f'{namespace}@{generation}:{rest}'
+    
+    def get(self, key: str):
+        value = self.local.get(key)
+        if value is not _MISS or self.shared is None:
+            return value
+        
+        try:
+            raw = self.shared.get(self._shared_key(key))
+        except Exception as e:
+            print(f"Error reading shared cache: {e}")
+            return _MISS
+        
+        if raw is None:
+            return _MISS
+        
+        value = json.loads(raw)
+        self.local.set(key, value, min(self.ttl_for(key), LOCAL_TTL_WITH_SHARED))
+        return value
+    
+    def set(self, key: str, value: Any, ttl: int = None):
+        ttl = ttl or self.ttl_for(key)
+        
+        if self.shared is None:
+            self.local.set(key, value, ttl)
+            return
+        
+        self.local.set(key, value, min(ttl, LOCAL_TTL_WITH_SHARED))
+        try:
+            self.shared.setex(self._shared_key(key), ttl, json.dumps(value, default=str))
+        except Exception as e:
+            print(f"Error writing shared cache: {e}")
+    
+    def get_or_set(self, key: str, loader: Callable[[], Any], ttl: int = None, skip_empty: bool = False):
+        """Return the cached value for key, calling loader() on a miss.
+        
+        Exceptions raised by loader propagate and nothing is cached; with
+        skip_empty, falsy results are returned without being cached either.
+        """
+        value = self.get(key)
+        if value is _MISS:
+            value = loader()
+            if value or not skip_empty:
+                self.set(key, value, ttl)
+        return value
+    
+    def invalidate(self, *namespaces: str):
+        """Drop every key in the given namespaces from both tiers"""
+        for namespace in namespaces:
+            self.local.delete_prefix(f'{namespace}:')
+            
+            if self.shared is None:
+                continue
+            try:
+                generation = self.shared.incr(f'_gen:{namespace}')
+                self.local.set(f'_gen:{namespace}', generation, LOCAL_TTL_WITH_SHARED)
+            except Exception as e:
+                print(f"Error invalidating shared cache: {e}")
+    
+    def clear(self):
+        """Drop every known namespace (never flushes the whole Redis db)"""
+        self.invalidate(*CACHE_TTLS)
+        self.local.clear()
+
+
+_cache: Optional[TieredCache] = None
+_fragment_cache: Optional[TieredCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_cache() -> TieredCache:
+    """Get the process-wide cache (shared tier from CACHE_STORAGE_URL)"""
+    global _cache
+    
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = TieredCache(
+                    maxsize=int(os.getenv('CACHE_MAX_ENTRIES', 512)),
+                    shared=_connect_shared(os.getenv('CACHE_STORAGE_URL'))
+                )
+    
+    return _cache
+
+
+def get_fragment_cache() -> TieredCache:
+    """Get the process-wide cache of rendered fragments.
+    
+    One catalog page stores a card per product, so fragments get their own
+    LRU (FRAGMENT_CACHE_MAX_ENTRIES) instead of evicting the reference data
+    in get_cache(); both share the same shared tier.
+    """
+    global _fragment_cache
+    
+    if _fragment_cache is None:
+        shared = get_cache().shared
+        with _cache_lock:
+            if _fragment_cache is None:
+                _fragment_cache = TieredCache(
+                    maxsize=int(os.getenv('FRAGMENT_CACHE_MAX_ENTRIES', 1024)),
+                    shared=shared
+                )
+    
+    return _fragment_cache
+
+
+def invalidate_catalog_cache():
+    """Invalidation hook for admin writes to products, categories or brands"""
+    get_cache().invalidate('products', 'catalog_version', 'categories', 'brands', 'search')
+    get_fragment_cache().invalidate('product_cards', 'category_nav')
@@ -1,19 +1,152 @@
 """
 Shopping Cart Service
 """
-from flask import session
-from app.services.supabase import get_supabase_client, get_supabase_admin_client
-from app.services.auth import AuthService
+from flask import session, g, has_request_context
+from app.services.supabase import get_supabase_admin_client, read_rpc
+from app.services.inventory import InventoryService
+from app.services.products import select_projection
 from typing import Dict, List
+import os
 import uuid
 
+# Guests keep their cart in the signed session cookie (no carts row) up to
+# this many lines; one more moves it to carts/cart_items
+GUEST_CART_MAX_LINES = int(os.getenv('GUEST_CART_MAX_LINES', 20))
+
+# Guest carts untouched for this many days are deleted by `manage.py purge-carts`
+GUEST_CART_RETENTION_DAYS = int(os.getenv('GUEST_CART_RETENTION_DAYS', 30))
+
+# What read paths see when there is no carts row yet
+EMPTY_CART = {'id': None, 'item_count': 0, 'subtotal': 0}
+
+# Messages for the error codes returned by the cart RPCs
+CART_ERRORS = {
+    'product_not_found': 'Product not found',
+    'insufficient_stock': 'Insufficient stock ({available} available)',
+}
+
 
 class CartService:
     """Handle shopping cart operations"""
     
+    @staticmethod
+    def _snapshot() -> Dict:
+        """Per-request cart snapshot stored in flask.g (empty outside a request)"""
+        if not has_request_context():
+            return {}
+        if '_cart_snapshot' not in g:
+            g._cart_snapshot = {}
+        return g._cart_snapshot
+    
+    @staticmethod
+    def invalidate_snapshot():
+        """Drop the per-request cart snapshot after a cart write"""
+        # The cart row carries item_count/subtotal, so it goes stale too
+        if has_request_context():
+            g.pop('_cart_snapshot', None)
+    
+    @staticmethod
+    def uses_session_cart() -> bool:
+        """True while the cart lives in the session (guest without a carts row)"""
+        return has_request_context() and not session.get('user_id') and not session.get('cart_session_id')
+    
+    @staticmethod
+    def _session_lines() -> List[List]:
+        """Session cart lines as [product_id, variant_id, quantity, price]"""
+        return session.get('guest_cart', [])
+    
+    @staticmethod
+    def _save_session_lines(lines: List[List]):
+        if lines:
+            session['guest_cart'] = lines
+        else:
+            session.pop('guest_cart', None)
+        CartService.invalidate_snapshot()
+    
+    @staticmethod
+    def _line_id(product_id: str, variant_id: str = None) -> str:
+        """Item id of a session cart line (stands in for cart_items.id)"""
+        return f'{product_id}:{variant_id or ""}'
+    
+    @staticmethod
+    def _error_message(result: Dict) -> str:
+        message = CART_ERRORS.get(result.get('error'), 'Could not add to cart')
+        return message.format(available=result.get('available', 0))
+    
+    @staticmethod
+    def _persist_session_cart(lines: List[List], user_id: str = None):
+        """Write session lines to the user's cart, or to a new guest cart, and leave session mode"""
+        params = {'p_items': [
+            {'product_id': product_id, 'variant_id': variant_id, 'quantity': quantity}
+            for product_id, variant_id, quantity, _ in lines
+        ]}
+        if user_id:
+            params['p_user_id'] = user_id
+        else:
+            params['p_session_id'] = str(uuid.uuid4())
+        
+        supabase = get_supabase_admin_client()
+        response = supabase.rpc('import_cart_lines', params).execute()
+        
+        session.pop('guest_cart', None)
+        if not user_id:
+            session['cart_session_id'] = params['p_session_id']
+        CartService.invalidate_snapshot()
+        return response.data['cart']
+    
+    @staticmethod
+    def find_cart() -> Dict:
+        """Cart of the current user/session for reading; never inserts.
+        
+        Returns EMPTY_CART (id None) when there is no carts row yet.
+        """
+        snapshot = CartService._snapshot()
+        if snapshot.get('cart'):
+            return snapshot['cart']
+        
+        cart = CartService._find_cart()
+        if has_request_context():
+            snapshot['cart'] = cart
+        return cart
+    
+    @staticmethod
+    def _find_cart() -> Dict:
+        """Select the carts row for the current user/session"""
+        try:
+            user_id = session.get('user_id')
+            session_id = session.get('cart_session_id')
+            if not user_id and not session_id:
+                return EMPTY_CART
+            
+            supabase = get_supabase_admin_client()
+            query = supabase.table('carts').select('*')
+            if user_id:
+                query = query.eq('user_id', user_id)
+            else:
+                query = query.eq('session_id', session_id)
+            response = query.execute()
+            
+            return response.data[0] if response.data else EMPTY_CART
+        
+        except Exception as e:
+            print(f"Error finding cart: {e}")
+            return EMPTY_CART
+    
     @staticmethod
     def get_or_create_cart():
-        """Get or create cart for current user/session"""
+        """Get or create cart for current user/session (write paths only)"""
+        snapshot = CartService._snapshot()
+        if snapshot.get('cart', EMPTY_CART)['id']:
+            return snapshot['cart']
+        
+        cart = CartService._get_or_create_cart()
+        if cart and has_request_context():
+            snapshot['cart'] = cart
+        return cart
+    
+    @staticmethod
+    def _get_or_create_cart():
+        """Fetch or insert the carts row for the current user/session"""
         try:
             user_id = session.get('user_id')
             
@@ -34,6 +167,10 @@ class CartService:
                 # Guest user - use session
                 session_id = session.get('cart_session_id')
                 
+                # Something needs a real carts row (checkout): persist the session cart
+                if not session_id and CartService._session_lines():
+                    return CartService._persist_session_cart(CartService._session_lines())
+                
                 if not session_id:
                     session_id = str(uuid.uuid4())
                     session['cart_session_id'] = session_id
@@ -56,67 +193,135 @@ class CartService:
     
     @staticmethod
     def get_cart_items():
-        """Get all items in cart"""
+        """Get all items in cart (cached for the rest of the request)"""
+        snapshot = CartService._snapshot()
+        if 'items' in snapshot:
+            return snapshot['items']
+        
         try:
-            cart = CartService.get_or_create_cart()
-            if not cart:
+            if CartService.uses_session_cart():
+                items = CartService._session_cart_items()
+                snapshot['items'] = items
+                return items
+            
+            cart = CartService.find_cart()
+            if not cart['id']:
                 return []
             
             supabase = get_supabase_admin_client()
-            response = supabase.table('cart_items').select(
-                '*, product:products(*, images:product_images(*)), variant:product_variants(*)'
+            response = select_projection(
+                supabase.table('cart_items'), 'cart_line'
             ).eq('cart_id', cart['id']).execute()
             
-            return response.data if response.data else []
+            items = response.data if response.data else []
+            if has_request_context():
+                snapshot['items'] = items
+            return items
         
         except Exception as e:
             print(f"Error getting cart items: {e}")
             return []
     
+    @staticmethod
+    def _session_cart_items() -> List[Dict]:
+        """Session cart lines shaped like cart_line rows (one products query)"""
+        lines = CartService._session_lines()
+        if not lines:
+            return []
+        
+        supabase = get_supabase_admin_client()
+        response = select_projection(
+            supabase.table('products'), 'cart_product'
+        ).in_('id', list({line[0] for line in lines})).execute()
+        products = {product['id']: product for product in response.data or []}
+        
+        items = []
+        for product_id, variant_id, quantity, price in lines:
+            product = products.get(product_id)
+            if not product:
+                continue
+            items.append({
+                'id': CartService._line_id(product_id, variant_id),
+                'product_id': product_id,
+                'variant_id': variant_id,
+                'quantity': quantity,
+                'price': price,
+                'product': {key: value for key, value in product.items() if key != 'variants'},
+                'variant': next((v for v in product.get('variants') or [] if v['id'] == variant_id), None)
+            })
+        return items
+    
+    @staticmethod
+    def _quote_session_line(product_id: str, variant_id: str, quantity: int) -> Dict:
+        """Current price of a session line, if its stock covers quantity"""
+        supabase = get_supabase_admin_client()
+        return read_rpc(supabase, 'quote_cart_line', {
+            'p_product_id': product_id,
+            'p_variant_id': variant_id,
+            'p_quantity': quantity
+        }).execute().data or {}
+    
+    @staticmethod
+    def _add_to_session_cart(product_id: str, variant_id: str = None, quantity: int = 1):
+        """Add to the session cart; price and stock are checked by quote_cart_line"""
+        lines = CartService._session_lines()
+        line = next((item for item in lines if item[0] == product_id and item[1] == variant_id), None)
+        new_quantity = (line[2] if line else 0) + quantity
+        
+        quote = CartService._quote_session_line(product_id, variant_id, new_quantity)
+        if not quote.get('success'):
+            return {'success': False, 'error': CartService._error_message(quote)}
+        
+        price = float(quote['price'])
+        if line:
+            line[2], line[3] = new_quantity, price
+        elif len(lines) >= GUEST_CART_MAX_LINES:
+            # Too big for the cookie: move the cart, new line included, to the server
+            cart = CartService._persist_session_cart(lines + [[product_id, variant_id, quantity, price]])
+            return {
+                'success': True,
+                'quantity': quantity,
+                'cart_count': int(cart['item_count']),
+                'cart_total': float(cart['subtotal'])
+            }
+        else:
+            lines.append([product_id, variant_id, quantity, price])
+        
+        CartService._save_session_lines(lines)
+        summary = CartService.get_cart_summary()
+        return {'success': True, 'quantity': new_quantity, 'cart_count': summary['count'], 'cart_total': summary['total']}
+    
     @staticmethod
     def add_to_cart(product_id: str, variant_id: str = None, quantity: int = 1):
-        """Add item to cart"""
+        """Add item to cart (price, stock and increment resolved by the add_to_cart RPC)"""
         try:
+            if CartService.uses_session_cart():
+                return CartService._add_to_session_cart(product_id, variant_id or None, quantity)
+            
             cart = CartService.get_or_create_cart()
             if not cart:
                 return {'success': False, 'error': 'Could not create cart'}
             
             supabase = get_supabase_admin_client()
+            response = supabase.rpc('add_to_cart', {
+                'p_cart_id': cart['id'],
+                'p_product_id': product_id,
+                'p_variant_id': variant_id or None,
+                'p_quantity': quantity
+            }).execute()
+            result = response.data or {}
             
-            # Get product price
-            product = supabase.table('products').select('base_price, sale_price').eq('id', product_id).single().execute()
-            if not product.data:
-                return {'success': False, 'error': 'Product not found'}
-            
-            price = product.data.get('sale_price') or product.data.get('base_price')
-            
-            # Check if item already exists
-            query = supabase.table('cart_items').select('*').eq('cart_id', cart['id']).eq('product_id', product_id)
-            if variant_id:
-                query = query.eq('variant_id', variant_id)
-            else:
-                query = query.is_('variant_id', 'null')
+            CartService.invalidate_snapshot()
             
-            existing = query.execute()
+            if not result.get('success'):
+                return {'success': False, 'error': CartService._error_message(result)}
             
-            if existing.data and len(existing.data) > 0:
-                # Update quantity
-                item = existing.data[0]
-                new_quantity = item['quantity'] + quantity
-                supabase.table('cart_items').update({
-                    'quantity': new_quantity
-                }).eq('id', item['id']).execute()
-            else:
-                # Add new item
-                supabase.table('cart_items').insert({
-                    'cart_id': cart['id'],
-                    'product_id': product_id,
-                    'variant_id': variant_id,
-                    'quantity': quantity,
-                    'price': price
-                }).execute()
-            
-            return {'success': True}
+            return {
+                'success': True,
+                'quantity': result['quantity'],
+                'cart_count': int(result['item_count']),
+                'cart_total': float(result['subtotal'])
+            }
         
         except Exception as e:
             print(f"Error adding to cart: {e}")
@@ -129,11 +334,27 @@ class CartService:
             if quantity <= 0:
                 return CartService.remove_from_cart(item_id)
             
+            if CartService.uses_session_cart():
+                lines = CartService._session_lines()
+                line = next((line for line in lines if CartService._line_id(line[0], line[1]) == item_id), None)
+                if not line:
+                    return {'success': True}
+                
+                # Same stock check and price refresh as adding
+                quote = CartService._quote_session_line(line[0], line[1], quantity)
+                if not quote.get('success'):
+                    return {'success': False, 'error': CartService._error_message(quote)}
+                
+                line[2], line[3] = quantity, float(quote['price'])
+                CartService._save_session_lines(lines)
+                return {'success': True}
+            
             supabase = get_supabase_admin_client()
             supabase.table('cart_items').update({
                 'quantity': quantity
             }).eq('id', item_id).execute()
             
+            CartService.invalidate_snapshot()
             return {'success': True}
         
         except Exception as e:
@@ -144,8 +365,16 @@ class CartService:
     def remove_from_cart(item_id: str):
         """Remove item from cart"""
         try:
+            if CartService.uses_session_cart():
+                CartService._save_session_lines([
+                    line for line in CartService._session_lines()
+                    if CartService._line_id(line[0], line[1]) != item_id
+                ])
+                return {'success': True}
+            
             supabase = get_supabase_admin_client()
             supabase.table('cart_items').delete().eq('id', item_id).execute()
+            CartService.invalidate_snapshot()
             return {'success': True}
         
         except Exception as e:
@@ -156,13 +385,19 @@ class CartService:
     def clear_cart():
         """Clear all items from cart"""
         try:
-            cart = CartService.get_or_create_cart()
-            if not cart:
-                return {'success': False, 'error': 'Cart not found'}
+            if CartService.uses_session_cart():
+                CartService._save_session_lines([])
+                return {'success': True}
+            
+            cart = CartService.find_cart()
+            if not cart['id']:
+                return {'success': True}
             
             supabase = get_supabase_admin_client()
             supabase.table('cart_items').delete().eq('cart_id', cart['id']).execute()
+            InventoryService.release_cart(cart['id'])
             
+            CartService.invalidate_snapshot()
             return {'success': True}
         
         except Exception as e:
@@ -171,81 +406,74 @@ class CartService:
     
     @staticmethod
     def get_cart_total():
-        """Calculate cart total"""
-        items = CartService.get_cart_items()
-        total = sum(float(item['price']) * item['quantity'] for item in items)
-        return total
+        """Get cart subtotal from the denormalized carts row"""
+        return CartService.get_cart_summary()['total']
     
     @staticmethod
     def get_cart_count():
-        """Get total number of items in cart"""
-        items = CartService.get_cart_items()
-        return sum(item['quantity'] for item in items)
+        """Get total number of items from the denormalized carts row"""
+        return CartService.get_cart_summary()['count']
+    
+    @staticmethod
+    def get_cart_summary():
+        """Get header counters (count + total) from a single carts row, or from the session"""
+        if CartService.uses_session_cart():
+            lines = CartService._session_lines()
+            return {
+                'count': sum(line[2] for line in lines),
+                'total': round(sum(line[2] * line[3] for line in lines), 2)
+            }
+        
+        cart = CartService.find_cart()
+        return {
+            'count': int(cart.get('item_count') or 0),
+            'total': float(cart.get('subtotal') or 0)
+        }
     
     @staticmethod
     def merge_guest_cart(user_id: str):
-        """Merge guest cart with user cart after login"""
+        """Merge guest cart with user cart after login (one transactional RPC)"""
+        # The session now belongs to a different cart owner
+        CartService.invalidate_snapshot()
+        
         try:
+            # Session cart: write its lines straight into the user's cart
+            lines = CartService._session_lines()
+            if lines:
+                CartService._persist_session_cart(lines, user_id=user_id)
+                return
+            
             session_id = session.get('cart_session_id')
             if not session_id:
                 return
             
             supabase = get_supabase_admin_client()
-            
-            # Get guest cart
-            guest_cart = supabase.table('carts').select('*').eq('session_id', session_id).execute()
-            if not guest_cart.data:
-                return
-            
-            # Get or create user cart
-            user_cart = supabase.table('carts').select('*').eq('user_id', user_id).execute()
-            if not user_cart.data:
-                # Create user cart
-                user_cart = supabase.table('carts').insert({'user_id': user_id}).execute()
-            
-            if not user_cart.data:
-                return
-            
-            # Move items from guest cart to user cart
-            guest_items = supabase.table('cart_items').select('*').eq('cart_id', guest_cart.data[0]['id']).execute()
-            
-            if guest_items.data:
-                for item in guest_items.data:
-                    # Check if item exists in user cart
-                    existing = supabase.table('cart_items').select('*').eq(
-                        'cart_id', user_cart.data[0]['id']
-                    ).eq('product_id', item['product_id'])
-                    
-                    if item.get('variant_id'):
-                        existing = existing.eq('variant_id', item['variant_id'])
-                    
-                    existing = existing.execute()
-                    
-                    if existing.data:
-                        # Update quantity
-                        new_qty = existing.data[0]['quantity'] + item['quantity']
-                        supabase.table('cart_items').update({
-                            'quantity': new_qty
-                        }).eq('id', existing.data[0]['id']).execute()
-                    else:
-                        # Add item
-                        supabase.table('cart_items').insert({
-                            'cart_id': user_cart.data[0]['id'],
-                            'product_id': item['product_id'],
-                            'variant_id': item.get('variant_id'),
-                            'quantity': item['quantity'],
-                            'price': item['price']
-                        }).execute()
-            
-            # Delete guest cart
-            supabase.table('cart_items').delete().eq('cart_id', guest_cart.data[0]['id']).execute()
-            supabase.table('carts').delete().eq('id', guest_cart.data[0]['id']).execute()
+            supabase.rpc('merge_guest_cart', {
+                'p_session_id': session_id,
+                'p_user_id': user_id
+            }).execute()
             
             # Clear session
             session.pop('cart_session_id', None)
         
         except Exception as e:
             print(f"Error merging carts: {e}")
+    
+    @staticmethod
+    def purge_abandoned(days: int = GUEST_CART_RETENTION_DAYS, batch_size: int = 1000) -> int:
+        """Delete guest carts idle for `days` in batches; returns the number deleted"""
+        supabase = get_supabase_admin_client()
+        purged = 0
+        
+        while True:
+            response = supabase.rpc('purge_abandoned_carts', {
+                'p_older_than_days': days,
+                'p_batch_size': batch_size
+            }).execute()
+            count = response.data or 0
+            purged += count
+            if count < batch_size:
+                return purged
 
 
 def get_cart_count():
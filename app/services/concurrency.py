@@ -0,0 +1,78 @@
+"""
+Concurrency - run independent upstream queries of a request in parallel
+"""
+import contextvars
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+# Threads shared by all requests of a worker process; each query holds one
+# Supabase HTTP connection, so keep this below SUPABASE_HTTP_MAX_CONNECTIONS
+FANOUT_MAX_WORKERS = int(os.getenv('FANOUT_MAX_WORKERS', 8))
+
+THREAD_NAME_PREFIX = 'fanout'
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_pid = os.getpid()
+_executor_lock = threading.Lock()
+
+
+def get_executor() -> ThreadPoolExecutor:
+    """Get the process-wide fan-out pool (rebuilt in a forked worker)"""
+    global _executor, _executor_pid
+    
+    with _executor_lock:
+        # Threads do not survive fork(): a worker never reuses the parent's pool
+        if _executor is None or _executor_pid != os.getpid():
+            _executor = ThreadPoolExecutor(max_workers=FANOUT_MAX_WORKERS, thread_name_prefix=THREAD_NAME_PREFIX)
+            _executor_pid = os.getpid()
+        return _executor
+
+
+def shutdown_executor():
+    """Stop the fan-out pool (shutdown, tests)"""
+    global _executor
+    
+    with _executor_lock:
+        if _executor is not None and _executor_pid == os.getpid():
+            _executor.shutdown(wait=True)
+        _executor = None
+
+
+def gather(**loaders: Callable[[], Any]) -> Dict[str, Any]:
+    """Call independent loaders concurrently and return {name: result}.
+    
+    Each loader runs in a copy of the caller's context, so the Flask app and
+    request contexts (request, session, g) are available to it. The calling
+    thread runs the first loader itself; the rest go to the bounded pool.
+    Called from a pool thread (nested fan-out) everything runs inline, so a
+    full pool can never wait on itself. The first exception, in argument
+    order, is re-raised once every loader has finished.
+    """
+    names = list(loaders)
+    if len(names) < 2 or threading.current_thread().name.startswith(THREAD_NAME_PREFIX):
+        return {name: loaders[name]() for name in names}
+    
+    executor = get_executor()
+    # A context can only be entered by one thread at a time: one copy per task
+    futures = {
+        name: executor.submit(contextvars.copy_context().run, loaders[name])
+        for name in names[1:]
+    }
+    
+    results, errors = {}, []
+    try:
+        results[names[0]] = loaders[names[0]]()
+    except Exception as e:
+        errors.append(e)
+    
+    for name, future in futures.items():
+        try:
+            results[name] = future.result()
+        except Exception as e:
+            errors.append(e)
+    
+    if errors:
+        raise errors[0]
+    return results
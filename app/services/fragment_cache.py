@@ -0,0 +1,58 @@
+"""
+Fragment Cache - rendered Jinja partials stored in the app cache
+"""
+import hashlib
+from typing import Optional
+
+from jinja2 import nodes
+from jinja2.ext import Extension
+from markupsafe import Markup
+
+from app.services.cache import get_fragment_cache
+from app.services.http_cache import RELEASE
+
+
+def fragment_key(tag: str, *parts) -> Optional[str]:
+    """Cache key for a fragment, or None when it cannot be versioned.
+    
+    The tag is the cache namespace, so get_fragment_cache().invalidate(tag)
+    drops every fragment under it. Entities (dicts with an id) contribute
+    id@updated_at (refreshed_at for product_listing rows) and lists each of
+    their items; an entity without either version makes the fragment
+    uncacheable. Anything else contributes its str().
+    """
+    tokens = [RELEASE]
+    for part in parts:
+        for item in part if isinstance(part, (list, tuple)) else [part]:
+            if isinstance(item, dict):
+                version = item.get('updated_at') or item.get('refreshed_at')
+                if not item.get('id') or not version:
+                    return None
+                tokens.append(f"{item['id']}@{version}")
+            else:
+                tokens.append(str(item))
+    
+    return f"{tag}:{hashlib.sha1('|'.join(tokens).encode()).hexdigest()}"
+
+
+class FragmentCacheExtension(Extension):
+    """{% cache 'tag', part, ... %}...{% endcache %}
+    
+    Renders the body once per fragment_key(tag, *parts) and serves it from the
+    fragment cache afterwards (TTL per tag, from CACHE_TTLS).
+    """
+    tags = {'cache'}
+    
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        args = [parser.parse_expression()]
+        while parser.stream.skip_if('comma'):
+            args.append(parser.parse_expression())
+        body = parser.parse_statements(('name:endcache',), drop_needle=True)
+        return nodes.CallBlock(self.call_method('_render', args), [], [], body).set_lineno(lineno)
+    
+    def _render(self, tag, *parts, caller):
+        key = fragment_key(tag, *parts)
+        if key is None:
+            return caller()
+        return Markup(get_fragment_cache().get_or_set(key, lambda: str(caller())))
@@ -0,0 +1,98 @@
+"""
+HTTP Cache - validators and Cache-Control for public catalog pages
+"""
+import hashlib
+import os
+from datetime import datetime, timezone
+from typing import Callable, Dict, Optional
+
+from flask import current_app, make_response, request, session
+from app.services.cart import get_cart_count
+
+# Browsers reuse a page this long before revalidating (seconds)
+HTTP_CACHE_MAX_AGE = int(os.getenv('HTTP_CACHE_MAX_AGE', 60))
+# A CDN honours Surrogate-Control and keeps pages longer: admin edits reach it
+# within this window, and so do products selling out (listings only show
+# whether a product is in stock; the product page is always revalidated)
+HTTP_CACHE_SURROGATE_MAX_AGE = int(os.getenv('HTTP_CACHE_SURROGATE_MAX_AGE', 300))
+# Both may serve a stale copy this long while they revalidate in the background
+HTTP_CACHE_STALE_WHILE_REVALIDATE = int(os.getenv('HTTP_CACHE_STALE_WHILE_REVALIDATE', 600))
+# Templates are part of every page, so a deploy changes every ETag
+RELEASE = os.getenv('RENDER_GIT_COMMIT', '')
+
+PRIVATE_CACHE_CONTROL = 'private, no-cache'
+# Stored by browsers and the CDN, but revalidated on every use
+REVALIDATE_CACHE_CONTROL = 'public, no-cache'
+
+
+def is_cacheable_request() -> bool:
+    """Whether this visitor sees the page everyone sees: an anonymous GET with
+    an empty cart and no pending flash messages"""
+    if request.method not in ('GET', 'HEAD'):
+        return False
+    if session.get('user_id') or session.get('_flashes'):
+        return False
+    return get_cart_count() == 0
+
+
+def weak_etag(etag: str) -> str:
+    """Opaque ETag value for a page version (quoted and W/-prefixed by set_etag)"""
+    return hashlib.sha1(f'{RELEASE}:{etag}'.encode()).hexdigest()
+
+
+def _last_modified(version) -> Optional[datetime]:
+    """HTTP dates have second precision; versions are ISO timestamps from Postgres"""
+    try:
+        return datetime.fromisoformat(version).astimezone(timezone.utc).replace(microsecond=0)
+    except (TypeError, ValueError):
+        return None
+
+
+def cached_page(validators: Optional[Dict], render: Callable, revalidate: bool = False):
+    """Response for a page that only changes when its validators do.
+    
+    validators is {'etag', 'version'} (see ProductService.get_product_page and
+    get_catalog_version; version is optional). Cacheable visitors get a weak
+    ETag, Last-Modified and public Cache-Control/Surrogate-Control, and a 304
+    without calling render when their copy is current. With revalidate (pages
+    showing live values such as stock) caches must check the ETag on every
+    use. Everyone else, or a page without validators, gets a fresh private
+    render.
+    """
+    if not validators or not is_cacheable_request():
+        response = make_response(render())
+        response.headers['Cache-Control'] = PRIVATE_CACHE_CONTROL
+        response.vary.add('Cookie')
+        return response
+    
+    etag = weak_etag(validators['etag'])
+    last_modified = _last_modified(validators.get('version'))
+    
+    # If-None-Match wins over If-Modified-Since (RFC 9110, 13.2.2)
+    if request.if_none_match:
+        not_modified = request.if_none_match.contains_weak(etag)
+    else:
+        not_modified = bool(
+            last_modified and request.if_modified_since
+            and last_modified <= request.if_modified_since
+        )
+    
+    response = current_app.response_class(status=304) if not_modified else make_response(render())
+    response.set_etag(etag, weak=True)
+    if last_modified:
+        response.last_modified = last_modified
+    if revalidate:
+        response.headers['Cache-Control'] = REVALIDATE_CACHE_CONTROL
+    else:
+        response.headers['Cache-Control'] = (
+            f'public, max-age={HTTP_CACHE_MAX_AGE}, '
+            f'stale-while-revalidate={HTTP_CACHE_STALE_WHILE_REVALIDATE}'
+        )
+        response.headers['Surrogate-Control'] = (
+            f'max-age={HTTP_CACHE_SURROGATE_MAX_AGE}, '
+            f'stale-while-revalidate={HTTP_CACHE_STALE_WHILE_REVALIDATE}'
+        )
+    # A visitor who logs in or fills a cart gets a session cookie and
+    # must not be served the anonymous copy
+    response.vary.add('Cookie')
+    return response
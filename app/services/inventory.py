@@ -0,0 +1,64 @@
+"""
+Inventory Service - stock reservations taken during checkout
+"""
+import os
+from app.services.supabase import get_supabase_admin_client
+from typing import Dict, List
+
+# Seconds a checkout hold keeps stock away from other carts
+RESERVATION_TTL = int(os.getenv('STOCK_RESERVATION_TTL', 900))
+
+
+class InventoryService:
+    """Handle stock holds (see 06_stock_reservations.sql)"""
+    
+    @staticmethod
+    def reserve_cart(cart_id: str, cart_items: List[Dict]):
+        """Replace the cart's holds with holds for its current variant lines"""
+        lines = [
+            {'variant_id': item['variant_id'], 'quantity': item['quantity']}
+            for item in cart_items if item.get('variant_id')
+        ]
+        if not lines:
+            return {'success': True}
+        
+        try:
+            supabase = get_supabase_admin_client()
+            response = supabase.rpc('reserve_stock', {
+                'p_cart_id': cart_id,
+                'p_items': lines,
+                'p_ttl_seconds': RESERVATION_TTL
+            }).execute()
+            
+            return response.data if response.data else {'success': False, 'error': 'Could not reserve stock'}
+        
+        except Exception as e:
+            # create_order re-checks stock atomically, so a failed hold
+            # must not block the checkout
+            print(f"Error reserving stock: {e}")
+            return {'success': True, 'error': str(e)}
+    
+    @staticmethod
+    def release_cart(cart_id: str):
+        """Release every hold of a cart"""
+        try:
+            supabase = get_supabase_admin_client()
+            supabase.rpc('release_stock', {'p_cart_id': cart_id}).execute()
+            return {'success': True}
+        
+        except Exception as e:
+            print(f"Error releasing stock: {e}")
+            return {'success': False, 'error': str(e)}
+    
+    @staticmethod
+    def release_expired(batch_size: int = 1000) -> int:
+        """Sweep expired holds in batches; returns the number released"""
+        supabase = get_supabase_admin_client()
+        released = 0
+        
+        while True:
+            response = supabase.rpc('release_expired_reservations', {'p_batch_size': batch_size}).execute()
+            count = response.data or 0
+            released += count
+            if count < batch_size:
+                return released
@@ -1,8 +1,10 @@
 """
 Orders Service
 """
-from app.services.supabase import get_supabase_admin_client
+from app.services.supabase import get_supabase_admin_client, read_rpc
+from app.services.cache import get_cache
 from app.services.cart import CartService
+from app.services.pagination import keyset_page
 from typing import Dict
 import uuid
 from datetime import datetime
@@ -60,20 +62,13 @@ class OrderService:
                 'customer_notes': order_data.get('customer_notes')
             }
             
-            order_response = supabase.table('orders').insert(order).execute()
-            
-            if not order_response.data:
-                return {'success': False, 'error': 'Failed to create order'}
-            
-            created_order = order_response.data[0]
-            
-            # Create order items and update inventory
+            # Order lines snapshot the product/variant data at purchase time
+            items = []
             for item in cart_items:
                 product = item['product']
                 variant = item.get('variant')
                 
-                order_item = {
-                    'order_id': created_order['id'],
+                items.append({
                     'product_id': item['product_id'],
                     'variant_id': item.get('variant_id'),
                     'sku': variant['sku'] if variant else product['sku'],
@@ -81,52 +76,32 @@ class OrderService:
                     'variant_name': variant['name'] if variant else None,
                     'quantity': item['quantity'],
                     'unit_price': item['price'],
-                    'tax_rate': product.get('tax_rate', 0),
-                    'subtotal': float(item['price']) * item['quantity']
-                }
-                
-                supabase.table('order_items').insert(order_item).execute()
-                
-                # Update inventory
-                if variant:
-                    # Update variant stock
-                    current_stock = variant['stock']
-                    new_stock = max(0, current_stock - item['quantity'])
-                    
-                    supabase.table('product_variants').update({
-                        'stock': new_stock
-                    }).eq('id', variant['id']).execute()
-                    
-                    # Log inventory movement
-                    supabase.table('inventory_movements').insert({
-                        'product_id': item['product_id'],
-                        'variant_id': variant['id'],
-                        'movement_type': 'sale',
-                        'quantity': -item['quantity'],
-                        'previous_stock': current_stock,
-                        'new_stock': new_stock,
-                        'reference_type': 'order',
-                        'reference_id': created_order['id']
-                    }).execute()
-            
-            # Clear cart
-            CartService.clear_cart()
-            
-            # Create payment record
-            payment = {
-                'order_id': created_order['id'],
-                'payment_method': order_data.get('payment_method', 'sandbox'),
-                'amount': total,
-                'currency': 'GTQ',
-                'status': 'pending'
-            }
+                    'tax_rate': product.get('tax_rate', 0)
+                })
+            
+            # Order, items, stock, inventory movements, payment and cart
+            # clearing run in a single transaction (see 05_create_order.sql)
+            cart = CartService.get_or_create_cart()
+            order_response = supabase.rpc('create_order', {
+                'p_order': order,
+                'p_items': items,
+                'p_cart_id': cart['id'] if cart else None
+            }).execute()
             
-            supabase.table('payments').insert(payment).execute()
+            if not order_response.data:
+                return {'success': False, 'error': 'Failed to create order'}
+            
+            created_order = order_response.data
+            CartService.invalidate_snapshot()
+            # A sale can leave a product out of stock, which listings render
+            get_cache().invalidate('catalog_version')
             
             return {'success': True, 'order': created_order}
         
         except Exception as e:
             print(f"Error creating order: {e}")
+            if 'insufficient_stock' in str(e):
+                return {'success': False, 'error': 'Stock insuficiente para uno o más productos'}
             return {'success': False, 'error': str(e)}
     
     @staticmethod
@@ -171,6 +146,17 @@ class OrderService:
             print(f"Error getting user orders: {e}")
             return []
     
+    @staticmethod
+    def get_user_orders_page(user_id: str, cursor: str = None, per_page: int = 10):
+        """Get one keyset page of a user's orders, newest first"""
+        try:
+            supabase = get_supabase_admin_client()
+            query = supabase.table('orders').select('*, items:order_items(*)').eq('user_id', user_id)
+            return keyset_page(query, 'created_at', desc=True, cursor=cursor, limit=per_page)
+        except Exception as e:
+            print(f"Error getting user orders: {e}")
+            return {'items': [], 'next_cursor': None, 'prev_cursor': None}
+    
     @staticmethod
     def update_order_status(order_id: str, status: str, admin_notes: str = None):
         """Update order status (admin only)"""
@@ -202,6 +188,8 @@ class OrderService:
                     'processed_at': datetime.now().isoformat()
                 }).eq('order_id', order_id).execute()
             
+            get_cache().invalidate('dashboard')
+            
             return {'success': True, 'data': response.data[0] if response.data else None}
         
         except Exception as e:
@@ -226,6 +214,35 @@ class OrderService:
             print(f"Error getting orders: {e}")
             return []
     
+    @staticmethod
+    def get_orders_page(status: str = None, cursor: str = None, per_page: int = 20):
+        """Get one keyset page of all orders, newest first (admin only)"""
+        try:
+            supabase = get_supabase_admin_client()
+            query = supabase.table('orders').select('*, items:order_items(*)')
+            
+            if status:
+                query = query.eq('status', status)
+            
+            return keyset_page(query, 'created_at', desc=True, cursor=cursor, limit=per_page)
+        except Exception as e:
+            print(f"Error getting orders: {e}")
+            return {'items': [], 'next_cursor': None, 'prev_cursor': None}
+    
+    @staticmethod
+    def get_dashboard_stats(low_stock: int = 10, limit: int = 10):
+        """Admin dashboard figures from the dashboard_stats() RPC (cached briefly)"""
+        def load():
+            supabase = get_supabase_admin_client()
+            response = read_rpc(supabase, 'dashboard_stats', {'p_low_stock': low_stock, 'p_limit': limit}).execute()
+            return response.data
+        
+        try:
+            return get_cache().get_or_set(f'dashboard:stats:{low_stock}:{limit}', load, skip_empty=True)
+        except Exception as e:
+            print(f"Error getting dashboard stats: {e}")
+            return {}
+    
     @staticmethod
     def validate_coupon(code: str, subtotal: float):
         """Validate and apply coupon"""
@@ -0,0 +1,101 @@
+"""
+Pagination Service - keyset (cursor) pagination over PostgREST queries
+"""
+import base64
+import binascii
+import json
+from typing import Callable, Dict, Iterator, Optional
+
+
+def encode_cursor(sort: str, row: Dict, sort_key: str, direction: str) -> str:
+    """Opaque URL-safe token pointing just past (or before) row"""
+    if row.get(sort_key) is None:
+        # A NULL key has no place in the (key, id) comparison of the next page
+        raise ValueError(f'Keyset pagination needs a NOT NULL sort key ({sort_key} is NULL)')
+    
+    payload = {'s': sort, 'k': [row.get(sort_key), row.get('id')], 'd': direction}
+    raw = json.dumps(payload, separators=(',', ':'), default=str).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(token: Optional[str], sort: str) -> Optional[Dict]:
+    """Decode a cursor; tampered tokens or tokens from another sort order give None"""
+    if not token:
+        return None
+    
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        payload = json.loads(raw)
+    except (binascii.Error, ValueError):
+        return None
+    
+    if not isinstance(payload, dict) or payload.get('s') != sort or payload.get('d') not in ('next', 'prev'):
+        return None
+    if not isinstance(payload.get('k'), list) or len(payload['k']) != 2 or None in payload['k']:
+        return None
+    
+    return payload
+
+
+def _quote(value) -> str:
+    """Quote a PostgREST filter value (timestamps, names with commas...)"""
+    text = str(value).replace('\\', '\\\\').replace('"', '\\"')
+    return f'"{text}"'
+
+
+def keyset_page(query, sort_key: str, desc: bool = True, cursor: str = None, limit: int = 20) -> Dict:
+    """Fetch one page of query ordered by (sort_key, id).
+    
+    The query must select sort_key and id, and sort_key must be a NOT NULL
+    column (see 19_keyset_not_null.sql): a row with a NULL key raises
+    ValueError. Returns
+    {'items': [...], 'next_cursor': str|None, 'prev_cursor': str|None}.
+    """
+    sort = f"{sort_key}.{'desc' if desc else 'asc'}"
+    state = decode_cursor(cursor, sort)
+    backwards = state is not None and state['d'] == 'prev'
+    
+    # A previous page is the next page of the reversed order, read back to front
+    scan_desc = desc != backwards
+    if state:
+        # (key, id) past the cursor. PostgREST has no row comparison, so the
+        # redundant key bound is what lets Postgres start the index scan at
+        # the cursor instead of filtering every row before it.
+        key, row_id = state['k']
+        op = 'lt' if scan_desc else 'gt'
+        query = query.lte(sort_key, key) if scan_desc else query.gte(sort_key, key)
+        query = query.or_(
+            f'{sort_key}.{op}.{_quote(key)},and({sort_key}.eq.{_quote(key)},id.{op}.{_quote(row_id)})'
+        )
+    
+    query = query.order(sort_key, desc=scan_desc).order('id', desc=scan_desc).limit(limit + 1)
+    rows = query.execute().data or []
+    
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if backwards:
+        rows.reverse()
+    
+    has_next = True if backwards else has_more
+    has_prev = has_more if backwards else state is not None
+    
+    return {
+        'items': rows,
+        'next_cursor': encode_cursor(sort, rows[-1], sort_key, 'next') if rows and has_next else None,
+        'prev_cursor': encode_cursor(sort, rows[0], sort_key, 'prev') if rows and has_prev else None,
+    }
+
+
+def iter_keyset(make_query: Callable, sort_key: str, desc: bool = False, batch_size: int = 1000) -> Iterator[Dict]:
+    """Yield every row of make_query() in (sort_key, id) order, one keyset page at a time.
+    
+    make_query must return a fresh query builder on each call; only one
+    batch is held in memory, whatever the total row count.
+    """
+    cursor = None
+    while True:
+        page = keyset_page(make_query(), sort_key, desc=desc, cursor=cursor, limit=batch_size)
+        yield from page['items']
+        cursor = page['next_cursor']
+        if not cursor:
+            return
@@ -1,55 +1,138 @@
 """
 Products Service
 """
-from app.services.supabase import get_supabase_client, get_supabase_admin_client
+import hashlib
+from app.services.supabase import get_supabase_client, get_supabase_admin_client, get_public_url, read_rpc
+from app.services.cache import get_cache
+from app.services.pagination import keyset_page
 from typing import List, Dict, Optional
-from app.services.supabase import get_supabase_client, get_public_url
 
+# PostgREST select per call site. Listings ship only what a product card
+# renders, precomputed in the product_listing read model (no embeds);
+# benchmarks/payload_size.py measures each profile against the full row.
+PROJECTIONS = {
+    'card': (
+        'id, name, slug, base_price, sale_price, price_min, price_max, stock, is_featured, '
+        'category_id, category_slug, category_name, brand_slug, brand_name, image_url, image_alt, created_at, refreshed_at'
+    ),
+    'detail': (
+        'id, sku, name, slug, short_description, description, technical_specs, '
+        'base_price, sale_price, tax_rate, status, category_id, brand_id, '
+        'meta_title, meta_description, meta_keywords, '
+        'category:categories(id, name, slug), brand:brands(id, name, slug)'
+    ),
+    'admin_row': (
+        'id, sku, name, status, base_price, sale_price, created_at, '
+        'category:categories(name), brand:brands(name), images:product_images(url), variants:product_variants(stock)'
+    ),
+    # cart_items rows, as used by the cart page and order creation
+    'cart_line': (
+        'id, product_id, variant_id, quantity, price, '
+        'product:products(id, sku, name, slug, tax_rate, images:product_images(url, alt_text)), '
+        'variant:product_variants(id, sku, name)'
+    ),
+    # Products behind session-stored guest cart lines (rendered like cart_line)
+    'cart_product': (
+        'id, sku, name, slug, tax_rate, images:product_images(url, alt_text), '
+        'variants:product_variants(id, sku, name)'
+    ),
+    # Every column, for the admin edit form
+    'full': '*, category:categories(*), brand:brands(*), variants:product_variants(*), images:product_images(*)',
+}
 
-class ProductService:
-    # ... tus métodos existentes ...
+# Profiles read from a table other than products (see 15_product_listing.sql)
+PROJECTION_TABLES = {
+    'card': 'product_listing',
+    'cart_line': 'cart_items',
+}
 
-    @staticmethod
-    def get_product_images(product_id: str):
-        supabase = get_supabase_client()
-        resp = (
-            supabase.table('product_images')
-            .select('id, storage_path, alt_text, is_primary, display_order')
-            .eq('product_id', product_id)
-            .order('is_primary', desc=True)
-            .order('display_order', asc=True)
-            .execute()
-        )
-        rows = resp.data or []
-        out = []
-        for r in rows:
-            path = r.get('storage_path')
-            out.append({
-                'id': r.get('id'),
-                'url': get_public_url(path) if path else None,
-                'alt_text': r.get('alt_text'),
-                'is_primary': r.get('is_primary'),
-                'display_order': r.get('display_order'),
-            })
-        return out
+# Sort keys a listing may page by: NOT NULL columns, each backed by a (key, id)
+# index (see 07_keyset_indexes.sql); nullable ones such as sale_price cannot be keyset-paged
+PRODUCT_SORT_KEYS = ('created_at', 'base_price', 'name')
+
+# Profiles whose embedded images are cut to the primary one
+PRIMARY_IMAGE_PATHS = {
+    'admin_row': 'images',
+    'cart_line': 'product.images',
+    'cart_product': 'images',
+}
 
-    @staticmethod
-    def get_product_variants(product_id: str):
-        supabase = get_supabase_client()
-        resp = (
-            supabase.table('product_variants')
-            .select('id, name, attributes, price_adjustment, stock, is_active')
-            .eq('product_id', product_id)
-            .order('created_at', asc=True)
-            .execute()
-        )
-        return resp.data or []
 
+def projection_table(profile: str) -> str:
+    """Table (or read model) a profile selects from"""
+    return PROJECTION_TABLES.get(profile, 'products')
+
+
+def select_projection(query_builder, profile: str, embed_prefix: str = None):
+    """Apply a named projection to a table query builder"""
+    query = query_builder.select(PROJECTIONS[profile])
+    return primary_image_only(query, profile, embed_prefix)
+
+
+def primary_image_only(query, profile: str, embed_prefix: str = None):
+    """Limit the embedded images of a profile to the primary one"""
+    path = PRIMARY_IMAGE_PATHS.get(profile)
+    if not path:
+        return query
+    if embed_prefix:
+        path = f'{embed_prefix}.{path}'
+    
+    return (
+        query.order('is_primary', desc=True, foreign_table=path)
+        .order('display_order', foreign_table=path)
+        .limit(1, foreign_table=path)
+    )
 
 
 class ProductService:
     """Handle product operations"""
     
+    @staticmethod
+    def _filtered_products(
+        projection: str = 'card',
+        category_id: str = None,
+        brand_id: str = None,
+        search: str = None,
+        min_price: float = None,
+        max_price: float = None,
+        is_featured: bool = None,
+        status: str = 'publicado'
+    ):
+        """Products query with the listing filters applied.
+        
+        Card listings read product_listing, where prices filter on the
+        lowest effective price (sale price and variant adjustments included).
+        """
+        supabase = get_supabase_client()
+        table = projection_table(projection)
+        query = select_projection(supabase.table(table), projection)
+        price_column = 'price_min' if table == 'product_listing' else 'base_price'
+        
+        # Apply filters
+        if status:
+            query = query.eq('status', status)
+        
+        if category_id:
+            query = query.eq('category_id', category_id)
+        
+        if brand_id:
+            query = query.eq('brand_id', brand_id)
+        
+        search = ProductService._normalize_search(search)
+        if search:
+            query = query.ilike('name', ProductService._contains_pattern(search))
+        
+        if min_price is not None:
+            query = query.gte(price_column, min_price)
+        
+        if max_price is not None:
+            query = query.lte(price_column, max_price)
+        
+        if is_featured is not None:
+            query = query.eq('is_featured', is_featured)
+        
+        return query
+    
     @staticmethod
     def get_products(
         category_id: str = None,
@@ -62,37 +145,19 @@ class ProductService:
         order_by: str = 'created_at',
         order_dir: str = 'desc',
         limit: int = 20,
-        offset: int = 0
+        offset: int = 0,
+        projection: str = 'card'
     ):
-        """Get products with filters"""
+        """Get products with filters (projection: a PROJECTIONS profile).
+        
+        For browsable listings use get_products_page, which does not
+        slow down on deep pages.
+        """
         try:
-            supabase = get_supabase_client()
-            query = supabase.table('products').select(
-                '*, category:categories(*), brand:brands(*), variants:product_variants(*), images:product_images(*)'
+            query = ProductService._filtered_products(
+                projection, category_id, brand_id, search, min_price, max_price, is_featured, status
             )
             
-            # Apply filters
-            if status:
-                query = query.eq('status', status)
-            
-            if category_id:
-                query = query.eq('category_id', category_id)
-            
-            if brand_id:
-                query = query.eq('brand_id', brand_id)
-            
-            if search:
-                query = query.ilike('name', f'%{search}%')
-            
-            if min_price is not None:
-                query = query.gte('base_price', min_price)
-            
-            if max_price is not None:
-                query = query.lte('base_price', max_price)
-            
-            if is_featured is not None:
-                query = query.eq('is_featured', is_featured)
-            
             # Order
             if order_dir == 'asc':
                 query = query.order(order_by, desc=False)
@@ -110,12 +175,37 @@ class ProductService:
             return []
     
     @staticmethod
-    def get_product_by_id(product_id: str):
+    def get_products_page(
+        cursor: str = None,
+        order_by: str = 'created_at',
+        order_dir: str = 'desc',
+        per_page: int = 20,
+        projection: str = 'card',
+        **filters
+    ):
+        """Get one keyset page of products: {'items', 'next_cursor', 'prev_cursor'}.
+        
+        filters are those of get_products; unknown sort keys fall back to
+        created_at.
+        """
+        if order_by not in PRODUCT_SORT_KEYS:
+            order_by = 'created_at'
+        
+        try:
+            query = ProductService._filtered_products(projection, **filters)
+            return keyset_page(query, order_by, desc=order_dir != 'asc', cursor=cursor, limit=per_page)
+        
+        except Exception as e:
+            print(f"Error getting products: {e}")
+            return {'items': [], 'next_cursor': None, 'prev_cursor': None}
+    
+    @staticmethod
+    def get_product_by_id(product_id: str, projection: str = 'full'):
         """Get product by ID"""
         try:
             supabase = get_supabase_client()
-            response = supabase.table('products').select(
-                '*, category:categories(*), brand:brands(*), variants:product_variants(*), images:product_images(*)'
+            response = select_projection(
+                supabase.table(projection_table(projection)), projection
             ).eq('id', product_id).single().execute()
             
             return response.data if response.data else None
@@ -124,12 +214,12 @@ class ProductService:
             return None
     
     @staticmethod
-    def get_product_by_slug(slug: str):
-        """Get product by slug"""
+    def get_product_by_slug(slug: str, projection: str = 'detail'):
+        """Get product by slug (images and variants are loaded separately)"""
         try:
             supabase = get_supabase_client()
-            response = supabase.table('products').select(
-                '*, category:categories(*), brand:brands(*), variants:product_variants(*), images:product_images(*)'
+            response = select_projection(
+                supabase.table(projection_table(projection)), projection
             ).eq('slug', slug).eq('status', 'publicado').single().execute()
             
             return response.data if response.data else None
@@ -137,27 +227,116 @@ class ProductService:
             print(f"Error getting product: {e}")
             return None
     
+    @staticmethod
+    def get_product_page(slug: str, related_limit: int = 4):
+        """Everything the product detail page renders, from one RPC (cached).
+        
+        Returns {'product', 'images', 'variants', 'related', 'version', 'etag'}
+        or None (see 16_product_page.sql). version is the last update of
+        anything the page renders (17_http_cache_versions.sql); etag is derived
+        from it and the related ids, whose list can shrink without an update.
+        Variant stock moves with every sale, so it is not cached: the page
+        reads it live with get_product_stock.
+        """
+        def load():
+            supabase = get_supabase_client()
+            page = read_rpc(supabase, 'product_page', {
+                'p_slug': slug,
+                'p_related_limit': related_limit
+            }).execute().data
+            if not page:
+                return None
+            
+            for variant in page['variants']:
+                variant.pop('stock', None)
+            
+            for image in page['images']:
+                path = image.pop('storage_path', None)
+                if not image.get('url') and path:
+                    image['url'] = get_public_url(path)
+            
+            related_ids = ','.join(item['id'] for item in page['related'])
+            page['etag'] = hashlib.sha1(f"{page['product']['id']}:{page['version']}:{related_ids}".encode()).hexdigest()
+            return page
+        
+        try:
+            return get_cache().get_or_set(f'products:page:{slug}:{related_limit}', load, skip_empty=True)
+        except Exception as e:
+            print(f"Error getting product page: {e}")
+            return None
+    
+    @staticmethod
+    def get_product_stock(product_id: str):
+        """Live stock of a product's active variants: {variant_id: stock}, or None on error"""
+        try:
+            supabase = get_supabase_client()
+            response = supabase.table('product_variants').select(
+                'id, stock'
+            ).eq('product_id', product_id).eq('is_active', True).execute()
+            
+            return {row['id']: row['stock'] or 0 for row in response.data or []}
+        except Exception as e:
+            print(f"Error getting product stock: {e}")
+            return None
+    
+    @staticmethod
+    def get_catalog_version(category_id: str = None, brand_id: str = None):
+        """Version of the product listings in scope (cached briefly).
+        
+        Returns {'version', 'products', 'etag'} or None (see
+        18_catalog_versions.sql); the validators of listing pages. Orders
+        drop it, since selling out changes what listings render.
+        """
+        def load():
+            supabase = get_supabase_client()
+            version = read_rpc(supabase, 'catalog_version', {
+                'p_category_id': category_id,
+                'p_brand_id': brand_id
+            }).execute().data
+            if not version:
+                return None
+            
+            version['etag'] = hashlib.sha1(
+                f"{category_id}:{brand_id}:{version['version']}:{version['products']}".encode()
+            ).hexdigest()
+            return version
+        
+        try:
+            return get_cache().get_or_set(f'catalog_version:{category_id}:{brand_id}', load, skip_empty=True)
+        except Exception as e:
+            print(f"Error getting catalog version: {e}")
+            return None
+    
     @staticmethod
     def get_featured_products(limit: int = 8):
-        """Get featured products"""
-        return ProductService.get_products(
+        """Get featured products (cached briefly)"""
+        # get_products returns [] on upstream errors, so empty results are not cached
+        return get_cache().get_or_set(f'products:featured:{limit}', lambda: ProductService.get_products(
             is_featured=True,
             status='publicado',
             limit=limit
-        )
+        ), skip_empty=True)
     
     @staticmethod
     def get_related_products(product_id: str, limit: int = 4):
-        """Get related products"""
+        """Get related products (card rows from product_listing)"""
         try:
             supabase = get_supabase_client()
             response = supabase.table('related_products').select(
-                'related_product:products!related_product_id(*, images:product_images(*))'
+                'related_product_id'
             ).eq('product_id', product_id).limit(limit).execute()
             
-            if response.data:
-                return [item['related_product'] for item in response.data if item.get('related_product')]
-            return []
+            related_ids = [row['related_product_id'] for row in response.data or []]
+            if not related_ids:
+                return []
+            
+            response = select_projection(
+                supabase.table('product_listing'), 'card'
+            ).in_('id', related_ids).eq('status', 'publicado').execute()
+            
+            # Keep the order of related_products
+            products = {product['id']: product for product in response.data or []}
+            return [products[related_id] for related_id in related_ids if related_id in products]
         except Exception as e:
             print(f"Error getting related products: {e}")
             return []
@@ -206,8 +385,8 @@ class ProductService:
     
     @staticmethod
     def get_categories(parent_id: str = None, is_active: bool = True):
-        """Get categories"""
-        try:
+        """Get categories (cached)"""
+        def load():
             supabase = get_supabase_client()
             query = supabase.table('categories').select('*')
             
@@ -224,6 +403,8 @@ class ProductService:
             response = query.execute()
             return response.data if response.data else []
         
+        try:
+            return get_cache().get_or_set(f'categories:{parent_id}:{is_active}', load)
         except Exception as e:
             print(f"Error getting categories: {e}")
             return []
@@ -241,8 +422,8 @@ class ProductService:
     
     @staticmethod
     def get_brands(is_active: bool = True):
-        """Get brands"""
-        try:
+        """Get brands (cached)"""
+        def load():
             supabase = get_supabase_client()
             query = supabase.table('brands').select('*')
             
@@ -254,65 +435,105 @@ class ProductService:
             response = query.execute()
             return response.data if response.data else []
         
+        try:
+            return get_cache().get_or_set(f'brands:{is_active}', load)
         except Exception as e:
             print(f"Error getting brands: {e}")
             return []
     
     @staticmethod
-    def search_products(query: str, limit: int = 20):
-        """Search products by name or SKU"""
-        try:
+    def _normalize_search(query: str) -> str:
+        """Collapse whitespace and bound the length of a search string"""
+        return ' '.join((query or '').split())[:100]
+    
+    @staticmethod
+    def _contains_pattern(text: str) -> str:
+        """ILIKE pattern matching text literally anywhere in the column.
+        
+        PostgREST also reads '*' as '%', so it is narrowed to one character.
+        """
+        escaped = text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+        return f"%{escaped.replace('*', '_')}%"
+    
+    @staticmethod
+    def search_products(query: str, limit: int = 20, offset: int = 0):
+        """Ranked search over published products (see 08_search.sql).
+        
+        Returns product_listing rows (the 'card' columns), best match first,
+        each with a 'rank'.
+        """
+        query = ProductService._normalize_search(query)
+        if not query:
+            return []
+        
+        def load():
             supabase = get_supabase_client()
-            response = supabase.table('products').select(
-                '*, category:categories(*), brand:brands(*), images:product_images(*)'
-            ).or_(
-                f'name.ilike.%{query}%,sku.ilike.%{query}%'
-            ).eq('status', 'publicado').limit(limit).execute()
-            
-            return response.data if response.data else []
+            response = read_rpc(supabase, 'search_products', {
+                'p_query': query,
+                'p_limit': limit,
+                'p_offset': offset
+            }).execute()
+            return response.data or []
         
+        try:
+            return get_cache().get_or_set(f'search:{query.lower()}:{limit}:{offset}', load)
         except Exception as e:
             print(f"Error searching products: {e}")
             return []
-
-
-
-class ProductService:
-    # ... tus métodos existentes ...
-
+    
+    @staticmethod
+    def suggest_products(query: str, limit: int = 8):
+        """Autocomplete suggestions: [{'name', 'slug', 'price'}]"""
+        query = ProductService._normalize_search(query)
+        if len(query) < 2:
+            return []
+        
+        def load():
+            supabase = get_supabase_client()
+            response = read_rpc(supabase, 'search_suggestions', {'p_query': query, 'p_limit': limit}).execute()
+            return response.data or []
+        
+        try:
+            return get_cache().get_or_set(f'search:suggest:{query.lower()}:{limit}', load)
+        except Exception as e:
+            print(f"Error getting suggestions: {e}")
+            return []
+    
     @staticmethod
     def get_product_images(product_id: str):
+        """Get product images with public URLs, primary first"""
         supabase = get_supabase_client()
         resp = (
             supabase.table('product_images')
-            .select('id, storage_path, alt_text, is_primary, display_order')
+            .select('id, storage_path, url, alt_text, is_primary, display_order')
             .eq('product_id', product_id)
             .order('is_primary', desc=True)
-            .order('display_order', asc=True)
+            .order('display_order')
             .execute()
         )
         rows = resp.data or []
         out = []
         for r in rows:
+            # url is stored at upload time; older rows fall back to the bucket prefix
             path = r.get('storage_path')
             out.append({
                 'id': r.get('id'),
-                'url': get_public_url(path) if path else None,
+                'url': r.get('url') or (get_public_url(path) if path else None),
                 'alt_text': r.get('alt_text'),
                 'is_primary': r.get('is_primary'),
                 'display_order': r.get('display_order'),
             })
         return out
-
+    
     @staticmethod
     def get_product_variants(product_id: str):
+        """Get product variants in creation order"""
         supabase = get_supabase_client()
         resp = (
             supabase.table('product_variants')
             .select('id, name, attributes, price_adjustment, stock, is_active')
             .eq('product_id', product_id)
-            .order('created_at', asc=True)
+            .order('created_at')
             .execute()
         )
         return resp.data or []
-
@@ -0,0 +1,129 @@
+"""
+Reports Service - sales aggregates and streaming exports
+"""
+import csv
+import io
+import os
+import tempfile
+from datetime import date, datetime, time, timedelta
+from zoneinfo import ZoneInfo
+from app.services.supabase import get_supabase_admin_client, read_rpc
+from app.services.pagination import iter_keyset, keyset_page
+from typing import Dict, Iterator, Tuple
+
+# Day boundaries and daily/weekly/monthly buckets are computed in the store's timezone
+REPORT_TIMEZONE = os.getenv('REPORT_TIMEZONE', 'America/Guatemala')
+REPORT_BUCKETS = ('day', 'week', 'month')
+
+# Columns of the detail view and of the exports, with their headers
+SALES_COLUMNS = [
+    ('order_number', 'Pedido'),
+    ('created_at', 'Fecha'),
+    ('customer_name', 'Cliente'),
+    ('customer_email', 'Email'),
+    ('payment_method', 'Método de pago'),
+    ('subtotal', 'Subtotal'),
+    ('shipping_amount', 'Envío'),
+    ('discount_amount', 'Descuento'),
+    ('total', 'Total'),
+]
+SALES_SELECT = 'id, ' + ', '.join(column for column, _ in SALES_COLUMNS)
+MONEY_COLUMNS = {'subtotal', 'shipping_amount', 'discount_amount', 'total'}
+
+EXPORT_BATCH_SIZE = 1000
+EXPORT_CHUNK_SIZE = 64 * 1024
+
+
+def report_bounds(start_date: str, end_date: str) -> Tuple[str, str]:
+    """[start, end) ISO timestamps covering both dates whole, in REPORT_TIMEZONE"""
+    tz = ZoneInfo(REPORT_TIMEZONE)
+    start = datetime.combine(date.fromisoformat(start_date), time.min, tz)
+    end = datetime.combine(date.fromisoformat(end_date) + timedelta(days=1), time.min, tz)
+    return start.isoformat(), end.isoformat()
+
+
+class ReportService:
+    """Sales report (see 10_sales_report.sql)"""
+    
+    @staticmethod
+    def get_sales_summary(start_date: str, end_date: str, bucket: str = 'day', top: int = 10):
+        """Totals, average order, per-bucket rows and top products for paid orders"""
+        try:
+            start, end = report_bounds(start_date, end_date)
+            supabase = get_supabase_admin_client()
+            response = read_rpc(supabase, 'sales_report', {
+                'p_start': start,
+                'p_end': end,
+                'p_bucket': bucket if bucket in REPORT_BUCKETS else 'day',
+                'p_tz': REPORT_TIMEZONE,
+                'p_top': top
+            }).execute()
+            return response.data or {}
+        except Exception as e:
+            print(f"Error getting sales summary: {e}")
+            return {}
+    
+    @staticmethod
+    def _paid_orders(start_date: str, end_date: str):
+        start, end = report_bounds(start_date, end_date)
+        supabase = get_supabase_admin_client()
+        return supabase.table('orders').select(SALES_SELECT).eq('status', 'pagado').gte('created_at', start).lt('created_at', end)
+    
+    @staticmethod
+    def get_sales_page(start_date: str, end_date: str, cursor: str = None, per_page: int = 50):
+        """One keyset page of the paid orders in range, newest first"""
+        try:
+            query = ReportService._paid_orders(start_date, end_date)
+            return keyset_page(query, 'created_at', desc=True, cursor=cursor, limit=per_page)
+        except Exception as e:
+            print(f"Error getting sales page: {e}")
+            return {'items': [], 'next_cursor': None, 'prev_cursor': None}
+    
+    @staticmethod
+    def iter_sales(start_date: str, end_date: str, batch_size: int = EXPORT_BATCH_SIZE) -> Iterator[Dict]:
+        """Every paid order in range, oldest first, fetched batch by batch"""
+        return iter_keyset(
+            lambda: ReportService._paid_orders(start_date, end_date),
+            'created_at', desc=False, batch_size=batch_size
+        )
+    
+    @staticmethod
+    def export_csv(rows) -> Iterator[str]:
+        """Stream rows as CSV text (UTF-8 BOM so Excel detects the encoding)"""
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow([header for _, header in SALES_COLUMNS])
+        yield '\ufeff' + buffer.getvalue()
+        
+        for row in rows:
+            buffer.seek(0)
+            buffer.truncate()
+            writer.writerow([row.get(column) for column, _ in SALES_COLUMNS])
+            yield buffer.getvalue()
+    
+    @staticmethod
+    def export_xlsx(rows) -> Iterator[bytes]:
+        """Stream rows as an .xlsx workbook.
+        
+        openpyxl's write-only mode flushes each row to a temporary file, so
+        memory stays flat; the finished zip is then sent in chunks.
+        """
+        from openpyxl import Workbook
+        
+        workbook = Workbook(write_only=True)
+        sheet = workbook.create_sheet('Ventas')
+        sheet.append([header for _, header in SALES_COLUMNS])
+        for row in rows:
+            sheet.append([
+                float(row[column]) if column in MONEY_COLUMNS and row.get(column) is not None else row.get(column)
+                for column, _ in SALES_COLUMNS
+            ])
+        
+        with tempfile.TemporaryFile() as f:
+            workbook.save(f)
+            f.seek(0)
+            while True:
+                chunk = f.read(EXPORT_CHUNK_SIZE)
+                if not chunk:
+                    break
+                yield chunk
@@ -1,9 +1,8 @@
 """
 Storage Service for Supabase Storage
 """
-from app.services.supabase import get_supabase_admin_client
+from app.services.supabase import get_supabase_admin_client, get_public_url
 from werkzeug.utils import secure_filename
-from PIL import Image
 import io
 import os
 import uuid
@@ -24,6 +23,9 @@ class StorageService:
     @staticmethod
     def optimize_image(file_data: bytes, max_width: int = 1200, quality: int = 85) -> bytes:
         """Optimize image size and quality"""
+        # Pillow is only needed by the upload routes: keep it out of worker boot
+        from PIL import Image
+        
         try:
             image = Image.open(io.BytesIO(file_data))
             
@@ -78,7 +80,7 @@ class StorageService:
             )
             
             # Get public URL
-            public_url = supabase.storage.from_('products').get_public_url(filename)
+            public_url = get_public_url(filename, 'products')
             
             return {
                 'success': True,
@@ -129,7 +131,7 @@ class StorageService:
                 {'content-type': f'image/{ext}'}
             )
             
-            public_url = supabase.storage.from_('banners').get_public_url(filename)
+            public_url = get_public_url(filename, 'banners')
             
             return {
                 'success': True,
@@ -155,6 +157,8 @@ class StorageService:
             
             # Optimize and resize to square
             try:
+                from PIL import Image
+                
                 image = Image.open(io.BytesIO(file_data))
                 
                 # Convert to RGB
@@ -199,7 +203,7 @@ class StorageService:
                 {'content-type': 'image/jpeg'}
             )
             
-            public_url = supabase.storage.from_('avatars').get_public_url(filename)
+            public_url = get_public_url(filename, 'avatars')
             
             return {
                 'success': True,
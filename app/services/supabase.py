@@ -2,54 +2,239 @@
 Supabase Client Service
 """
 import os
-from supabase import create_client, Client
-from typing import Optional
+import random
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from urllib.parse import quote
+import httpx
+from typing import TYPE_CHECKING, Dict, Iterator, Optional
 
-_supabase_client: Optional[Client] = None
-_supabase_admin_client: Optional[Client] = None
+if TYPE_CHECKING:
+    from supabase import Client
 
+# HTTP settings shared by both Supabase clients (one httpx pool per client)
+SUPABASE_HTTP2 = os.getenv('SUPABASE_HTTP2', 'True').lower() == 'true'
+SUPABASE_HTTP_MAX_CONNECTIONS = int(os.getenv('SUPABASE_HTTP_MAX_CONNECTIONS', 20))
+SUPABASE_HTTP_MAX_KEEPALIVE = int(os.getenv('SUPABASE_HTTP_MAX_KEEPALIVE', 10))
+SUPABASE_HTTP_KEEPALIVE_EXPIRY = float(os.getenv('SUPABASE_HTTP_KEEPALIVE_EXPIRY', 30))
+SUPABASE_HTTP_CONNECT_TIMEOUT = float(os.getenv('SUPABASE_HTTP_CONNECT_TIMEOUT', 3))
+SUPABASE_HTTP_READ_TIMEOUT = float(os.getenv('SUPABASE_HTTP_READ_TIMEOUT', 10))
+SUPABASE_HTTP_WRITE_TIMEOUT = float(os.getenv('SUPABASE_HTTP_WRITE_TIMEOUT', 30))
+SUPABASE_HTTP_POOL_TIMEOUT = float(os.getenv('SUPABASE_HTTP_POOL_TIMEOUT', 5))
+SUPABASE_HTTP_RETRIES = int(os.getenv('SUPABASE_HTTP_RETRIES', 2))
+SUPABASE_HTTP_BACKOFF = float(os.getenv('SUPABASE_HTTP_BACKOFF', 0.1))
 
-def get_supabase_client() -> Client:
+# Public storage URLs are derived from SUPABASE_URL; resized variants come
+# from Supabase image transformations (a paid add-on, so off by default)
+SUPABASE_IMAGE_TRANSFORMS = os.getenv('SUPABASE_IMAGE_TRANSFORMS', 'False').lower() == 'true'
+IMAGE_SRCSET_WIDTHS = (320, 640, 960, 1200)
+STORAGE_OBJECT_PATH = '/storage/v1/object/public/'
+STORAGE_RENDER_PATH = '/storage/v1/render/image/public/'
+
+_public_url_bases: Dict[str, str] = {}
+
+_supabase_client: Optional['Client'] = None
+_supabase_admin_client: Optional['Client'] = None
+_clients_pid = os.getpid()
+# gthread workers (WEB_THREADS > 1) share the clients between request threads:
+# only the first request builds them
+_clients_lock = threading.Lock()
+
+
+class RetryTransport(httpx.HTTPTransport):
+    """HTTP transport that retries idempotent requests with jittered backoff.
+    
+    Only GET/HEAD/OPTIONS are retried: PostgREST reads and the read-only RPCs
+    called through read_rpc. Writes and other RPCs go out once.
+    """
+    
+    RETRY_METHODS = {'GET', 'HEAD', 'OPTIONS'}
+    RETRY_STATUSES = {502, 503, 504}
+    RETRY_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.ReadError,
+                    httpx.ReadTimeout, httpx.RemoteProtocolError)
+    
+    def __init__(self, retries: int = 2, backoff: float = 0.1, max_backoff: float = 2.0, **kwargs):
+        super().__init__(**kwargs)
+        self.max_retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+    
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        if request.method not in self.RETRY_METHODS:
+            return super().handle_request(request)
+        
+        attempt = 0
+        while True:
+            try:
+                response = super().handle_request(request)
+            except self.RETRY_ERRORS:
+                if attempt >= self.max_retries:
+                    raise
+            else:
+                if response.status_code not in self.RETRY_STATUSES or attempt >= self.max_retries:
+                    return response
+                response.close()
+            
+            # Full jitter: sleep a random slice of the exponential window
+            time.sleep(random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt)))
+            attempt += 1
+
+
+def read_rpc(client: 'Client', name: str, params: Dict):
+    """Call a read-only (STABLE) function as GET, so RetryTransport retries it.
+    
+    Arguments travel in the query string, which cannot carry NULL: None
+    params are left out and the function's defaults apply.
+    """
+    return client.rpc(name, {key: value for key, value in params.items() if value is not None}, get=True)
+
+
+def create_http_client() -> httpx.Client:
+    """httpx client with the configured pool limits, timeouts and retries"""
+    http2 = SUPABASE_HTTP2
+    if http2:
+        try:
+            import h2  # noqa: F401
+        except ImportError:
+            http2 = False
+    
+    transport = RetryTransport(
+        retries=SUPABASE_HTTP_RETRIES,
+        backoff=SUPABASE_HTTP_BACKOFF,
+        http2=http2,
+        limits=httpx.Limits(
+            max_connections=SUPABASE_HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=SUPABASE_HTTP_MAX_KEEPALIVE,
+            keepalive_expiry=SUPABASE_HTTP_KEEPALIVE_EXPIRY
+        )
+    )
+    
+    return httpx.Client(
+        transport=transport,
+        follow_redirects=True,
+        timeout=httpx.Timeout(
+            connect=SUPABASE_HTTP_CONNECT_TIMEOUT,
+            read=SUPABASE_HTTP_READ_TIMEOUT,
+            write=SUPABASE_HTTP_WRITE_TIMEOUT,
+            pool=SUPABASE_HTTP_POOL_TIMEOUT
+        )
+    )
+
+
+def create_supabase_client(url: str, key: str) -> 'Client':
+    """Supabase client backed by its own pooled httpx client.
+    
+    Each Supabase client needs a separate httpx client: PostgREST writes
+    its base URL and auth headers onto the one it is given.
+    """
+    # The SDK (auth, storage, realtime, functions) is the costliest import of
+    # the app: CLI commands that only talk to Postgres never load it, and
+    # gunicorn.conf.py imports it in the master before forking
+    from supabase import create_client, ClientOptions
+    
+    return create_client(url, key, options=ClientOptions(httpx_client=create_http_client()))
+
+
+def reset_supabase_clients():
+    """Forget the cached clients so the next call builds fresh ones.
+    
+    Called after fork: sockets inherited from the master must not be
+    shared between workers, so they are dropped without being closed.
+    """
+    global _supabase_client, _supabase_admin_client, _clients_pid
+    
+    _supabase_client = None
+    _supabase_admin_client = None
+    _clients_pid = os.getpid()
+
+
+def get_supabase_client() -> 'Client':
     """Get Supabase client with anon key (for public operations)"""
     global _supabase_client
     
+    if _clients_pid != os.getpid():
+        reset_supabase_clients()
+    
     if _supabase_client is None:
-        url = os.getenv('SUPABASE_URL')
-        key = os.getenv('SUPABASE_ANON_KEY')
-        
-        if not url or not key:
-            raise ValueError("SUPABASE_URL and SUPABASE_ANON_KEY must be set")
-        
-        _supabase_client = create_client(url, key)
+        with _clients_lock:
+            if _supabase_client is None:
+                url = os.getenv('SUPABASE_URL')
+                key = os.getenv('SUPABASE_ANON_KEY')
+                
+                if not url or not key:
+                    raise ValueError("SUPABASE_URL and SUPABASE_ANON_KEY must be set")
+                
+                _supabase_client = create_supabase_client(url, key)
     
     return _supabase_client
 
 
-def get_supabase_admin_client() -> Client:
+def get_supabase_admin_client() -> 'Client':
     """Get Supabase client with service role key (for admin operations)"""
     global _supabase_admin_client
     
+    if _clients_pid != os.getpid():
+        reset_supabase_clients()
+    
     if _supabase_admin_client is None:
-        url = os.getenv('SUPABASE_URL')
-        key = os.getenv('SUPABASE_SERVICE_ROLE_KEY')
-        
-        if not url or not key:
-            raise ValueError("SUPABASE_URL and SUPABASE_SERVICE_ROLE_KEY must be set")
-        
-        _supabase_admin_client = create_client(url, key)
+        with _clients_lock:
+            if _supabase_admin_client is None:
+                url = os.getenv('SUPABASE_URL')
+                key = os.getenv('SUPABASE_SERVICE_ROLE_KEY')
+                
+                if not url or not key:
+                    raise ValueError("SUPABASE_URL and SUPABASE_SERVICE_ROLE_KEY must be set")
+                
+                _supabase_admin_client = create_supabase_client(url, key)
     
     return _supabase_admin_client
 
-def get_public_url(path: str) -> str:
-    """Devuelve la URL pública de un archivo del bucket 'products'."""
-    client = get_supabase_client()
-    return client.storage.from_("products").get_public_url(path)
+
+def public_url_base(bucket: str = 'products') -> str:
+    """Public URL prefix of a storage bucket (built once per bucket)"""
+    base = _public_url_bases.get(bucket)
+    if base is None:
+        url = os.getenv('SUPABASE_URL')
+        if not url:
+            raise ValueError("SUPABASE_URL must be set")
+        base = _public_url_bases[bucket] = f"{url.rstrip('/')}/storage/v1/object/public/{bucket}/"
+    return base
 
 
+def get_public_url(path: str, bucket: str = 'products') -> str:
+    """Public URL of a storage object (built without a client call)"""
+    return public_url_base(bucket) + quote(path.lstrip('/'))
 
-def get_db_connection():
-    """Get direct database connection using psycopg2"""
-    import psycopg2
+
+def image_srcset(url: str, widths=IMAGE_SRCSET_WIDTHS, quality: int = 75) -> str:
+    """srcset of resized variants of a public storage image.
+    
+    Empty when image transformations are off or the URL is not a public
+    storage object, so templates fall back to the plain src.
+    """
+    if not url or not SUPABASE_IMAGE_TRANSFORMS or STORAGE_OBJECT_PATH not in url:
+        return ''
+    render_url = url.split('?', 1)[0].replace(STORAGE_OBJECT_PATH, STORAGE_RENDER_PATH, 1)
+    return ', '.join(f'{render_url}?width={width}&quality={quality} {width}w' for width in widths)
+
+
+# Direct Postgres pool, one per worker process (size it to the worker's threads)
+DB_POOL_MIN = int(os.getenv('DB_POOL_MIN', 1))
+DB_POOL_MAX = int(os.getenv('DB_POOL_MAX', 5))
+DB_POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', 10))
+DB_POOL_MAX_LIFETIME = int(os.getenv('DB_POOL_MAX_LIFETIME', 1800))
+DB_POOL_PING_AFTER = int(os.getenv('DB_POOL_PING_AFTER', 30))
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv('DB_STATEMENT_TIMEOUT_MS', 15000))
+
+_db_pool: Optional['ConnectionPool'] = None
+_db_pool_lock = threading.Lock()
+
+
+def _db_connect_params() -> dict:
+    """psycopg2.connect() keyword arguments parsed from DATABASE_URL"""
     from urllib.parse import urlparse
     
     database_url = os.getenv('DATABASE_URL')
@@ -59,41 +244,215 @@ def get_db_connection():
     # Parse the database URL
     result = urlparse(database_url)
     
-    conn = psycopg2.connect(
-        database=result.path[1:],
-        user=result.username,
-        password=result.password,
-        host=result.hostname,
-        port=result.port
-    )
+    return {
+        'database': result.path[1:],
+        'user': result.username,
+        'password': result.password,
+        'host': result.hostname,
+        'port': result.port
+    }
+
+
+def get_db_connection():
+    """Get a dedicated database connection, without the pool's statement timeout.
+    
+    For migrations, seeds and benchmarks that run long multi-statement
+    scripts; everything else uses execute_query / iter_query, which borrow
+    from the pool.
+    """
+    import psycopg2
+    
+    conn = psycopg2.connect(**_db_connect_params())
     
     return conn
 
 
-class SupabaseService:
-    """Base service class for Supabase operations"""
+class PoolTimeout(Exception):
+    """No pooled connection became free within DB_POOL_TIMEOUT"""
+
+
+class ConnectionPool:
+    """Thread-safe psycopg2 pool with checkout health checks and recycling"""
     
-    def __init__(self, use_admin=False):
-        self.client = get_supabase_admin_client() if use_admin else get_supabase_client()
+    def __init__(self, connect, minconn: int = 1, maxconn: int = 5, timeout: float = 10,
+                 max_lifetime: int = 1800, ping_after: int = 30):
+        self._connect = connect
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self.max_lifetime = max_lifetime
+        self.ping_after = ping_after
+        self._idle = deque()
+        self._born: Dict[int, float] = {}
+        self._slots = threading.BoundedSemaphore(maxconn)
+        self._lock = threading.Lock()
+        self.pid = os.getpid()
+        
+        for _ in range(minconn):
+            self._idle.append((self._open(), time.monotonic()))
     
-    def execute_query(self, query: str, params: tuple = None):
-        """Execute raw SQL query"""
-        conn = get_db_connection()
-        cursor = conn.cursor()
+    def _open(self):
+        conn = self._connect()
+        self._born[id(conn)] = time.monotonic()
+        return conn
+    
+    def _discard(self, conn):
+        self._born.pop(id(conn), None)
+        try:
+            conn.close()
+        except Exception:
+            pass
+    
+    def _healthy(self, conn, idle_since: float) -> bool:
+        now = time.monotonic()
+        if conn.closed or now - self._born.get(id(conn), now) > self.max_lifetime:
+            return False
+        if now - idle_since < self.ping_after:
+            return True
         
         try:
-            if params:
-                cursor.execute(query, params)
-            else:
-                cursor.execute(query)
+            with conn.cursor() as cursor:
+                cursor.execute('SELECT 1')
+            conn.rollback()
+            return True
+        except Exception:
+            return False
+    
+    def getconn(self):
+        """Borrow a connection, waiting up to timeout for a free slot"""
+        if not self._slots.acquire(timeout=self.timeout):
+            raise PoolTimeout(f"No database connection available after {self.timeout}s")
+        
+        try:
+            while True:
+                with self._lock:
+                    entry = self._idle.pop() if self._idle else None
+                if entry is None:
+                    return self._open()
+                conn, idle_since = entry
+                if self._healthy(conn, idle_since):
+                    return conn
+                self._discard(conn)
+        except Exception:
+            self._slots.release()
+            raise
+    
+    def putconn(self, conn, discard: bool = False):
+        """Return a borrowed connection; broken or aborted ones are closed"""
+        try:
+            if not discard and not conn.closed:
+                try:
+                    conn.rollback()
+                except Exception:
+                    discard = True
             
-            if query.strip().upper().startswith('SELECT'):
-                result = cursor.fetchall()
-                columns = [desc[0] for desc in cursor.description]
-                return [dict(zip(columns, row)) for row in result]
+            if discard or conn.closed:
+                self._discard(conn)
             else:
-                conn.commit()
-                return cursor.rowcount
+                with self._lock:
+                    self._idle.append((conn, time.monotonic()))
         finally:
-            cursor.close()
-            conn.close()
+            self._slots.release()
+    
+    def closeall(self):
+        with self._lock:
+            while self._idle:
+                self._discard(self._idle.pop()[0])
+
+
+def get_db_pool() -> ConnectionPool:
+    """Get the process-wide pool (rebuilt in a forked worker)"""
+    global _db_pool
+    
+    with _db_pool_lock:
+        if _db_pool is None or _db_pool.pid != os.getpid():
+            import psycopg2
+            
+            params = _db_connect_params()
+            options = f'-c statement_timeout={DB_STATEMENT_TIMEOUT_MS}'
+            
+            # A pool inherited through fork() shares its sockets with the parent,
+            # so a forked worker builds its own and leaves the inherited one alone
+            _db_pool = ConnectionPool(
+                lambda: psycopg2.connect(options=options, **params),
+                minconn=DB_POOL_MIN,
+                maxconn=DB_POOL_MAX,
+                timeout=DB_POOL_TIMEOUT,
+                max_lifetime=DB_POOL_MAX_LIFETIME,
+                ping_after=DB_POOL_PING_AFTER
+            )
+        
+        return _db_pool
+
+
+def close_db_pool():
+    """Close idle pooled connections (shutdown, tests)"""
+    global _db_pool
+    
+    if _db_pool is not None:
+        _db_pool.closeall()
+        _db_pool = None
+
+
+@contextmanager
+def db_connection():
+    """Borrow a pooled connection; commits on success, rolls back on error"""
+    pool = get_db_pool()
+    conn = pool.getconn()
+    
+    try:
+        yield conn
+        conn.commit()
+    finally:
+        # putconn rolls back whatever was not committed
+        pool.putconn(conn)
+
+
+def execute_query(query: str, params=None, bulk: Optional[str] = None, page_size: int = 500):
+    """Run a statement on a pooled connection (committed on success).
+    
+    SELECTs return their rows as dicts, anything else the row count. For
+    bulk writes params is a list of rows and bulk picks how they are sent:
+    'values' expands the single VALUES %s of the statement into one multi-row
+    INSERT per page (execute_values), 'batch' runs the statement once per row
+    in pages (execute_batch). Bulk calls return the number of rows sent.
+    """
+    from psycopg2.extras import execute_batch, execute_values
+    
+    if bulk not in (None, 'values', 'batch'):
+        raise ValueError(f"Unknown bulk mode: {bulk}")
+    
+    with db_connection() as conn:
+        with conn.cursor() as cursor:
+            if bulk == 'values':
+                execute_values(cursor, query, params, page_size=page_size)
+                return len(params)
+            if bulk == 'batch':
+                execute_batch(cursor, query, params, page_size=page_size)
+                return len(params)
+            
+            cursor.execute(query, params)
+            
+            if cursor.description is not None:
+                columns = [desc[0] for desc in cursor.description]
+                return [dict(zip(columns, row)) for row in cursor.fetchall()]
+            return cursor.rowcount
+
+
+def iter_query(query: str, params=None, itersize: int = 2000) -> Iterator[Dict]:
+    """Stream a large SELECT through a server-side cursor, itersize rows per fetch"""
+    with db_connection() as conn:
+        with conn.cursor(name=f'iter_{uuid.uuid4().hex}') as cursor:
+            cursor.itersize = itersize
+            cursor.execute(query, params)
+            columns = None
+            for row in cursor:
+                if columns is None:
+                    columns = [desc[0] for desc in cursor.description]
+                yield dict(zip(columns, row))
+
+
+class SupabaseService:
+    """Base service class for Supabase operations"""
+    
+    def __init__(self, use_admin=False):
+        self.client = get_supabase_admin_client() if use_admin else get_supabase_client()
@@ -64,20 +64,23 @@ const cart = {
   updateCount() {
     fetch('/carrito/contador')
       .then(res => res.json())
-      .then(data => {
-        const countElements = document.querySelectorAll('[data-cart-count]');
-        countElements.forEach(el => {
-          el.textContent = data.count;
-          if (data.count > 0) {
-            el.classList.remove('hidden');
-          } else {
-            el.classList.add('hidden');
-          }
-        });
-      })
+      .then(data => cart.setCount(data.count))
       .catch(err => console.error('Error updating cart count:', err));
   },
   
+  // Render a count already known (e.g. returned by /carrito/agregar)
+  setCount(count) {
+    const countElements = document.querySelectorAll('[data-cart-count]');
+    countElements.forEach(el => {
+      el.textContent = count;
+      if (count > 0) {
+        el.classList.remove('hidden');
+      } else {
+        el.classList.add('hidden');
+      }
+    });
+  },
+  
   // Add to cart
   add(productId, variantId = null, quantity = 1) {
     const formData = new FormData();
@@ -96,7 +99,7 @@ const cart = {
     .then(data => {
       if (data.success) {
         utils.showToast('Producto agregado al carrito', 'success');
-        cart.updateCount();
+        cart.setCount(data.cart_count);
       } else {
         utils.showToast(data.error || 'Error al agregar al carrito', 'error');
       }
@@ -193,13 +196,26 @@ function initSearch() {
       return;
     }
     
-    fetch(`/buscar?q=${encodeURIComponent(query)}`)
-      .then(res => res.text())
-      .then(html => {
-        if (searchResults) {
-          searchResults.innerHTML = html;
-          searchResults.classList.remove('hidden');
-        }
+    fetch(`/buscar/sugerencias?q=${encodeURIComponent(query)}`)
+      .then(res => res.json())
+      .then(data => {
+        if (!searchResults) return;
+        
+        searchResults.replaceChildren(...data.results.map(item => {
+          const link = document.createElement('a');
+          link.href = item.url;
+          link.className = 'flex justify-between px-4 py-2 hover:bg-gray-50';
+          
+          const name = document.createElement('span');
+          name.textContent = item.name;
+          const price = document.createElement('span');
+          price.className = 'text-gray-500';
+          price.textContent = utils.formatCurrency(item.price);
+          
+          link.append(name, price);
+          return link;
+        }));
+        searchResults.classList.toggle('hidden', data.results.length === 0);
       })
       .catch(err => console.error('Search error:', err));
   }, 300);
@@ -0,0 +1,3 @@
+"""
+Benchmarks (run against the configured Supabase project, not part of pytest)
+"""
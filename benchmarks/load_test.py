@@ -0,0 +1,196 @@
+"""
+Load test: sync workers vs threaded (gthread) workers
+
+Usage: python -m benchmarks.load_test [--latency 50] [--clients 32] [--duration 10]
+
+Runs gunicorn twice against a local PostgREST stand-in that answers every
+request after --latency ms, so the app is bound by upstream waits the way it
+is against Supabase:
+
+  sync      --workers 2                (the default Procfile)
+  threaded  --workers 2 --threads 8    (WEB_THREADS=8)
+
+and reports throughput and latency of /catalogo/ under --clients concurrent
+clients. Needs no Supabase project or database.
+"""
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+import httpx
+
+MODES = {
+    'sync': ['--workers', '2'],
+    'threaded': ['--workers', '2', '--threads', '8'],
+}
+PATH = '/catalogo/'
+
+CARD = {
+    'name': 'Producto de prueba', 'base_price': 100, 'sale_price': None, 'price_min': 100, 'price_max': 100,
+    'stock': 5, 'is_featured': False, 'category_id': None, 'category_slug': None, 'category_name': None,
+    'brand_slug': None, 'brand_name': None, 'image_url': None, 'image_alt': None,
+    'created_at': '2026-01-01T00:00:00+00:00', 'refreshed_at': '2026-01-01T00:00:00+00:00'
+}
+RPC_RESPONSES = {
+    'catalog_version': {'version': '2026-01-01T00:00:00+00:00', 'products': 21},
+}
+
+
+def create_bench_app():
+    """gunicorn entry point: the app with rate limits off (one client IP sends everything)"""
+    from app import create_app, limiter
+    
+    app = create_app()
+    limiter.enabled = False
+    return app
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    """Answers PostgREST reads and RPCs with canned JSON after the configured latency"""
+    
+    latency = 0.05
+    
+    def _respond(self):
+        time.sleep(self.latency)
+        length = int(self.headers.get('Content-Length') or 0)
+        if length:
+            self.rfile.read(length)
+        
+        path = urlparse(self.path).path
+        if path.startswith('/rest/v1/rpc/'):
+            body = RPC_RESPONSES.get(path.rsplit('/', 1)[-1])
+        elif path == '/rest/v1/product_listing':
+            body = [dict(CARD, id=f'00000000-0000-0000-0000-{n:012d}', slug=f'producto-{n}') for n in range(21)]
+        else:
+            body = []
+        
+        payload = json.dumps(body).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+    
+    do_GET = do_POST = do_PATCH = _respond
+    
+    def log_message(self, format, *args):
+        pass
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_stand_in(latency_ms: int) -> ThreadingHTTPServer:
+    StandInHandler.latency = latency_ms / 1000
+    server = ThreadingHTTPServer(('127.0.0.1', free_port()), StandInHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def start_app(mode: str, upstream: str) -> tuple:
+    port = free_port()
+    env = dict(
+        os.environ,
+        SUPABASE_URL=upstream,
+        SUPABASE_ANON_KEY='header.payload.signature',
+        SUPABASE_SERVICE_ROLE_KEY='header.payload.signature',
+        SUPABASE_HTTP2='False',
+        SUPABASE_HTTP_RETRIES='0',
+        CACHE_STORAGE_URL='',
+        WEB_THREADS='1',
+    )
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', 'benchmarks.load_test:create_bench_app()',
+         '--bind', f'127.0.0.1:{port}', '--timeout', '120', *MODES[mode]],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    
+    url = f'http://127.0.0.1:{port}'
+    for _ in range(100):
+        try:
+            httpx.get(f'{url}/health', timeout=1)
+            return process, url
+        except httpx.HTTPError:
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError(f'gunicorn ({mode}) did not start')
+
+
+def load(url: str, clients: int, duration: float) -> dict:
+    """clients threads request PATH back to back for duration seconds"""
+    latencies, errors = [], []
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+    
+    def client():
+        with httpx.Client(base_url=url, timeout=30) as http:
+            while time.perf_counter() < deadline:
+                start = time.perf_counter()
+                try:
+                    ok = http.get(PATH).status_code == 200
+                except httpx.HTTPError:
+                    ok = False
+                elapsed = (time.perf_counter() - start) * 1000
+                with lock:
+                    (latencies if ok else errors).append(elapsed)
+    
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    
+    latencies.sort()
+    return {
+        'requests': len(latencies),
+        'errors': len(errors),
+        'rps': len(latencies) / duration,
+        'p50': statistics.median(latencies) if latencies else 0,
+        'p95': latencies[int(len(latencies) * 0.95)] if latencies else 0,
+    }
+
+
+def run(latency: int, clients: int, duration: float):
+    stand_in = start_stand_in(latency)
+    upstream = f'http://127.0.0.1:{stand_in.server_address[1]}'
+    
+    print(f'{PATH} with {clients} clients for {duration:.0f}s, upstream latency {latency} ms\n')
+    print(f"{'mode':<10} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'errors':>7}")
+    
+    try:
+        for mode in MODES:
+            process, url = start_app(mode, upstream)
+            try:
+                load(url, clients, 1)  # warm-up: clients, caches, imports
+                result = load(url, clients, duration)
+            finally:
+                process.terminate()
+                process.wait()
+            print(f"{mode:<10} {result['rps']:>8.1f} {result['p50']:>8.1f} {result['p95']:>8.1f} {result['errors']:>7}")
+    finally:
+        stand_in.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--latency', type=int, default=50, help='upstream latency per request (ms)')
+    parser.add_argument('--clients', type=int, default=32)
+    parser.add_argument('--duration', type=float, default=10)
+    args = parser.parse_args()
+    run(args.latency, args.clients, args.duration)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+"""
+Payload size per projection profile
+
+Usage: python -m benchmarks.payload_size [--limit 20]
+
+Fetches the same rows with every profile in PROJECTIONS and prints the
+JSON size (raw and gzipped) next to the old select-everything query.
+"""
+import argparse
+import gzip
+import json
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from app.services.products import PROJECTIONS, projection_table, select_projection  # noqa: E402
+from app.services.supabase import get_supabase_admin_client  # noqa: E402
+
+# What each source table used to select before the profiles existed
+# (product_listing replaced the products query with every embed)
+BASELINES = {
+    'products': ('products', PROJECTIONS['full']),
+    'product_listing': ('products', PROJECTIONS['full']),
+    'cart_items': ('cart_items', '*, product:products(*, images:product_images(*)), variant:product_variants(*)'),
+}
+
+
+def measure(rows):
+    raw = json.dumps(rows, default=str).encode()
+    return len(raw), len(gzip.compress(raw))
+
+
+def run(limit: int):
+    supabase = get_supabase_admin_client()
+    results = []
+    
+    for profile in PROJECTIONS:
+        table = projection_table(profile)
+        baseline_table, baseline_select = BASELINES[table]
+        rows = select_projection(supabase.table(table), profile).limit(limit).execute().data or []
+        full_rows = supabase.table(baseline_table).select(baseline_select).limit(limit).execute().data or []
+        
+        raw, gz = measure(rows)
+        full_raw, _ = measure(full_rows)
+        results.append((profile, len(rows), raw, gz, full_raw / raw if raw else 0))
+    
+    print(f"{'profile':<10} {'rows':>5} {'bytes':>10} {'gzip':>9} {'per row':>9} {'x smaller':>10}")
+    for profile, count, raw, gz, ratio in results:
+        per_row = raw // count if count else 0
+        print(f'{profile:<10} {count:>5} {raw:>10} {gz:>9} {per_row:>9} {ratio:>10.1f}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--limit', type=int, default=20, help='Rows fetched per profile')
+    run(parser.parse_args().limit)
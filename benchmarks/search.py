@@ -0,0 +1,102 @@
+"""
+Search latency over a synthetic catalog
+
+Usage: python -m benchmarks.search [--products 100000] [--runs 20]
+
+Needs DATABASE_URL pointing at a database with the migrations applied
+(use a development database). The synthetic catalog is inserted in a
+transaction that is rolled back at the end, so nothing is left behind.
+Compares the old ILIKE filter with the search_products() RPC.
+"""
+import argparse
+import statistics
+import time
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from app.services.supabase import get_db_connection  # noqa: E402
+
+# Typical storefront queries: exact words, prefixes, typos, accents, SKUs
+QUERIES = ['laptop', 'lenov', 'camara', 'cámaras', 'mause', 'audifonos inalambricos', 'BENCH-004', 'monitr 27']
+
+WORDS = [
+    'Laptop', 'Mouse', 'Teclado', 'Monitor', 'Cámara', 'Audífonos', 'Impresora', 'Router',
+    'Tablet', 'Parlante', 'Cargador', 'Disco', 'Memoria', 'Celular', 'Inalámbrico', 'Gamer'
+]
+BRANDS = ['Lenovo', 'HP', 'Dell', 'Logitech', 'Samsung', 'Xiaomi', 'Canon', 'Epson']
+
+OLD_QUERY = """
+    SELECT id, name FROM products
+    WHERE (name ILIKE %(like)s OR sku ILIKE %(like)s) AND status = 'publicado'
+    LIMIT 20
+"""
+NEW_QUERY = "SELECT search_products(%(q)s, 20, 0)"
+
+
+def seed(cursor, products: int):
+    """Insert the synthetic catalog (search vectors are built by the trigger)"""
+    cursor.execute("INSERT INTO categories (name, slug) VALUES ('Benchmark', 'benchmark') RETURNING id")
+    category_id = cursor.fetchone()[0]
+    
+    cursor.execute(
+        "INSERT INTO brands (name, slug) SELECT b, 'bench-' || lower(b) FROM unnest(%s::text[]) AS b RETURNING id",
+        (BRANDS,)
+    )
+    brand_ids = [row[0] for row in cursor.fetchall()]
+    
+    # Names combine two words and a number: "Mouse Gamer 1234"
+    cursor.execute("""
+        INSERT INTO products (sku, name, slug, short_description, category_id, brand_id, base_price, status)
+        SELECT
+            'BENCH-' || lpad(n::text, 6, '0'),
+            w[1 + n %% cardinality(w)] || ' ' || w[1 + (n / 7) %% cardinality(w)] || ' ' || n,
+            'bench-' || n,
+            'Producto de prueba ' || w[1 + (n / 3) %% cardinality(w)],
+            %(category_id)s,
+            b[1 + n %% cardinality(b)],
+            10 + n %% 5000,
+            'publicado'
+        FROM generate_series(1, %(products)s) AS n,
+             (SELECT %(words)s::text[] AS w, %(brand_ids)s::uuid[] AS b) AS pools
+    """, {'category_id': category_id, 'brand_ids': brand_ids, 'products': products, 'words': WORDS})
+    cursor.execute('ANALYZE products')
+
+
+def time_query(cursor, sql: str, params: dict, runs: int):
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        cursor.execute(sql, params)
+        rows = cursor.fetchall()
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings), max(timings), rows
+
+
+def run(products: int, runs: int):
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    
+    try:
+        start = time.perf_counter()
+        seed(cursor, products)
+        print(f'Seeded {products} products in {time.perf_counter() - start:.1f}s\n')
+        
+        print(f"{'query':<24} {'ilike p50':>10} {'rpc p50':>10} {'rpc max':>10} {'ilike hits':>11} {'rpc hits':>9}")
+        for query in QUERIES:
+            old_p50, _, old_rows = time_query(cursor, OLD_QUERY, {'like': f'%{query}%'}, runs)
+            new_p50, new_max, new_rows = time_query(cursor, NEW_QUERY, {'q': query}, runs)
+            hits = len(new_rows[0][0]) if new_rows and new_rows[0][0] else 0
+            print(f'{query:<24} {old_p50:>9.1f}ms {new_p50:>9.1f}ms {new_max:>9.1f}ms {len(old_rows):>11} {hits:>9}')
+    finally:
+        conn.rollback()
+        cursor.close()
+        conn.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--products', type=int, default=100000, help='Synthetic products to insert')
+    parser.add_argument('--runs', type=int, default=20, help='Executions per query')
+    args = parser.parse_args()
+    run(args.products, args.runs)
@@ -0,0 +1,52 @@
+"""
+Gunicorn production boot profile
+
+    gunicorn -c gunicorn.conf.py "app:create_app()"
+
+The app is imported once in the master (preload_app) and the templates and
+reference-data caches are warmed there, so workers spawned after a restart
+or an autoscaling event fork ready to serve instead of paying imports,
+template compilation and cache misses on their first requests. Connections
+are never shared across fork(): each worker builds its own Supabase clients
+in post_fork.
+"""
+import os
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+workers = int(os.getenv('WEB_CONCURRENCY', 2))
+# More than one thread switches the sync worker to gthread (see README)
+threads = int(os.getenv('WEB_THREADS', 1))
+timeout = 120
+
+preload_app = os.getenv('GUNICORN_PRELOAD', 'True').lower() == 'true'
+# Warm-up needs the app in the master; without preload it happens lazily per worker
+WARM_CACHES = os.getenv('WARM_CACHES', 'True').lower() == 'true'
+
+
+def when_ready(server):
+    """Master: warm templates and caches once, before the first fork"""
+    if not preload_app:
+        return
+    
+    # The Supabase SDK is imported lazily by the first client; importing it
+    # here lets every worker inherit it instead of paying it after the fork
+    import supabase  # noqa: F401
+    
+    if not WARM_CACHES:
+        return
+    
+    from app import warm_caches
+    warm_caches(server.app.wsgi())
+    server.log.info("Templates and reference-data caches warmed")
+
+
+def post_fork(server, worker):
+    """Worker: drop the clients inherited from the master and build its own"""
+    from app.services.supabase import reset_supabase_clients, get_supabase_client, get_supabase_admin_client
+    
+    reset_supabase_clients()
+    try:
+        get_supabase_client()
+        get_supabase_admin_client()
+    except Exception as e:
+        server.log.warning(f"Supabase clients not prebuilt: {e}")
@@ -3,14 +3,11 @@ Management CLI for the application
 """
 import click
 import os
-from app import create_app
-from app.services.supabase import get_supabase_admin_client, get_db_connection
+from app.services.supabase import get_supabase_admin_client, get_db_connection, execute_query
 from dotenv import load_dotenv
 
 load_dotenv()
 
-app = create_app()
-
 
 @click.group()
 def cli():
@@ -34,7 +31,23 @@ def provision():
             '00_schema.sql',
             '01_rls.sql',
             '02_seed.sql',
-            '03_storage.sql'
+            '03_storage.sql',
+            '04_cart_totals.sql',
+            '05_create_order.sql',
+            '06_stock_reservations.sql',
+            '07_keyset_indexes.sql',
+            '08_search.sql',
+            '09_dashboard_stats.sql',
+            '10_sales_report.sql',
+            '11_merge_guest_cart.sql',
+            '12_add_to_cart.sql',
+            '13_guest_cart.sql',
+            '14_abandoned_carts.sql',
+            '15_product_listing.sql',
+            '16_product_page.sql',
+            '17_http_cache_versions.sql',
+            '18_catalog_versions.sql',
+            '19_keyset_not_null.sql'
         ]
         
         for migration_file in migration_files:
@@ -143,10 +156,65 @@ def test_connection():
         raise
 
 
+@cli.command()
+def reconcile_carts():
+    """Repair drifted carts.item_count / carts.subtotal counters"""
+    click.echo('Reconciling cart counters...')
+    
+    try:
+        repaired = execute_query('SELECT reconcile_cart_totals() AS repaired')[0]['repaired']
+        click.echo(f'✓ {repaired} cart(s) repaired')
+    
+    except Exception as e:
+        click.echo(f'✗ Error reconciling carts: {str(e)}', err=True)
+        raise
+
+
+@cli.command()
+@click.option('--batch-size', default=1000, help='Holds deleted per round trip')
+def release_reservations(batch_size):
+    """Release expired checkout stock reservations (run on a schedule)"""
+    click.echo('Releasing expired stock reservations...')
+    
+    try:
+        from app.services.inventory import InventoryService
+        
+        released = InventoryService.release_expired(batch_size)
+        click.echo(f'✓ {released} reservation(s) released')
+    
+    except Exception as e:
+        click.echo(f'✗ Error releasing reservations: {str(e)}', err=True)
+        raise
+
+
+@cli.command()
+@click.option('--days', type=click.IntRange(min=1), default=None, help='Idle days before a guest cart is deleted (default GUEST_CART_RETENTION_DAYS)')
+@click.option('--batch-size', default=1000, help='Carts deleted per round trip')
+def purge_carts(days, batch_size):
+    """Delete abandoned guest carts (run on a schedule)"""
+    click.echo('Purging abandoned guest carts...')
+    
+    try:
+        from app.services.cart import CartService, GUEST_CART_RETENTION_DAYS
+        
+        purged = CartService.purge_abandoned(
+            GUEST_CART_RETENTION_DAYS if days is None else days, batch_size
+        )
+        click.echo(f'✓ {purged} cart(s) purged')
+    
+    except Exception as e:
+        click.echo(f'✗ Error purging carts: {str(e)}', err=True)
+        raise
+
+
 @cli.command()
 def run():
     """Run the Flask development server"""
-    app.run(debug=True, host='0.0.0.0', port=5000)
+    # Only this command needs the app (blueprints, templates, Pillow): the
+    # database commands start without building it
+    from app import create_app
+    
+    create_app().run(debug=True, host='0.0.0.0', port=5000)
 
 
 if __name__ == '__main__':
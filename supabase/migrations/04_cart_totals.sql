@@ -0,0 +1,75 @@
+-- =====================================================
+-- Cart header counters (item_count + subtotal)
+-- =====================================================
+
+-- Denormalized totals so header counters read a single carts row
+ALTER TABLE carts
+    ADD COLUMN IF NOT EXISTS item_count INTEGER NOT NULL DEFAULT 0,
+    ADD COLUMN IF NOT EXISTS subtotal DECIMAL(10, 2) NOT NULL DEFAULT 0;
+
+-- =====================================================
+-- TRIGGERS
+-- =====================================================
+
+-- Apply each cart_items change as a delta; "col = col + delta" re-reads the
+-- carts row under its lock, so concurrent writes to the same cart don't
+-- overwrite each other.
+CREATE OR REPLACE FUNCTION apply_cart_item_delta()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        UPDATE carts SET
+            item_count = item_count - OLD.quantity,
+            subtotal = subtotal - OLD.price * OLD.quantity
+        WHERE id = OLD.cart_id;
+    END IF;
+
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        UPDATE carts SET
+            item_count = item_count + NEW.quantity,
+            subtotal = subtotal + NEW.price * NEW.quantity
+        WHERE id = NEW.cart_id;
+    END IF;
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS maintain_cart_totals ON cart_items;
+CREATE TRIGGER maintain_cart_totals
+    AFTER INSERT OR DELETE OR UPDATE OF cart_id, quantity, price ON cart_items
+    FOR EACH ROW EXECUTE FUNCTION apply_cart_item_delta();
+
+-- =====================================================
+-- RECONCILIATION
+-- =====================================================
+
+-- Recompute counters from cart_items; returns the number of carts repaired
+CREATE OR REPLACE FUNCTION reconcile_cart_totals()
+RETURNS INTEGER AS $$
+DECLARE
+    repaired INTEGER;
+BEGIN
+    WITH actual AS (
+        SELECT
+            c.id,
+            COALESCE(SUM(ci.quantity), 0) AS item_count,
+            COALESCE(SUM(ci.price * ci.quantity), 0) AS subtotal
+        FROM carts c
+        LEFT JOIN cart_items ci ON ci.cart_id = c.id
+        GROUP BY c.id
+    )
+    UPDATE carts c SET
+        item_count = actual.item_count,
+        subtotal = actual.subtotal
+    FROM actual
+    WHERE c.id = actual.id
+      AND (c.item_count <> actual.item_count OR c.subtotal <> actual.subtotal);
+
+    GET DIAGNOSTICS repaired = ROW_COUNT;
+    RETURN repaired;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Backfill existing carts
+SELECT reconcile_cart_totals();
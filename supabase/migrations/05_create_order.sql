@@ -0,0 +1,106 @@
+-- =====================================================
+-- Transactional order creation (called via client.rpc)
+-- =====================================================
+
+-- Creates the order, its items, stock decrements, inventory movements and
+-- the pending payment, then empties the cart, all in one transaction.
+-- p_order carries the orders columns, p_items one object per cart line:
+--   {product_id, variant_id, sku, product_name, variant_name, quantity, unit_price, tax_rate}
+CREATE OR REPLACE FUNCTION create_order(p_order JSONB, p_items JSONB, p_cart_id UUID DEFAULT NULL)
+RETURNS JSONB AS $$
+DECLARE
+    v_order orders;
+BEGIN
+    IF p_items IS NULL OR jsonb_array_length(p_items) = 0 THEN
+        RAISE EXCEPTION 'Cart is empty';
+    END IF;
+
+    INSERT INTO orders (
+        order_number, user_id, status,
+        customer_email, customer_name, customer_phone,
+        shipping_address_line1, shipping_address_line2, shipping_city, shipping_state,
+        shipping_municipality, shipping_postal_code, shipping_country,
+        subtotal, tax_amount, shipping_amount, discount_amount, total,
+        shipping_method, shipping_notes, payment_method, payment_status,
+        coupon_code, customer_notes
+    ) VALUES (
+        p_order->>'order_number',
+        (p_order->>'user_id')::UUID,
+        COALESCE(p_order->>'status', 'nuevo')::order_status,
+        p_order->>'customer_email',
+        p_order->>'customer_name',
+        p_order->>'customer_phone',
+        p_order->>'shipping_address_line1',
+        p_order->>'shipping_address_line2',
+        p_order->>'shipping_city',
+        p_order->>'shipping_state',
+        p_order->>'shipping_municipality',
+        p_order->>'shipping_postal_code',
+        COALESCE(p_order->>'shipping_country', 'GT'),
+        (p_order->>'subtotal')::DECIMAL,
+        COALESCE((p_order->>'tax_amount')::DECIMAL, 0),
+        COALESCE((p_order->>'shipping_amount')::DECIMAL, 0),
+        COALESCE((p_order->>'discount_amount')::DECIMAL, 0),
+        (p_order->>'total')::DECIMAL,
+        p_order->>'shipping_method',
+        p_order->>'shipping_notes',
+        p_order->>'payment_method',
+        COALESCE(p_order->>'payment_status', 'pending'),
+        p_order->>'coupon_code',
+        p_order->>'customer_notes'
+    )
+    RETURNING * INTO v_order;
+
+    INSERT INTO order_items (
+        order_id, product_id, variant_id, sku, product_name, variant_name,
+        quantity, unit_price, tax_rate, subtotal
+    )
+    SELECT
+        v_order.id, i.product_id, i.variant_id, i.sku, i.product_name, i.variant_name,
+        i.quantity, i.unit_price, COALESCE(i.tax_rate, 0), i.unit_price * i.quantity
+    FROM jsonb_to_recordset(p_items) AS i(
+        product_id UUID, variant_id UUID, sku TEXT, product_name TEXT, variant_name TEXT,
+        quantity INTEGER, unit_price DECIMAL, tax_rate DECIMAL
+    );
+
+    -- Lock the variant rows, decrement and log the movement from the locked values
+    WITH wanted AS (
+        SELECT i.variant_id, SUM(i.quantity) AS quantity
+        FROM jsonb_to_recordset(p_items) AS i(variant_id UUID, quantity INTEGER)
+        WHERE i.variant_id IS NOT NULL
+        GROUP BY i.variant_id
+    ),
+    locked AS (
+        SELECT v.id, v.product_id, v.stock AS previous_stock, w.quantity
+        FROM product_variants v
+        JOIN wanted w ON w.variant_id = v.id
+        FOR UPDATE OF v
+    ),
+    updated AS (
+        UPDATE product_variants v
+        SET stock = GREATEST(locked.previous_stock - locked.quantity, 0)
+        FROM locked
+        WHERE v.id = locked.id
+        RETURNING v.id, v.product_id, locked.previous_stock, v.stock AS new_stock, locked.quantity
+    )
+    INSERT INTO inventory_movements (
+        product_id, variant_id, movement_type, quantity,
+        previous_stock, new_stock, reference_type, reference_id
+    )
+    SELECT product_id, id, 'sale', -quantity, previous_stock, new_stock, 'order', v_order.id
+    FROM updated;
+
+    INSERT INTO payments (order_id, payment_method, amount, currency, status)
+    VALUES (v_order.id, COALESCE(v_order.payment_method, 'sandbox'), v_order.total, 'GTQ', 'pending');
+
+    IF p_cart_id IS NOT NULL THEN
+        DELETE FROM cart_items WHERE cart_id = p_cart_id;
+    END IF;
+
+    RETURN to_jsonb(v_order);
+END;
+$$ LANGUAGE plpgsql;
+
+-- Only the service role (server side) may create orders through PostgREST
+REVOKE EXECUTE ON FUNCTION create_order(JSONB, JSONB, UUID) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION create_order(JSONB, JSONB, UUID) TO service_role;
@@ -0,0 +1,224 @@
+-- =====================================================
+-- Stock reservations (checkout holds) and race-free decrements
+-- =====================================================
+
+-- A hold on variant stock taken when a cart reaches checkout review.
+-- Available stock = stock - SUM(unexpired holds of other carts); every
+-- check runs with the variant row locked, so concurrent checkouts
+-- serialize per variant and cannot oversell.
+CREATE TABLE IF NOT EXISTS stock_reservations (
+    id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
+    cart_id UUID NOT NULL REFERENCES carts(id) ON DELETE CASCADE,
+    variant_id UUID NOT NULL REFERENCES product_variants(id) ON DELETE CASCADE,
+    quantity INTEGER NOT NULL CHECK (quantity > 0),
+    expires_at TIMESTAMP WITH TIME ZONE NOT NULL,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    UNIQUE(cart_id, variant_id)
+);
+
+CREATE INDEX IF NOT EXISTS idx_stock_reservations_variant ON stock_reservations(variant_id, expires_at);
+CREATE INDEX IF NOT EXISTS idx_stock_reservations_expires_at ON stock_reservations(expires_at);
+
+ALTER TABLE stock_reservations ENABLE ROW LEVEL SECURITY;
+
+-- =====================================================
+-- FUNCTIONS
+-- =====================================================
+
+-- Units of a variant held by other carts (caller must hold the variant row lock)
+CREATE OR REPLACE FUNCTION reserved_stock(p_variant_id UUID, p_exclude_cart_id UUID DEFAULT NULL)
+RETURNS INTEGER AS $$
+    SELECT COALESCE(SUM(quantity), 0)::INTEGER
+    FROM stock_reservations
+    WHERE variant_id = p_variant_id
+      AND expires_at > NOW()
+      AND cart_id IS DISTINCT FROM p_exclude_cart_id;
+$$ LANGUAGE sql STABLE;
+
+-- Replace the cart's holds with holds for p_items ([{variant_id, quantity}]).
+-- Returns {"success": true, "expires_at": ...} or, when a variant is short,
+-- {"success": false, "variant_id": ..., "available": n} with no holds changed.
+CREATE OR REPLACE FUNCTION reserve_stock(p_cart_id UUID, p_items JSONB, p_ttl_seconds INTEGER DEFAULT 900)
+RETURNS JSONB AS $$
+DECLARE
+    v_expires_at TIMESTAMP WITH TIME ZONE := NOW() + make_interval(secs => p_ttl_seconds);
+    v_line RECORD;
+    v_stock INTEGER;
+    v_available INTEGER;
+    v_detail TEXT;
+BEGIN
+    BEGIN
+        DELETE FROM stock_reservations WHERE cart_id = p_cart_id;
+
+        -- Lock variants in id order so concurrent reservations can't deadlock
+        FOR v_line IN
+            SELECT i.variant_id, SUM(i.quantity)::INTEGER AS quantity
+            FROM jsonb_to_recordset(p_items) AS i(variant_id UUID, quantity INTEGER)
+            WHERE i.variant_id IS NOT NULL
+            GROUP BY i.variant_id
+            ORDER BY i.variant_id
+        LOOP
+            SELECT stock INTO v_stock FROM product_variants WHERE id = v_line.variant_id FOR UPDATE;
+            v_available := COALESCE(v_stock, 0) - reserved_stock(v_line.variant_id, p_cart_id);
+
+            IF v_available < v_line.quantity THEN
+                RAISE EXCEPTION 'insufficient_stock'
+                    USING DETAIL = json_build_object('variant_id', v_line.variant_id, 'available', GREATEST(v_available, 0))::TEXT;
+            END IF;
+
+            INSERT INTO stock_reservations (cart_id, variant_id, quantity, expires_at)
+            VALUES (p_cart_id, v_line.variant_id, v_line.quantity, v_expires_at);
+        END LOOP;
+    EXCEPTION WHEN raise_exception THEN
+        -- The block's savepoint has undone the partial holds
+        IF SQLERRM <> 'insufficient_stock' THEN
+            RAISE;
+        END IF;
+        GET STACKED DIAGNOSTICS v_detail = PG_EXCEPTION_DETAIL;
+        RETURN jsonb_build_object('success', false) || v_detail::JSONB;
+    END;
+
+    RETURN jsonb_build_object('success', true, 'expires_at', v_expires_at);
+END;
+$$ LANGUAGE plpgsql;
+
+-- Release a cart's holds (cart emptied or abandoned at checkout)
+CREATE OR REPLACE FUNCTION release_stock(p_cart_id UUID)
+RETURNS INTEGER AS $$
+DECLARE
+    released INTEGER;
+BEGIN
+    DELETE FROM stock_reservations WHERE cart_id = p_cart_id;
+    GET DIAGNOSTICS released = ROW_COUNT;
+    RETURN released;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Sweeper: delete expired holds in batches; returns how many were released
+CREATE OR REPLACE FUNCTION release_expired_reservations(p_batch_size INTEGER DEFAULT 1000)
+RETURNS INTEGER AS $$
+DECLARE
+    released INTEGER;
+BEGIN
+    DELETE FROM stock_reservations
+    WHERE id IN (
+        SELECT id FROM stock_reservations
+        WHERE expires_at <= NOW()
+        ORDER BY expires_at
+        LIMIT p_batch_size
+        FOR UPDATE SKIP LOCKED
+    );
+    GET DIAGNOSTICS released = ROW_COUNT;
+    RETURN released;
+END;
+$$ LANGUAGE plpgsql;
+
+-- create_order now decrements stock conditionally: with the variant row
+-- locked, stock - (holds of other carts) must cover the quantity, otherwise
+-- the whole order is rolled back with 'insufficient_stock'. The cart's own
+-- holds are consumed by the order.
+CREATE OR REPLACE FUNCTION create_order(p_order JSONB, p_items JSONB, p_cart_id UUID DEFAULT NULL)
+RETURNS JSONB AS $$
+DECLARE
+    v_order orders;
+    v_line RECORD;
+    v_previous INTEGER;
+BEGIN
+    IF p_items IS NULL OR jsonb_array_length(p_items) = 0 THEN
+        RAISE EXCEPTION 'Cart is empty';
+    END IF;
+
+    INSERT INTO orders (
+        order_number, user_id, status,
+        customer_email, customer_name, customer_phone,
+        shipping_address_line1, shipping_address_line2, shipping_city, shipping_state,
+        shipping_municipality, shipping_postal_code, shipping_country,
+        subtotal, tax_amount, shipping_amount, discount_amount, total,
+        shipping_method, shipping_notes, payment_method, payment_status,
+        coupon_code, customer_notes
+    ) VALUES (
+        p_order->>'order_number',
+        (p_order->>'user_id')::UUID,
+        COALESCE(p_order->>'status', 'nuevo')::order_status,
+        p_order->>'customer_email',
+        p_order->>'customer_name',
+        p_order->>'customer_phone',
+        p_order->>'shipping_address_line1',
+        p_order->>'shipping_address_line2',
+        p_order->>'shipping_city',
+        p_order->>'shipping_state',
+        p_order->>'shipping_municipality',
+        p_order->>'shipping_postal_code',
+        COALESCE(p_order->>'shipping_country', 'GT'),
+        (p_order->>'subtotal')::DECIMAL,
+        COALESCE((p_order->>'tax_amount')::DECIMAL, 0),
+        COALESCE((p_order->>'shipping_amount')::DECIMAL, 0),
+        COALESCE((p_order->>'discount_amount')::DECIMAL, 0),
+        (p_order->>'total')::DECIMAL,
+        p_order->>'shipping_method',
+        p_order->>'shipping_notes',
+        p_order->>'payment_method',
+        COALESCE(p_order->>'payment_status', 'pending'),
+        p_order->>'coupon_code',
+        p_order->>'customer_notes'
+    )
+    RETURNING * INTO v_order;
+
+    INSERT INTO order_items (
+        order_id, product_id, variant_id, sku, product_name, variant_name,
+        quantity, unit_price, tax_rate, subtotal
+    )
+    SELECT
+        v_order.id, i.product_id, i.variant_id, i.sku, i.product_name, i.variant_name,
+        i.quantity, i.unit_price, COALESCE(i.tax_rate, 0), i.unit_price * i.quantity
+    FROM jsonb_to_recordset(p_items) AS i(
+        product_id UUID, variant_id UUID, sku TEXT, product_name TEXT, variant_name TEXT,
+        quantity INTEGER, unit_price DECIMAL, tax_rate DECIMAL
+    );
+
+    FOR v_line IN
+        SELECT i.variant_id, SUM(i.quantity)::INTEGER AS quantity
+        FROM jsonb_to_recordset(p_items) AS i(variant_id UUID, quantity INTEGER)
+        WHERE i.variant_id IS NOT NULL
+        GROUP BY i.variant_id
+        ORDER BY i.variant_id
+    LOOP
+        SELECT stock INTO v_previous FROM product_variants WHERE id = v_line.variant_id FOR UPDATE;
+
+        UPDATE product_variants
+        SET stock = stock - v_line.quantity
+        WHERE id = v_line.variant_id
+          AND stock - reserved_stock(v_line.variant_id, p_cart_id) >= v_line.quantity;
+
+        IF NOT FOUND THEN
+            RAISE EXCEPTION 'insufficient_stock'
+                USING DETAIL = json_build_object('variant_id', v_line.variant_id)::TEXT;
+        END IF;
+
+        INSERT INTO inventory_movements (
+            product_id, variant_id, movement_type, quantity,
+            previous_stock, new_stock, reference_type, reference_id
+        )
+        SELECT product_id, id, 'sale', -v_line.quantity, v_previous, stock, 'order', v_order.id
+        FROM product_variants WHERE id = v_line.variant_id;
+    END LOOP;
+
+    INSERT INTO payments (order_id, payment_method, amount, currency, status)
+    VALUES (v_order.id, COALESCE(v_order.payment_method, 'sandbox'), v_order.total, 'GTQ', 'pending');
+
+    IF p_cart_id IS NOT NULL THEN
+        DELETE FROM stock_reservations WHERE cart_id = p_cart_id;
+        DELETE FROM cart_items WHERE cart_id = p_cart_id;
+    END IF;
+
+    RETURN to_jsonb(v_order);
+END;
+$$ LANGUAGE plpgsql;
+
+-- Server-side only (service role)
+REVOKE EXECUTE ON FUNCTION reserve_stock(UUID, JSONB, INTEGER) FROM PUBLIC, anon, authenticated;
+REVOKE EXECUTE ON FUNCTION release_stock(UUID) FROM PUBLIC, anon, authenticated;
+REVOKE EXECUTE ON FUNCTION release_expired_reservations(INTEGER) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION reserve_stock(UUID, JSONB, INTEGER) TO service_role;
+GRANT EXECUTE ON FUNCTION release_stock(UUID) TO service_role;
+GRANT EXECUTE ON FUNCTION release_expired_reservations(INTEGER) TO service_role;
@@ -0,0 +1,28 @@
+-- =====================================================
+-- Composite indexes for keyset (cursor) pagination
+-- =====================================================
+
+-- Listings page with WHERE (key, id) < (last_key, last_id) ORDER BY key, id
+-- (see app/services/pagination.py). Each index matches one sort of
+-- PRODUCT_SORT_KEYS under the filters the storefront always applies;
+-- Postgres scans them backwards for the opposite direction.
+
+-- Catalog: published products, by date / price / name
+CREATE INDEX IF NOT EXISTS idx_products_status_created_id ON products(status, created_at, id);
+CREATE INDEX IF NOT EXISTS idx_products_status_price_id ON products(status, base_price, id);
+CREATE INDEX IF NOT EXISTS idx_products_status_name_id ON products(status, name, id);
+
+-- Category and brand pages (default sort)
+CREATE INDEX IF NOT EXISTS idx_products_category_status_created_id ON products(category_id, status, created_at, id);
+CREATE INDEX IF NOT EXISTS idx_products_brand_status_created_id ON products(brand_id, status, created_at, id);
+
+-- Admin product list (no status filter)
+CREATE INDEX IF NOT EXISTS idx_products_created_id ON products(created_at, id);
+
+-- Admin orders (all / by status) and customer order history
+CREATE INDEX IF NOT EXISTS idx_orders_created_id ON orders(created_at, id);
+CREATE INDEX IF NOT EXISTS idx_orders_status_created_id ON orders(status, created_at, id);
+CREATE INDEX IF NOT EXISTS idx_orders_user_created_id ON orders(user_id, created_at, id);
+
+-- Superseded by the composite indexes above
+DROP INDEX IF EXISTS idx_orders_created_at;
@@ -0,0 +1,199 @@
+-- =====================================================
+-- Product search: full text (Spanish, unaccented) + trigram typo tolerance
+-- =====================================================
+
+CREATE EXTENSION IF NOT EXISTS unaccent;
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+-- unaccent() is only STABLE (the dictionary could change); pinning the
+-- dictionary makes it usable in index expressions
+CREATE OR REPLACE FUNCTION immutable_unaccent(TEXT)
+RETURNS TEXT AS $$
+    SELECT public.unaccent('public.unaccent'::regdictionary, $1);
+$$ LANGUAGE sql IMMUTABLE PARALLEL SAFE STRICT;
+
+-- Spanish stemming over unaccented words ("cámara" and "camaras" match)
+DO $$
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM pg_ts_config WHERE cfgname = 'es_unaccent') THEN
+        CREATE TEXT SEARCH CONFIGURATION es_unaccent (COPY = spanish);
+        ALTER TEXT SEARCH CONFIGURATION es_unaccent
+            ALTER MAPPING FOR hword, hword_part, word WITH unaccent, spanish_stem;
+    END IF;
+END $$;
+
+-- =====================================================
+-- SEARCH DOCUMENT
+-- =====================================================
+
+-- Brand and category names live in other tables, so the document cannot
+-- be a GENERATED column; triggers keep it current instead.
+ALTER TABLE products ADD COLUMN IF NOT EXISTS search_vector TSVECTOR;
+
+CREATE OR REPLACE FUNCTION product_search_document(
+    p_name TEXT, p_sku TEXT, p_short_description TEXT, p_brand_id UUID, p_category_id UUID
+)
+RETURNS TSVECTOR AS $$
+    SELECT
+        setweight(to_tsvector('es_unaccent', COALESCE(p_name, '')), 'A') ||
+        setweight(to_tsvector('simple', COALESCE(p_sku, '')), 'A') ||
+        setweight(to_tsvector('es_unaccent', COALESCE((SELECT name FROM brands WHERE id = p_brand_id), '')), 'B') ||
+        setweight(to_tsvector('es_unaccent', COALESCE((SELECT name FROM categories WHERE id = p_category_id), '')), 'B') ||
+        setweight(to_tsvector('es_unaccent', COALESCE(p_short_description, '')), 'C');
+$$ LANGUAGE sql STABLE;
+
+CREATE OR REPLACE FUNCTION update_product_search_vector()
+RETURNS TRIGGER AS $$
+BEGIN
+    NEW.search_vector := product_search_document(
+        NEW.name, NEW.sku, NEW.short_description, NEW.brand_id, NEW.category_id
+    );
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS products_search_vector ON products;
+CREATE TRIGGER products_search_vector
+BEFORE INSERT OR UPDATE OF name, sku, short_description, brand_id, category_id ON products
+FOR EACH ROW EXECUTE FUNCTION update_product_search_vector();
+
+-- Renaming a brand or category re-indexes its products
+CREATE OR REPLACE FUNCTION refresh_related_search_vectors()
+RETURNS TRIGGER AS $$
+BEGIN
+    UPDATE products p
+    SET search_vector = product_search_document(p.name, p.sku, p.short_description, p.brand_id, p.category_id)
+    WHERE (TG_TABLE_NAME = 'brands' AND p.brand_id = NEW.id)
+       OR (TG_TABLE_NAME = 'categories' AND p.category_id = NEW.id);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS brands_search_vector ON brands;
+CREATE TRIGGER brands_search_vector
+AFTER UPDATE OF name ON brands
+FOR EACH ROW WHEN (OLD.name IS DISTINCT FROM NEW.name)
+EXECUTE FUNCTION refresh_related_search_vectors();
+
+DROP TRIGGER IF EXISTS categories_search_vector ON categories;
+CREATE TRIGGER categories_search_vector
+AFTER UPDATE OF name ON categories
+FOR EACH ROW WHEN (OLD.name IS DISTINCT FROM NEW.name)
+EXECUTE FUNCTION refresh_related_search_vectors();
+
+-- Backfill
+UPDATE products
+SET search_vector = product_search_document(name, sku, short_description, brand_id, category_id);
+
+-- =====================================================
+-- INDEXES
+-- =====================================================
+
+CREATE INDEX IF NOT EXISTS idx_products_search_vector ON products USING gin(search_vector);
+
+-- Typo tolerance on unaccented names and substring/prefix matches on SKUs
+CREATE INDEX IF NOT EXISTS idx_products_name_unaccent_trgm ON products USING gin(immutable_unaccent(lower(name)) gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_products_sku_trgm ON products USING gin(lower(sku) gin_trgm_ops);
+
+-- Superseded by the unaccented expression index
+DROP INDEX IF EXISTS idx_products_name_trgm;
+
+-- =====================================================
+-- QUERIES
+-- =====================================================
+
+-- Every word of the query as a prefix: 'lapt leno' -> 'lapt':* & 'leno':*
+-- STABLE, like to_tsquery itself: the result depends on the es_unaccent
+-- configuration, which can be altered (it is never used in an index)
+CREATE OR REPLACE FUNCTION search_prefix_query(p_query TEXT)
+RETURNS TSQUERY AS $$
+    SELECT to_tsquery('es_unaccent', string_agg(quote_literal(word) || ':*', ' & '))
+    FROM regexp_split_to_table(immutable_unaccent(lower(p_query)), '[^[:alnum:]]+') AS word
+    WHERE word <> '';
+$$ LANGUAGE sql STABLE;
+
+-- Published products matching p_query, best first, shaped like the 'card'
+-- projection (app/services/products.py) so templates need no second query.
+-- Candidates come from the full-text index, the trigram index (typos) and
+-- SKU substrings; rank = ts_rank_cd + word similarity + exact SKU bonus.
+CREATE OR REPLACE FUNCTION search_products(p_query TEXT, p_limit INTEGER DEFAULT 20, p_offset INTEGER DEFAULT 0)
+RETURNS JSONB AS $$
+    WITH q AS (
+        SELECT search_prefix_query(p_query) AS tsq,
+               immutable_unaccent(lower(trim(p_query))) AS term
+    ),
+    candidates AS (
+        SELECT p.id FROM products p, q WHERE p.search_vector @@ q.tsq
+        UNION
+        SELECT p.id FROM products p, q WHERE length(q.term) >= 2 AND q.term <% immutable_unaccent(lower(p.name))
+        UNION
+        SELECT p.id FROM products p, q
+        WHERE length(q.term) >= 3
+          AND lower(p.sku) LIKE '%' || replace(replace(replace(q.term, '\', '\\'), '%', '\%'), '_', '\_') || '%'
+    ),
+    ranked AS (
+        SELECT p.*,
+               COALESCE(ts_rank_cd(p.search_vector, q.tsq), 0) * 2
+               + word_similarity(q.term, immutable_unaccent(lower(p.name)))
+               + CASE WHEN lower(p.sku) = q.term THEN 1 ELSE 0 END AS rank
+        FROM candidates c
+        JOIN products p ON p.id = c.id
+        CROSS JOIN q
+        WHERE p.status = 'publicado'
+        ORDER BY rank DESC, p.id
+        LIMIT LEAST(p_limit, 100) OFFSET p_offset
+    )
+    SELECT COALESCE(jsonb_agg(jsonb_build_object(
+        'id', r.id,
+        'name', r.name,
+        'slug', r.slug,
+        'base_price', r.base_price,
+        'sale_price', r.sale_price,
+        'is_featured', r.is_featured,
+        'category_id', r.category_id,
+        'created_at', r.created_at,
+        'rank', r.rank,
+        'brand', (SELECT jsonb_build_object('name', b.name) FROM brands b WHERE b.id = r.brand_id),
+        'images', COALESCE((
+            SELECT jsonb_agg(jsonb_build_object('url', i.url, 'alt_text', i.alt_text))
+            FROM (
+                SELECT url, alt_text FROM product_images
+                WHERE product_id = r.id
+                ORDER BY is_primary DESC, display_order
+                LIMIT 1
+            ) i
+        ), '[]'::jsonb),
+        'variants', COALESCE((
+            SELECT jsonb_agg(jsonb_build_object('stock', v.stock))
+            FROM product_variants v WHERE v.product_id = r.id
+        ), '[]'::jsonb)
+    ) ORDER BY r.rank DESC, r.id), '[]'::jsonb)
+    FROM ranked r;
+$$ LANGUAGE sql STABLE
+SET pg_trgm.word_similarity_threshold = 0.4;
+
+-- Autocomplete: a few published names by prefix, then by similarity
+CREATE OR REPLACE FUNCTION search_suggestions(p_query TEXT, p_limit INTEGER DEFAULT 8)
+RETURNS JSONB AS $$
+    WITH q AS (
+        SELECT search_prefix_query(p_query) AS tsq,
+               immutable_unaccent(lower(trim(p_query))) AS term
+    ),
+    matches AS (
+        SELECT p.name, p.slug, COALESCE(p.sale_price, p.base_price) AS price,
+               ts_rank_cd(p.search_vector, q.tsq) * 2
+               + word_similarity(q.term, immutable_unaccent(lower(p.name))) AS rank
+        FROM products p, q
+        WHERE p.status = 'publicado'
+          AND (p.search_vector @@ q.tsq OR (length(q.term) >= 2 AND q.term <% immutable_unaccent(lower(p.name))))
+        ORDER BY rank DESC, p.name
+        LIMIT LEAST(p_limit, 20)
+    )
+    SELECT COALESCE(jsonb_agg(jsonb_build_object('name', name, 'slug', slug, 'price', price) ORDER BY rank DESC, name), '[]'::jsonb)
+    FROM matches;
+$$ LANGUAGE sql STABLE
+SET pg_trgm.word_similarity_threshold = 0.5;
+
+-- Public read-only RPCs (RLS on products still applies)
+GRANT EXECUTE ON FUNCTION search_products(TEXT, INTEGER, INTEGER) TO anon, authenticated, service_role;
+GRANT EXECUTE ON FUNCTION search_suggestions(TEXT, INTEGER) TO anon, authenticated, service_role;
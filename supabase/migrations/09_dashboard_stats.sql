@@ -0,0 +1,58 @@
+-- =====================================================
+-- Admin dashboard statistics in one round trip
+-- =====================================================
+
+-- Backs the "stock bajo" table: ORDER BY stock LIMIT n reads the lowest
+-- rows of the index instead of sorting every variant
+CREATE INDEX IF NOT EXISTS idx_product_variants_stock ON product_variants(stock);
+
+-- Counts per status and paid revenue come from a single pass over orders
+-- (an index-only scan of idx_orders_status_created_id for the counts);
+-- revenue is summed in SQL instead of downloading every paid total.
+CREATE OR REPLACE FUNCTION dashboard_stats(p_low_stock INTEGER DEFAULT 10, p_limit INTEGER DEFAULT 10)
+RETURNS JSONB AS $$
+    WITH by_status AS (
+        SELECT status, COUNT(*) AS orders, COALESCE(SUM(total), 0) AS amount
+        FROM orders
+        GROUP BY status
+    )
+    SELECT jsonb_build_object(
+        'total_products', (SELECT COUNT(*) FROM products),
+        'total_orders', (SELECT COALESCE(SUM(orders), 0) FROM by_status),
+        'total_revenue', (SELECT COALESCE(SUM(amount), 0) FROM by_status WHERE status = 'pagado'),
+        'orders_by_status', (
+            SELECT COALESCE(jsonb_object_agg(status, orders), '{}'::jsonb) FROM by_status
+        ),
+        'recent_orders', COALESCE((
+            SELECT jsonb_agg(to_jsonb(o) ORDER BY o.created_at DESC, o.id DESC)
+            FROM (
+                SELECT id, order_number, customer_name, total, status, created_at
+                FROM orders
+                ORDER BY created_at DESC, id DESC
+                LIMIT p_limit
+            ) o
+        ), '[]'::jsonb),
+        'low_stock', COALESCE((
+            SELECT jsonb_agg(jsonb_build_object(
+                'id', v.id,
+                'product_id', v.product_id,
+                'sku', v.sku,
+                'name', v.name,
+                'stock', v.stock,
+                'product', jsonb_build_object('name', p.name)
+            ) ORDER BY v.stock, v.id)
+            FROM (
+                SELECT id, product_id, sku, name, stock
+                FROM product_variants
+                WHERE stock <= p_low_stock
+                ORDER BY stock, id
+                LIMIT p_limit
+            ) v
+            JOIN products p ON p.id = v.product_id
+        ), '[]'::jsonb)
+    );
+$$ LANGUAGE sql STABLE;
+
+-- Store-wide figures: only the service role (admin client) may read them
+REVOKE EXECUTE ON FUNCTION dashboard_stats(INTEGER, INTEGER) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION dashboard_stats(INTEGER, INTEGER) TO service_role;
@@ -0,0 +1,80 @@
+-- =====================================================
+-- Sales report aggregated in SQL
+-- =====================================================
+
+-- Paid orders in a date range: the report range-scans this index and
+-- reads totals from it without touching the orders heap
+CREATE INDEX IF NOT EXISTS idx_orders_paid_created_id ON orders(created_at, id)
+    INCLUDE (total) WHERE status = 'pagado';
+
+-- Summary for paid orders with p_start <= created_at < p_end: totals,
+-- average order value, one row per day/week/month (in p_tz) and the best
+-- selling products. Only the aggregates cross the wire.
+CREATE OR REPLACE FUNCTION sales_report(
+    p_start TIMESTAMPTZ,
+    p_end TIMESTAMPTZ,
+    p_bucket TEXT DEFAULT 'day',
+    p_tz TEXT DEFAULT 'America/Guatemala',
+    p_top INTEGER DEFAULT 10
+)
+RETURNS JSONB AS $$
+DECLARE
+    v_summary JSONB;
+    v_buckets JSONB;
+    v_top JSONB;
+BEGIN
+    IF p_bucket NOT IN ('day', 'week', 'month') THEN
+        RAISE EXCEPTION 'invalid_bucket: %', p_bucket;
+    END IF;
+
+    SELECT jsonb_build_object(
+        'total_sales', COALESCE(SUM(total), 0),
+        'total_orders', COUNT(*),
+        'average_order', COALESCE(ROUND(AVG(total), 2), 0)
+    )
+    INTO v_summary
+    FROM orders
+    WHERE status = 'pagado' AND created_at >= p_start AND created_at < p_end;
+
+    SELECT COALESCE(jsonb_agg(jsonb_build_object(
+        'period', period::date,
+        'orders', orders,
+        'sales', sales,
+        'average_order', ROUND(sales / orders, 2)
+    ) ORDER BY period), '[]'::jsonb)
+    INTO v_buckets
+    FROM (
+        SELECT date_trunc(p_bucket, created_at AT TIME ZONE p_tz) AS period,
+               COUNT(*) AS orders,
+               SUM(total) AS sales
+        FROM orders
+        WHERE status = 'pagado' AND created_at >= p_start AND created_at < p_end
+        GROUP BY 1
+    ) b;
+
+    SELECT COALESCE(jsonb_agg(jsonb_build_object(
+        'product_id', product_id,
+        'product_name', product_name,
+        'quantity', quantity,
+        'revenue', revenue
+    ) ORDER BY revenue DESC, product_id), '[]'::jsonb)
+    INTO v_top
+    FROM (
+        SELECT oi.product_id,
+               MAX(oi.product_name) AS product_name,
+               SUM(oi.quantity) AS quantity,
+               SUM(oi.subtotal) AS revenue
+        FROM orders o
+        JOIN order_items oi ON oi.order_id = o.id
+        WHERE o.status = 'pagado' AND o.created_at >= p_start AND o.created_at < p_end
+        GROUP BY oi.product_id
+        ORDER BY revenue DESC, oi.product_id
+        LIMIT p_top
+    ) t;
+
+    RETURN v_summary || jsonb_build_object('buckets', v_buckets, 'top_products', v_top);
+END;
+$$ LANGUAGE plpgsql STABLE;
+
+REVOKE EXECUTE ON FUNCTION sales_report(TIMESTAMPTZ, TIMESTAMPTZ, TEXT, TEXT, INTEGER) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION sales_report(TIMESTAMPTZ, TIMESTAMPTZ, TEXT, TEXT, INTEGER) TO service_role;
@@ -0,0 +1,73 @@
+-- =====================================================
+-- Guest cart merge on login, in one transaction
+-- =====================================================
+
+-- UNIQUE(cart_id, product_id, variant_id) treats NULL variants as distinct,
+-- so products without variants could be duplicated in a cart. Fold any
+-- existing duplicates into one line, then close the gap with a partial index.
+WITH duplicates AS (
+    SELECT id,
+           FIRST_VALUE(id) OVER w AS keep_id,
+           SUM(quantity) OVER (PARTITION BY cart_id, product_id) AS total_quantity
+    FROM cart_items
+    WHERE variant_id IS NULL
+    WINDOW w AS (PARTITION BY cart_id, product_id ORDER BY created_at, id)
+),
+merged AS (
+    UPDATE cart_items ci
+    SET quantity = d.total_quantity
+    FROM duplicates d
+    WHERE ci.id = d.id AND d.id = d.keep_id AND ci.quantity <> d.total_quantity
+)
+DELETE FROM cart_items ci
+USING duplicates d
+WHERE ci.id = d.id AND d.id <> d.keep_id;
+
+CREATE UNIQUE INDEX IF NOT EXISTS idx_cart_items_cart_product_no_variant
+    ON cart_items(cart_id, product_id) WHERE variant_id IS NULL;
+
+-- Move the session's guest cart into the user's cart: matching lines add
+-- their quantities, new lines are inserted, and the guest cart (with its
+-- items and stock holds) is deleted. Either all of it happens or none.
+-- Returns {cart_id, merged} where merged is the number of guest lines.
+CREATE OR REPLACE FUNCTION merge_guest_cart(p_session_id TEXT, p_user_id UUID)
+RETURNS JSONB AS $$
+DECLARE
+    v_guest_id UUID;
+    v_user_id UUID;
+    v_merged INTEGER;
+BEGIN
+    -- Locking the guest cart makes a concurrent second login wait, then no-op
+    SELECT id INTO v_guest_id FROM carts WHERE session_id = p_session_id FOR UPDATE;
+    IF v_guest_id IS NULL THEN
+        RETURN jsonb_build_object('cart_id', NULL, 'merged', 0);
+    END IF;
+
+    INSERT INTO carts (user_id) VALUES (p_user_id) ON CONFLICT (user_id) DO NOTHING;
+    SELECT id INTO v_user_id FROM carts WHERE user_id = p_user_id FOR UPDATE;
+
+    INSERT INTO cart_items (cart_id, product_id, variant_id, quantity, price)
+    SELECT v_user_id, product_id, variant_id, quantity, price
+    FROM cart_items
+    WHERE cart_id = v_guest_id AND variant_id IS NOT NULL
+    ON CONFLICT (cart_id, product_id, variant_id)
+    DO UPDATE SET quantity = cart_items.quantity + EXCLUDED.quantity, updated_at = NOW();
+
+    INSERT INTO cart_items (cart_id, product_id, variant_id, quantity, price)
+    SELECT v_user_id, product_id, NULL, quantity, price
+    FROM cart_items
+    WHERE cart_id = v_guest_id AND variant_id IS NULL
+    ON CONFLICT (cart_id, product_id) WHERE variant_id IS NULL
+    DO UPDATE SET quantity = cart_items.quantity + EXCLUDED.quantity, updated_at = NOW();
+
+    SELECT COUNT(*) INTO v_merged FROM cart_items WHERE cart_id = v_guest_id;
+
+    -- Cascades to the guest cart's items and stock reservations
+    DELETE FROM carts WHERE id = v_guest_id;
+
+    RETURN jsonb_build_object('cart_id', v_user_id, 'merged', v_merged);
+END;
+$$ LANGUAGE plpgsql;
+
+REVOKE EXECUTE ON FUNCTION merge_guest_cart(TEXT, UUID) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION merge_guest_cart(TEXT, UUID) TO service_role;
@@ -0,0 +1,90 @@
+-- =====================================================
+-- Add to cart as a single increment-or-insert
+-- =====================================================
+
+-- One line per (cart, product, variant) is enforced by UNIQUE(cart_id,
+-- product_id, variant_id) plus idx_cart_items_cart_product_no_variant
+-- (11_merge_guest_cart.sql) for products without variants; the upserts
+-- below use them as conflict targets, so concurrent clicks add up on the
+-- same line instead of losing an increment or duplicating it.
+
+-- Add p_quantity units to the cart. The price comes from the catalog
+-- (sale or base price plus the variant adjustment), never from the client.
+-- Stock is checked against the variant minus other carts' holds; the
+-- authoritative check still happens in create_order.
+-- Returns {success, quantity, item_count, subtotal} or
+-- {success: false, error: 'product_not_found' | 'insufficient_stock', available}.
+CREATE OR REPLACE FUNCTION add_to_cart(
+    p_cart_id UUID,
+    p_product_id UUID,
+    p_variant_id UUID DEFAULT NULL,
+    p_quantity INTEGER DEFAULT 1
+)
+RETURNS JSONB AS $$
+DECLARE
+    v_price DECIMAL(10, 2);
+    v_available INTEGER;
+    v_quantity INTEGER;
+    v_cart carts%ROWTYPE;
+BEGIN
+    IF p_quantity IS NULL OR p_quantity <= 0 THEN
+        RAISE EXCEPTION 'invalid_quantity: %', p_quantity;
+    END IF;
+
+    IF p_variant_id IS NULL THEN
+        SELECT COALESCE(p.sale_price, p.base_price) INTO v_price
+        FROM products p
+        WHERE p.id = p_product_id AND p.status = 'publicado';
+    ELSE
+        SELECT COALESCE(p.sale_price, p.base_price) + COALESCE(v.price_adjustment, 0),
+               v.stock - reserved_stock(v.id, p_cart_id)
+        INTO v_price, v_available
+        FROM product_variants v
+        JOIN products p ON p.id = v.product_id
+        WHERE v.id = p_variant_id AND v.product_id = p_product_id
+          AND v.is_active AND p.status = 'publicado';
+    END IF;
+
+    IF v_price IS NULL THEN
+        RETURN jsonb_build_object('success', false, 'error', 'product_not_found');
+    END IF;
+
+    IF p_variant_id IS NULL THEN
+        INSERT INTO cart_items (cart_id, product_id, variant_id, quantity, price)
+        VALUES (p_cart_id, p_product_id, NULL, p_quantity, v_price)
+        ON CONFLICT (cart_id, product_id) WHERE variant_id IS NULL
+        DO UPDATE SET quantity = cart_items.quantity + EXCLUDED.quantity,
+                      price = EXCLUDED.price,
+                      updated_at = NOW()
+        RETURNING quantity INTO v_quantity;
+    ELSIF p_quantity <= v_available THEN
+        -- The WHERE makes the increment conditional: no row comes back when
+        -- the line would exceed the available stock
+        INSERT INTO cart_items (cart_id, product_id, variant_id, quantity, price)
+        VALUES (p_cart_id, p_product_id, p_variant_id, p_quantity, v_price)
+        ON CONFLICT (cart_id, product_id, variant_id)
+        DO UPDATE SET quantity = cart_items.quantity + EXCLUDED.quantity,
+                      price = EXCLUDED.price,
+                      updated_at = NOW()
+        WHERE cart_items.quantity + EXCLUDED.quantity <= v_available
+        RETURNING quantity INTO v_quantity;
+    END IF;
+
+    IF v_quantity IS NULL THEN
+        RETURN jsonb_build_object('success', false, 'error', 'insufficient_stock', 'available', GREATEST(v_available, 0));
+    END IF;
+
+    -- Counters were just updated by the cart_items trigger (04_cart_totals.sql)
+    SELECT * INTO v_cart FROM carts WHERE id = p_cart_id;
+
+    RETURN jsonb_build_object(
+        'success', true,
+        'quantity', v_quantity,
+        'item_count', v_cart.item_count,
+        'subtotal', v_cart.subtotal
+    );
+END;
+$$ LANGUAGE plpgsql;
+
+REVOKE EXECUTE ON FUNCTION add_to_cart(UUID, UUID, UUID, INTEGER) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION add_to_cart(UUID, UUID, UUID, INTEGER) TO service_role;
@@ -0,0 +1,118 @@
+-- =====================================================
+-- Session-stored guest carts: price quotes and persistence
+-- =====================================================
+
+-- Guests keep their cart in the signed Flask session (app/services/cart.py)
+-- and only get carts/cart_items rows at checkout, at login, or when the
+-- session cart overflows. These functions give them the same server-side
+-- price and stock rules as add_to_cart without writing anything.
+
+-- Catalog price of a line, checked like add_to_cart does: published
+-- product, active variant of that product, quantity within available stock.
+-- Returns {success, price} or {success: false, error, available}.
+CREATE OR REPLACE FUNCTION quote_cart_line(
+    p_product_id UUID,
+    p_variant_id UUID DEFAULT NULL,
+    p_quantity INTEGER DEFAULT 1
+)
+RETURNS JSONB AS $$
+DECLARE
+    v_price DECIMAL(10, 2);
+    v_available INTEGER;
+BEGIN
+    IF p_quantity IS NULL OR p_quantity <= 0 THEN
+        RAISE EXCEPTION 'invalid_quantity: %', p_quantity;
+    END IF;
+
+    IF p_variant_id IS NULL THEN
+        SELECT COALESCE(p.sale_price, p.base_price) INTO v_price
+        FROM products p
+        WHERE p.id = p_product_id AND p.status = 'publicado';
+    ELSE
+        SELECT COALESCE(p.sale_price, p.base_price) + COALESCE(v.price_adjustment, 0),
+               v.stock - reserved_stock(v.id)
+        INTO v_price, v_available
+        FROM product_variants v
+        JOIN products p ON p.id = v.product_id
+        WHERE v.id = p_variant_id AND v.product_id = p_product_id
+          AND v.is_active AND p.status = 'publicado';
+    END IF;
+
+    IF v_price IS NULL THEN
+        RETURN jsonb_build_object('success', false, 'error', 'product_not_found');
+    END IF;
+
+    IF p_variant_id IS NOT NULL AND p_quantity > v_available THEN
+        RETURN jsonb_build_object('success', false, 'error', 'insufficient_stock', 'available', GREATEST(v_available, 0));
+    END IF;
+
+    RETURN jsonb_build_object('success', true, 'price', v_price);
+END;
+$$ LANGUAGE plpgsql STABLE;
+
+-- Write session cart lines ([{product_id, variant_id, quantity}]) into the
+-- cart of p_user_id or p_session_id, creating it if needed. Lines already
+-- in that cart add their quantities; prices are re-read from the catalog
+-- and lines whose product is no longer available are dropped. Stock is
+-- left to the checkout hold (reserve_stock).
+-- Returns {cart: <carts row with fresh counters>, imported: n}.
+CREATE OR REPLACE FUNCTION import_cart_lines(
+    p_items JSONB,
+    p_user_id UUID DEFAULT NULL,
+    p_session_id TEXT DEFAULT NULL
+)
+RETURNS JSONB AS $$
+DECLARE
+    v_cart carts%ROWTYPE;
+    v_imported INTEGER;
+BEGIN
+    IF (p_user_id IS NULL) = (p_session_id IS NULL) THEN
+        RAISE EXCEPTION 'import_cart_lines needs exactly one of p_user_id, p_session_id';
+    END IF;
+
+    IF p_user_id IS NOT NULL THEN
+        INSERT INTO carts (user_id) VALUES (p_user_id) ON CONFLICT (user_id) DO NOTHING;
+        SELECT * INTO v_cart FROM carts WHERE user_id = p_user_id FOR UPDATE;
+    ELSE
+        INSERT INTO carts (session_id) VALUES (p_session_id) ON CONFLICT (session_id) DO NOTHING;
+        SELECT * INTO v_cart FROM carts WHERE session_id = p_session_id FOR UPDATE;
+    END IF;
+
+    WITH lines AS (
+        SELECT i.product_id, i.variant_id, SUM(i.quantity)::INTEGER AS quantity,
+               COALESCE(p.sale_price, p.base_price) + COALESCE(v.price_adjustment, 0) AS price
+        FROM jsonb_to_recordset(p_items) AS i(product_id UUID, variant_id UUID, quantity INTEGER)
+        JOIN products p ON p.id = i.product_id AND p.status = 'publicado'
+        LEFT JOIN product_variants v ON v.id = i.variant_id AND v.product_id = p.id AND v.is_active
+        WHERE i.quantity > 0 AND (i.variant_id IS NULL OR v.id IS NOT NULL)
+        GROUP BY i.product_id, i.variant_id, p.sale_price, p.base_price, v.price_adjustment
+    ),
+    with_variant AS (
+        INSERT INTO cart_items (cart_id, product_id, variant_id, quantity, price)
+        SELECT v_cart.id, product_id, variant_id, quantity, price
+        FROM lines WHERE variant_id IS NOT NULL
+        ON CONFLICT (cart_id, product_id, variant_id)
+        DO UPDATE SET quantity = cart_items.quantity + EXCLUDED.quantity, price = EXCLUDED.price, updated_at = NOW()
+        RETURNING 1
+    ),
+    without_variant AS (
+        INSERT INTO cart_items (cart_id, product_id, variant_id, quantity, price)
+        SELECT v_cart.id, product_id, NULL, quantity, price
+        FROM lines WHERE variant_id IS NULL
+        ON CONFLICT (cart_id, product_id) WHERE variant_id IS NULL
+        DO UPDATE SET quantity = cart_items.quantity + EXCLUDED.quantity, price = EXCLUDED.price, updated_at = NOW()
+        RETURNING 1
+    )
+    SELECT (SELECT COUNT(*) FROM with_variant) + (SELECT COUNT(*) FROM without_variant) INTO v_imported;
+
+    -- Counters were updated by the cart_items trigger
+    SELECT * INTO v_cart FROM carts WHERE id = v_cart.id;
+
+    RETURN jsonb_build_object('cart', to_jsonb(v_cart), 'imported', v_imported);
+END;
+$$ LANGUAGE plpgsql;
+
+REVOKE EXECUTE ON FUNCTION quote_cart_line(UUID, UUID, INTEGER) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION quote_cart_line(UUID, UUID, INTEGER) TO service_role;
+REVOKE EXECUTE ON FUNCTION import_cart_lines(JSONB, UUID, TEXT) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION import_cart_lines(JSONB, UUID, TEXT) TO service_role;
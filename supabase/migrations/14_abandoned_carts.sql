@@ -0,0 +1,38 @@
+-- =====================================================
+-- Purge of abandoned guest carts
+-- =====================================================
+
+-- Reads never create carts (CartService.find_cart); rows only appear on the
+-- first add, checkout or login. Guest carts nobody came back to are swept
+-- by `manage.py purge-carts`; every cart write bumps updated_at (directly
+-- or through the cart_items counters trigger), so it marks the last activity.
+CREATE INDEX IF NOT EXISTS idx_carts_guest_updated_at
+    ON carts(updated_at) WHERE user_id IS NULL;
+
+-- Delete up to p_batch_size guest carts untouched for p_older_than_days,
+-- oldest first; returns how many were deleted. Items and stock holds go
+-- with them (ON DELETE CASCADE). Carts locked by a request are skipped.
+CREATE OR REPLACE FUNCTION purge_abandoned_carts(
+    p_older_than_days INTEGER DEFAULT 30,
+    p_batch_size INTEGER DEFAULT 1000
+)
+RETURNS INTEGER AS $$
+DECLARE
+    purged INTEGER;
+BEGIN
+    DELETE FROM carts
+    WHERE id IN (
+        SELECT id FROM carts
+        WHERE user_id IS NULL
+          AND updated_at < NOW() - make_interval(days => p_older_than_days)
+        ORDER BY updated_at
+        LIMIT p_batch_size
+        FOR UPDATE SKIP LOCKED
+    );
+    GET DIAGNOSTICS purged = ROW_COUNT;
+    RETURN purged;
+END;
+$$ LANGUAGE plpgsql;
+
+REVOKE EXECUTE ON FUNCTION purge_abandoned_carts(INTEGER, INTEGER) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION purge_abandoned_carts(INTEGER, INTEGER) TO service_role;
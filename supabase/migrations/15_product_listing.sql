@@ -0,0 +1,228 @@
+-- =====================================================
+-- product_listing: denormalized read model for product cards
+-- =====================================================
+
+-- One row per product with everything a listing renders, so catalog,
+-- category, brand and featured pages read a single table instead of
+-- embedding brands, categories, variants and images on every request.
+-- A table kept current by triggers rather than a materialized view: a view
+-- refresh recomputes every product, these triggers touch one row per change.
+CREATE TABLE IF NOT EXISTS product_listing (
+    id UUID PRIMARY KEY REFERENCES products(id) ON DELETE CASCADE,
+    sku VARCHAR(100) NOT NULL,
+    name VARCHAR(255) NOT NULL,
+    slug VARCHAR(255) NOT NULL,
+    status product_status,
+    is_featured BOOLEAN,
+    category_id UUID,
+    category_slug VARCHAR(255),
+    category_name VARCHAR(255),
+    brand_id UUID,
+    brand_slug VARCHAR(255),
+    brand_name VARCHAR(255),
+    base_price DECIMAL(10, 2),
+    sale_price DECIMAL(10, 2),
+    -- Effective price (sale or base, plus price_adjustment) over active variants
+    price_min DECIMAL(10, 2),
+    price_max DECIMAL(10, 2),
+    -- Units in stock across active variants
+    stock INTEGER NOT NULL DEFAULT 0,
+    image_url TEXT,
+    image_alt VARCHAR(255),
+    search_vector TSVECTOR,
+    created_at TIMESTAMP WITH TIME ZONE,
+    refreshed_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+
+-- Same sorts and filters as the products indexes in 07_keyset_indexes.sql
+CREATE INDEX IF NOT EXISTS idx_product_listing_status_created_id ON product_listing(status, created_at, id);
+CREATE INDEX IF NOT EXISTS idx_product_listing_status_price_id ON product_listing(status, base_price, id);
+CREATE INDEX IF NOT EXISTS idx_product_listing_status_name_id ON product_listing(status, name, id);
+CREATE INDEX IF NOT EXISTS idx_product_listing_category_status_created_id ON product_listing(category_id, status, created_at, id);
+CREATE INDEX IF NOT EXISTS idx_product_listing_brand_status_created_id ON product_listing(brand_id, status, created_at, id);
+CREATE INDEX IF NOT EXISTS idx_product_listing_featured ON product_listing(created_at, id) WHERE is_featured AND status = 'publicado';
+CREATE INDEX IF NOT EXISTS idx_product_listing_search_vector ON product_listing USING gin(search_vector);
+
+ALTER TABLE product_listing ENABLE ROW LEVEL SECURITY;
+
+-- Same visibility as products; rows are only written by the triggers below
+DROP POLICY IF EXISTS "Published listings are viewable" ON product_listing;
+CREATE POLICY "Published listings are viewable"
+    ON product_listing FOR SELECT
+    USING (status = 'publicado' OR is_admin() OR is_gestor_or_admin());
+
+-- =====================================================
+-- REFRESH
+-- =====================================================
+
+-- Recompute the rows of the given products (missing products are skipped;
+-- deleted ones are gone already through ON DELETE CASCADE)
+CREATE OR REPLACE FUNCTION refresh_product_listing(p_product_ids UUID[])
+RETURNS VOID AS $$
+    INSERT INTO product_listing (
+        id, sku, name, slug, status, is_featured,
+        category_id, category_slug, category_name, brand_id, brand_slug, brand_name,
+        base_price, sale_price, price_min, price_max, stock,
+        image_url, image_alt, search_vector, created_at, refreshed_at
+    )
+    SELECT
+        p.id, p.sku, p.name, p.slug, p.status, p.is_featured,
+        p.category_id, c.slug, c.name, p.brand_id, b.slug, b.name,
+        p.base_price, p.sale_price,
+        COALESCE(v.adjustment_min, 0) + COALESCE(p.sale_price, p.base_price),
+        COALESCE(v.adjustment_max, 0) + COALESCE(p.sale_price, p.base_price),
+        COALESCE(v.stock, 0),
+        i.url, i.alt_text, p.search_vector, p.created_at, NOW()
+    FROM products p
+    LEFT JOIN categories c ON c.id = p.category_id
+    LEFT JOIN brands b ON b.id = p.brand_id
+    LEFT JOIN LATERAL (
+        SELECT MIN(COALESCE(price_adjustment, 0)) AS adjustment_min,
+               MAX(COALESCE(price_adjustment, 0)) AS adjustment_max,
+               SUM(stock) AS stock
+        FROM product_variants
+        WHERE product_id = p.id AND is_active
+    ) v ON TRUE
+    LEFT JOIN LATERAL (
+        SELECT url, alt_text FROM product_images
+        WHERE product_id = p.id
+        ORDER BY is_primary DESC, display_order
+        LIMIT 1
+    ) i ON TRUE
+    WHERE p.id = ANY(p_product_ids)
+    ON CONFLICT (id) DO UPDATE SET
+        sku = EXCLUDED.sku,
+        name = EXCLUDED.name,
+        slug = EXCLUDED.slug,
+        status = EXCLUDED.status,
+        is_featured = EXCLUDED.is_featured,
+        category_id = EXCLUDED.category_id,
+        category_slug = EXCLUDED.category_slug,
+        category_name = EXCLUDED.category_name,
+        brand_id = EXCLUDED.brand_id,
+        brand_slug = EXCLUDED.brand_slug,
+        brand_name = EXCLUDED.brand_name,
+        base_price = EXCLUDED.base_price,
+        sale_price = EXCLUDED.sale_price,
+        price_min = EXCLUDED.price_min,
+        price_max = EXCLUDED.price_max,
+        stock = EXCLUDED.stock,
+        image_url = EXCLUDED.image_url,
+        image_alt = EXCLUDED.image_alt,
+        search_vector = EXCLUDED.search_vector,
+        created_at = EXCLUDED.created_at,
+        refreshed_at = EXCLUDED.refreshed_at;
+$$ LANGUAGE sql;
+
+-- Maintenance only (the triggers below run it as their owner)
+REVOKE EXECUTE ON FUNCTION refresh_product_listing(UUID[]) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION refresh_product_listing(UUID[]) TO service_role;
+
+-- =====================================================
+-- TRIGGERS
+-- =====================================================
+
+-- products, product_variants and product_images: refresh the product the
+-- changed row belongs to (both products if a row moved between them)
+CREATE OR REPLACE FUNCTION refresh_product_listing_row()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_TABLE_NAME = 'products' THEN
+        PERFORM refresh_product_listing(ARRAY[NEW.id]);
+    ELSIF TG_OP = 'INSERT' THEN
+        PERFORM refresh_product_listing(ARRAY[NEW.product_id]);
+    ELSIF TG_OP = 'DELETE' THEN
+        PERFORM refresh_product_listing(ARRAY[OLD.product_id]);
+    ELSE
+        PERFORM refresh_product_listing(ARRAY[OLD.product_id, NEW.product_id]);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER SET search_path = public;
+
+DROP TRIGGER IF EXISTS products_listing ON products;
+CREATE TRIGGER products_listing
+    AFTER INSERT OR UPDATE ON products
+    FOR EACH ROW EXECUTE FUNCTION refresh_product_listing_row();
+
+DROP TRIGGER IF EXISTS product_variants_listing ON product_variants;
+CREATE TRIGGER product_variants_listing
+    AFTER INSERT OR DELETE OR UPDATE OF product_id, price_adjustment, stock, is_active ON product_variants
+    FOR EACH ROW EXECUTE FUNCTION refresh_product_listing_row();
+
+DROP TRIGGER IF EXISTS product_images_listing ON product_images;
+CREATE TRIGGER product_images_listing
+    AFTER INSERT OR DELETE OR UPDATE OF product_id, url, alt_text, is_primary, display_order ON product_images
+    FOR EACH ROW EXECUTE FUNCTION refresh_product_listing_row();
+
+-- Renaming a brand or category rewrites the names and slugs it denormalizes
+-- (search vectors follow through the products trigger of 08_search.sql)
+CREATE OR REPLACE FUNCTION refresh_listing_labels()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_TABLE_NAME = 'brands' THEN
+        UPDATE product_listing SET brand_slug = NEW.slug, brand_name = NEW.name, refreshed_at = NOW()
+        WHERE brand_id = NEW.id;
+    ELSE
+        UPDATE product_listing SET category_slug = NEW.slug, category_name = NEW.name, refreshed_at = NOW()
+        WHERE category_id = NEW.id;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER SET search_path = public;
+
+DROP TRIGGER IF EXISTS brands_listing ON brands;
+CREATE TRIGGER brands_listing
+    AFTER UPDATE OF name, slug ON brands
+    FOR EACH ROW WHEN (OLD.name IS DISTINCT FROM NEW.name OR OLD.slug IS DISTINCT FROM NEW.slug)
+    EXECUTE FUNCTION refresh_listing_labels();
+
+DROP TRIGGER IF EXISTS categories_listing ON categories;
+CREATE TRIGGER categories_listing
+    AFTER UPDATE OF name, slug ON categories
+    FOR EACH ROW WHEN (OLD.name IS DISTINCT FROM NEW.name OR OLD.slug IS DISTINCT FROM NEW.slug)
+    EXECUTE FUNCTION refresh_listing_labels();
+
+-- Backfill
+SELECT refresh_product_listing(ARRAY(SELECT id FROM products));
+
+-- =====================================================
+-- SEARCH
+-- =====================================================
+
+-- search_products now returns listing rows (the columns of the 'card'
+-- projection in app/services/products.py, plus rank) instead of embedded JSON
+CREATE OR REPLACE FUNCTION search_products(p_query TEXT, p_limit INTEGER DEFAULT 20, p_offset INTEGER DEFAULT 0)
+RETURNS JSONB AS $$
+    WITH q AS (
+        SELECT search_prefix_query(p_query) AS tsq,
+               immutable_unaccent(lower(trim(p_query))) AS term
+    ),
+    candidates AS (
+        SELECT l.id FROM product_listing l, q WHERE l.search_vector @@ q.tsq
+        UNION
+        SELECT p.id FROM products p, q WHERE length(q.term) >= 2 AND q.term <% immutable_unaccent(lower(p.name))
+        UNION
+        SELECT p.id FROM products p, q
+        WHERE length(q.term) >= 3
+          AND lower(p.sku) LIKE '%' || replace(replace(replace(q.term, '\', '\\'), '%', '\%'), '_', '\_') || '%'
+    ),
+    ranked AS (
+        SELECT l.*,
+               COALESCE(ts_rank_cd(l.search_vector, q.tsq), 0) * 2
+               + word_similarity(q.term, immutable_unaccent(lower(l.name)))
+               + CASE WHEN lower(l.sku) = q.term THEN 1 ELSE 0 END AS rank
+        FROM candidates c
+        JOIN product_listing l ON l.id = c.id
+        CROSS JOIN q
+        WHERE l.status = 'publicado'
+        ORDER BY rank DESC, l.id
+        LIMIT LEAST(p_limit, 100) OFFSET p_offset
+    )
+    SELECT COALESCE(jsonb_agg(
+        (to_jsonb(r) - 'sku' - 'status' - 'brand_id' - 'search_vector' - 'refreshed_at')
+        ORDER BY r.rank DESC, r.id
+    ), '[]'::jsonb)
+    FROM ranked r;
+$$ LANGUAGE sql STABLE
+SET pg_trgm.word_similarity_threshold = 0.4;
@@ -0,0 +1,73 @@
+-- =====================================================
+-- Product detail page in one round trip
+-- =====================================================
+
+-- Everything catalog.product renders for a published product:
+--   product   detail columns with category {id, name, slug} and brand {id, name, slug}
+--   images    ordered primary first, then display_order (url as stored at upload)
+--   variants  active ones, in creation order
+--   related   product_listing rows: related_products first, then other
+--             published products of the same category, never the product itself
+--   version   last change to the product, its variants or its images
+--             (product_listing.refreshed_at follows those through its triggers)
+-- Returns NULL when there is no published product with that slug.
+CREATE OR REPLACE FUNCTION product_page(p_slug TEXT, p_related_limit INTEGER DEFAULT 4)
+RETURNS JSONB AS $$
+    WITH p AS (
+        SELECT * FROM products WHERE slug = p_slug AND status = 'publicado'
+    ),
+    -- Each branch needs at most p_related_limit rows: category products that
+    -- duplicate an explicit relation are dropped, but those relations are
+    -- already in the first branch
+    candidates AS (
+        (SELECT rp.related_product_id AS id, 0 AS source, rp.created_at AS sort_at
+         FROM related_products rp
+         JOIN product_listing l ON l.id = rp.related_product_id AND l.status = 'publicado'
+         WHERE rp.product_id = (SELECT id FROM p)
+         ORDER BY rp.created_at
+         LIMIT p_related_limit)
+        UNION ALL
+        (SELECT l.id, 1, l.created_at
+         FROM product_listing l
+         WHERE l.category_id = (SELECT category_id FROM p) AND l.status = 'publicado'
+           AND l.id <> (SELECT id FROM p)
+         ORDER BY l.created_at DESC
+         LIMIT p_related_limit)
+    ),
+    related AS (
+        SELECT DISTINCT ON (id) id, source, sort_at FROM candidates ORDER BY id, source
+    )
+    SELECT jsonb_build_object(
+        'product', to_jsonb(p) - 'cost' - 'created_by' - 'updated_by' - 'search_vector' || jsonb_build_object(
+            'category', (SELECT jsonb_build_object('id', c.id, 'name', c.name, 'slug', c.slug) FROM categories c WHERE c.id = p.category_id),
+            'brand', (SELECT jsonb_build_object('id', b.id, 'name', b.name, 'slug', b.slug) FROM brands b WHERE b.id = p.brand_id)
+        ),
+        'images', COALESCE((
+            SELECT jsonb_agg(jsonb_build_object(
+                'id', i.id, 'url', i.url, 'storage_path', i.storage_path, 'alt_text', i.alt_text,
+                'is_primary', i.is_primary, 'display_order', i.display_order
+            ) ORDER BY i.is_primary DESC, i.display_order, i.created_at)
+            FROM product_images i WHERE i.product_id = p.id
+        ), '[]'::jsonb),
+        'variants', COALESCE((
+            SELECT jsonb_agg(jsonb_build_object(
+                'id', v.id, 'name', v.name, 'attributes', v.attributes,
+                'price_adjustment', v.price_adjustment, 'stock', v.stock, 'is_active', v.is_active
+            ) ORDER BY v.created_at, v.id)
+            FROM product_variants v WHERE v.product_id = p.id AND v.is_active
+        ), '[]'::jsonb),
+        'related', COALESCE((
+            SELECT jsonb_agg(
+                to_jsonb(l) - 'sku' - 'status' - 'brand_id' - 'search_vector' - 'refreshed_at'
+                ORDER BY r.source, CASE WHEN r.source = 0 THEN r.sort_at END, r.sort_at DESC
+            )
+            FROM (SELECT * FROM related ORDER BY source, CASE WHEN source = 0 THEN sort_at END, sort_at DESC LIMIT p_related_limit) r
+            JOIN product_listing l ON l.id = r.id
+        ), '[]'::jsonb),
+        'version', GREATEST(p.updated_at, (SELECT refreshed_at FROM product_listing WHERE id = p.id))
+    )
+    FROM p;
+$$ LANGUAGE sql STABLE;
+
+-- Public read-only RPC (RLS on the tables still applies)
+GRANT EXECUTE ON FUNCTION product_page(TEXT, INTEGER) TO anon, authenticated, service_role;
@@ -0,0 +1,98 @@
+-- =====================================================
+-- Versions for HTTP validators (ETag / Last-Modified)
+-- =====================================================
+
+-- app/services/http_cache.py answers 304 Not Modified when a page's version
+-- has not moved since the client (or the CDN) last fetched it, so a version
+-- must move whenever anything the page renders changes.
+
+-- Listing pages (catalog, category, brand, home, search): last refresh of the
+-- product_listing rows in scope plus the category and brand labels the
+-- filters render. products counts the published rows so that deleting or
+-- unpublishing a product also moves the version.
+CREATE OR REPLACE FUNCTION catalog_version(p_category_id UUID DEFAULT NULL, p_brand_id UUID DEFAULT NULL)
+RETURNS JSONB AS $$
+    SELECT jsonb_build_object(
+        'version', GREATEST(
+            MAX(l.refreshed_at),
+            (SELECT MAX(updated_at) FROM categories),
+            (SELECT MAX(updated_at) FROM brands)
+        ),
+        'products', COUNT(*) FILTER (WHERE l.status = 'publicado')
+    )
+    FROM product_listing l
+    WHERE (p_category_id IS NULL OR l.category_id = p_category_id)
+      AND (p_brand_id IS NULL OR l.brand_id = p_brand_id);
+$$ LANGUAGE sql STABLE;
+
+GRANT EXECUTE ON FUNCTION catalog_version(UUID, UUID) TO anon, authenticated, service_role;
+
+-- Product detail: version now also follows variant edits outside the listing
+-- columns (name, attributes), the category and brand labels and the related
+-- cards. Related products that drop out of the list are caught by the ETag,
+-- which also hashes the related ids (ProductService.get_product_page).
+CREATE OR REPLACE FUNCTION product_page(p_slug TEXT, p_related_limit INTEGER DEFAULT 4)
+RETURNS JSONB AS $$
+    WITH p AS (
+        SELECT * FROM products WHERE slug = p_slug AND status = 'publicado'
+    ),
+    -- Each branch needs at most p_related_limit rows: category products that
+    -- duplicate an explicit relation are dropped, but those relations are
+    -- already in the first branch
+    candidates AS (
+        (SELECT rp.related_product_id AS id, 0 AS source, rp.created_at AS sort_at
+         FROM related_products rp
+         JOIN product_listing l ON l.id = rp.related_product_id AND l.status = 'publicado'
+         WHERE rp.product_id = (SELECT id FROM p)
+         ORDER BY rp.created_at
+         LIMIT p_related_limit)
+        UNION ALL
+        (SELECT l.id, 1, l.created_at
+         FROM product_listing l
+         WHERE l.category_id = (SELECT category_id FROM p) AND l.status = 'publicado'
+           AND l.id <> (SELECT id FROM p)
+         ORDER BY l.created_at DESC
+         LIMIT p_related_limit)
+    ),
+    related AS (
+        SELECT DISTINCT ON (id) id, source, sort_at FROM candidates ORDER BY id, source
+    )
+    SELECT jsonb_build_object(
+        'product', to_jsonb(p) - 'cost' - 'created_by' - 'updated_by' - 'search_vector' || jsonb_build_object(
+            'category', (SELECT jsonb_build_object('id', c.id, 'name', c.name, 'slug', c.slug) FROM categories c WHERE c.id = p.category_id),
+            'brand', (SELECT jsonb_build_object('id', b.id, 'name', b.name, 'slug', b.slug) FROM brands b WHERE b.id = p.brand_id)
+        ),
+        'images', COALESCE((
+            SELECT jsonb_agg(jsonb_build_object(
+                'id', i.id, 'url', i.url, 'storage_path', i.storage_path, 'alt_text', i.alt_text,
+                'is_primary', i.is_primary, 'display_order', i.display_order
+            ) ORDER BY i.is_primary DESC, i.display_order, i.created_at)
+            FROM product_images i WHERE i.product_id = p.id
+        ), '[]'::jsonb),
+        'variants', COALESCE((
+            SELECT jsonb_agg(jsonb_build_object(
+                'id', v.id, 'name', v.name, 'attributes', v.attributes,
+                'price_adjustment', v.price_adjustment, 'stock', v.stock, 'is_active', v.is_active
+            ) ORDER BY v.created_at, v.id)
+            FROM product_variants v WHERE v.product_id = p.id AND v.is_active
+        ), '[]'::jsonb),
+        'related', COALESCE((
+            SELECT jsonb_agg(
+                to_jsonb(l) - 'sku' - 'status' - 'brand_id' - 'search_vector' - 'refreshed_at'
+                ORDER BY r.source, CASE WHEN r.source = 0 THEN r.sort_at END, r.sort_at DESC
+            )
+            FROM (SELECT * FROM related ORDER BY source, CASE WHEN source = 0 THEN sort_at END, sort_at DESC LIMIT p_related_limit) r
+            JOIN product_listing l ON l.id = r.id
+        ), '[]'::jsonb),
+        'version', GREATEST(
+            p.updated_at,
+            (SELECT refreshed_at FROM product_listing WHERE id = p.id),
+            (SELECT MAX(updated_at) FROM product_variants WHERE product_id = p.id),
+            (SELECT updated_at FROM categories WHERE id = p.category_id),
+            (SELECT updated_at FROM brands WHERE id = p.brand_id),
+            (SELECT MAX(l.refreshed_at) FROM related r JOIN product_listing l ON l.id = r.id)
+        )
+    )
+    FROM p;
+$$ LANGUAGE sql STABLE;
+
@@ -0,0 +1,144 @@
+-- =====================================================
+-- Maintained catalog versions
+-- =====================================================
+
+-- catalog_version() (17_http_cache_versions.sql) scanned product_listing
+-- with MAX/COUNT on every call. These rows are kept current by triggers
+-- instead, so it is a primary-key lookup. One row per filter scope the
+-- listing pages combine ('all', 'category:<id>', 'brand:<id>' and
+-- 'category:<id>:brand:<id>'), plus 'taxonomy' for the category and brand
+-- labels every listing renders in its filters.
+CREATE TABLE IF NOT EXISTS catalog_versions (
+    scope TEXT PRIMARY KEY,
+    version TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW(),
+    -- Published products in scope (deleting or unpublishing moves the ETag)
+    products INTEGER NOT NULL DEFAULT 0
+);
+
+ALTER TABLE catalog_versions ENABLE ROW LEVEL SECURITY;
+
+-- Versions are public; rows are only written by the triggers below
+DROP POLICY IF EXISTS "Catalog versions are viewable" ON catalog_versions;
+CREATE POLICY "Catalog versions are viewable"
+    ON catalog_versions FOR SELECT
+    USING (TRUE);
+
+-- Scopes a listing row belongs to, 'all' first: every writer locks the rows
+-- in this order, so concurrent transactions queue on 'all' instead of
+-- deadlocking on the narrower scopes
+CREATE OR REPLACE FUNCTION catalog_scopes(p_category_id UUID, p_brand_id UUID)
+RETURNS TEXT[] AS $$
+    SELECT ARRAY['all']
+        || CASE WHEN p_category_id IS NOT NULL THEN ARRAY['category:' || p_category_id] ELSE '{}' END
+        || CASE WHEN p_brand_id IS NOT NULL THEN ARRAY['brand:' || p_brand_id] ELSE '{}' END
+        || CASE WHEN p_category_id IS NOT NULL AND p_brand_id IS NOT NULL
+                THEN ARRAY['category:' || p_category_id || ':brand:' || p_brand_id] ELSE '{}' END;
+$$ LANGUAGE sql IMMUTABLE;
+
+-- The narrowest scope of a filter (the last of catalog_scopes)
+CREATE OR REPLACE FUNCTION catalog_scope(p_category_id UUID, p_brand_id UUID)
+RETURNS TEXT AS $$
+    SELECT (catalog_scopes(p_category_id, p_brand_id))[array_length(catalog_scopes(p_category_id, p_brand_id), 1)];
+$$ LANGUAGE sql IMMUTABLE;
+
+CREATE OR REPLACE FUNCTION bump_catalog_versions(p_scopes TEXT[], p_products INTEGER)
+RETURNS VOID AS $$
+    INSERT INTO catalog_versions AS cv (scope, version, products)
+    SELECT scope, NOW(), p_products FROM unnest(p_scopes) WITH ORDINALITY AS s(scope, n) ORDER BY n
+    ON CONFLICT (scope) DO UPDATE
+    SET version = EXCLUDED.version, products = cv.products + EXCLUDED.products;
+$$ LANGUAGE sql;
+
+REVOKE EXECUTE ON FUNCTION bump_catalog_versions(TEXT[], INTEGER) FROM PUBLIC, anon, authenticated;
+
+-- =====================================================
+-- TRIGGERS
+-- =====================================================
+
+-- A listing row changed: move the versions of the scopes it left and entered.
+-- Drafts are invisible to listings, and the cards only render whether a
+-- product is in stock, so sales that leave stock above zero bump nothing
+-- (the product page reads stock live, see ProductService.get_product_stock).
+CREATE OR REPLACE FUNCTION refresh_catalog_versions()
+RETURNS TRIGGER AS $$
+BEGIN
+    -- OLD is NULL on INSERT and NEW on DELETE
+    IF OLD.status IS DISTINCT FROM 'publicado' AND NEW.status IS DISTINCT FROM 'publicado' THEN
+        RETURN NULL;
+    END IF;
+
+    IF TG_OP = 'UPDATE'
+       AND (to_jsonb(OLD) - 'stock' - 'refreshed_at') = (to_jsonb(NEW) - 'stock' - 'refreshed_at')
+       AND (OLD.stock > 0) = (NEW.stock > 0) THEN
+        RETURN NULL;
+    END IF;
+
+    IF TG_OP <> 'INSERT' THEN
+        PERFORM bump_catalog_versions(
+            catalog_scopes(OLD.category_id, OLD.brand_id),
+            CASE WHEN OLD.status = 'publicado' THEN -1 ELSE 0 END
+        );
+    END IF;
+    IF TG_OP <> 'DELETE' THEN
+        PERFORM bump_catalog_versions(
+            catalog_scopes(NEW.category_id, NEW.brand_id),
+            CASE WHEN NEW.status = 'publicado' THEN 1 ELSE 0 END
+        );
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER SET search_path = public;
+
+DROP TRIGGER IF EXISTS product_listing_versions ON product_listing;
+CREATE TRIGGER product_listing_versions
+    AFTER INSERT OR UPDATE OR DELETE ON product_listing
+    FOR EACH ROW EXECUTE FUNCTION refresh_catalog_versions();
+
+-- Any category or brand change can show up in the filters of every listing
+CREATE OR REPLACE FUNCTION refresh_taxonomy_version()
+RETURNS TRIGGER AS $$
+BEGIN
+    PERFORM bump_catalog_versions(ARRAY['taxonomy'], 0);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER SET search_path = public;
+
+DROP TRIGGER IF EXISTS categories_taxonomy_version ON categories;
+CREATE TRIGGER categories_taxonomy_version
+    AFTER INSERT OR UPDATE OR DELETE ON categories
+    FOR EACH STATEMENT EXECUTE FUNCTION refresh_taxonomy_version();
+
+DROP TRIGGER IF EXISTS brands_taxonomy_version ON brands;
+CREATE TRIGGER brands_taxonomy_version
+    AFTER INSERT OR UPDATE OR DELETE ON brands
+    FOR EACH STATEMENT EXECUTE FUNCTION refresh_taxonomy_version();
+
+-- Backfill
+INSERT INTO catalog_versions (scope, version, products)
+SELECT scope, MAX(l.refreshed_at), COUNT(*) FILTER (WHERE l.status = 'publicado')
+FROM product_listing l, unnest(catalog_scopes(l.category_id, l.brand_id)) AS scope
+GROUP BY scope
+ON CONFLICT (scope) DO UPDATE SET version = EXCLUDED.version, products = EXCLUDED.products;
+
+INSERT INTO catalog_versions (scope, version)
+SELECT 'taxonomy', COALESCE(GREATEST((SELECT MAX(updated_at) FROM categories), (SELECT MAX(updated_at) FROM brands)), NOW())
+ON CONFLICT (scope) DO UPDATE SET version = EXCLUDED.version;
+
+-- =====================================================
+-- catalog_version: same result as 17, without the scan
+-- =====================================================
+
+CREATE OR REPLACE FUNCTION catalog_version(p_category_id UUID DEFAULT NULL, p_brand_id UUID DEFAULT NULL)
+RETURNS JSONB AS $$
+    SELECT jsonb_build_object(
+        'version', GREATEST(
+            (SELECT version FROM catalog_versions WHERE scope = catalog_scope(p_category_id, p_brand_id)),
+            (SELECT version FROM catalog_versions WHERE scope = 'taxonomy')
+        ),
+        'products', COALESCE(
+            (SELECT products FROM catalog_versions WHERE scope = catalog_scope(p_category_id, p_brand_id)), 0
+        )
+    );
+$$ LANGUAGE sql STABLE;
+
+GRANT EXECUTE ON FUNCTION catalog_version(UUID, UUID) TO anon, authenticated, service_role;
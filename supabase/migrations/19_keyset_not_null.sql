@@ -0,0 +1,21 @@
+-- =====================================================
+-- NOT NULL keyset sort keys
+-- =====================================================
+
+-- Keyset pagination compares (key, id) against the last row of a page
+-- (app/services/pagination.py); a NULL key has no place in that order, so
+-- every column listings page by must be NOT NULL. name and base_price
+-- already are on products; created_at only had a default.
+
+UPDATE products SET created_at = NOW() WHERE created_at IS NULL;
+ALTER TABLE products ALTER COLUMN created_at SET NOT NULL;
+
+UPDATE orders SET created_at = NOW() WHERE created_at IS NULL;
+ALTER TABLE orders ALTER COLUMN created_at SET NOT NULL;
+
+-- product_listing copies them from products
+UPDATE product_listing l SET created_at = p.created_at
+FROM products p
+WHERE p.id = l.id AND l.created_at IS NULL;
+ALTER TABLE product_listing ALTER COLUMN created_at SET NOT NULL;
+ALTER TABLE product_listing ALTER COLUMN base_price SET NOT NULL;
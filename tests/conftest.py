@@ -3,9 +3,22 @@ Pytest configuration and fixtures
 """
 import pytest
 import os
+from types import SimpleNamespace
 from app import create_app
+from app.services import supabase as supabase_module
+from app.services.cache import get_cache, get_fragment_cache
 from app.services.supabase import get_db_connection
 
+@pytest.fixture(autouse=True)
+def clear_cache():
+    """Start every test with empty reference-data and fragment caches"""
+    get_cache().clear()
+    get_fragment_cache().clear()
+    yield
+    get_cache().clear()
+    get_fragment_cache().clear()
+
+
 @pytest.fixture
 def app():
     """Create application for testing"""
@@ -60,3 +73,52 @@ class AuthActions:
 def auth(client):
     """Authentication helper"""
     return AuthActions(client)
+
+
+class FakeQuery:
+    """Chainable stand-in for a PostgREST query builder"""
+    
+    def __init__(self, fake, table):
+        self._fake = fake
+        self.table = table
+        self.ops = []
+    
+    def __getattr__(self, name):
+        def method(*args, **kwargs):
+            self.ops.append((name, args, kwargs))
+            return self
+        return method
+    
+    def execute(self):
+        self._fake.calls.append(self)
+        response = self._fake.responses.get(self.table, [])
+        data = response(self) if callable(response) else response
+        return SimpleNamespace(data=data, count=len(data) if isinstance(data, list) else None)
+
+
+class FakeSupabase:
+    """Records every executed query; responses are configured per table"""
+    
+    def __init__(self):
+        self.responses = {}
+        self.calls = []
+    
+    def table(self, name):
+        return FakeQuery(self, name)
+    
+    def rpc(self, name, params=None, get=False):
+        query = FakeQuery(self, f'rpc:{name}')
+        query.ops.append(('rpc', (params,), {'get': get}))
+        return query
+    
+    def calls_to(self, table):
+        return [call for call in self.calls if call.table == table]
+
+
+@pytest.fixture
+def fake_supabase(monkeypatch):
+    """Replace both Supabase clients with a recording fake"""
+    fake = FakeSupabase()
+    monkeypatch.setattr(supabase_module, '_supabase_client', fake)
+    monkeypatch.setattr(supabase_module, '_supabase_admin_client', fake)
+    return fake
@@ -0,0 +1,121 @@
+"""
+Integration tests for worker boot: import cost and the gunicorn boot profile
+"""
+import os
+import re
+import runpy
+import subprocess
+import sys
+from types import SimpleNamespace
+
+import pytest
+
+from app.services import supabase as supabase_module
+from app.services.cache import get_cache
+
+ROOT = os.path.join(os.path.dirname(__file__), '..', '..')
+
+# Cumulative import time of `create_app()` (about 1s on a dev box); the
+# budget leaves room for slow CI machines, heavy modules are checked exactly
+IMPORT_TIME_BUDGET_MS = int(os.getenv('IMPORT_TIME_BUDGET_MS', 3000))
+# Only the report/export and upload code paths may import these
+HEAVY_MODULES = {'pandas', 'numpy', 'openpyxl', 'PIL'}
+# Resident memory of a worker after create_app() and one request (about 45 MB
+# on a dev box, 70 MB when Pillow and the Supabase SDK were imported at boot)
+WORKER_RSS_BUDGET_MB = int(os.getenv('WORKER_RSS_BUDGET_MB', 60))
+
+IMPORTTIME_LINE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \|( +)(\S+)$')
+
+
+def import_profile(code):
+    """{module: cumulative us} and the total, from python -X importtime"""
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', code],
+        cwd=ROOT, capture_output=True, text=True, timeout=60
+    )
+    assert result.returncode == 0, result.stderr[-2000:]
+    
+    modules, total = {}, 0
+    for line in result.stderr.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if not match:
+            continue
+        cumulative, indent, name = int(match.group(2)), match.group(3), match.group(4)
+        modules[name] = cumulative
+        # One space of indentation: imported directly by the code, not by another module
+        if len(indent) == 1:
+            total += cumulative
+    return modules, total / 1000
+
+
+@pytest.fixture
+def boot_config():
+    return runpy.run_path(os.path.join(ROOT, 'gunicorn.conf.py'))
+
+
+@pytest.fixture
+def server():
+    return SimpleNamespace(log=SimpleNamespace(info=lambda msg: None, warning=lambda msg: None))
+
+
+class TestBoot:
+    """What a new worker pays before its first request"""
+    
+    def test_create_app_import_budget(self):
+        modules, total_ms = import_profile('from app import create_app; create_app()')
+        
+        assert not HEAVY_MODULES & {name.split('.')[0] for name in modules}
+        assert total_ms < IMPORT_TIME_BUDGET_MS, f'create_app() imports took {total_ms:.0f} ms'
+    
+    def test_create_app_defers_the_supabase_sdk(self):
+        modules, _ = import_profile('from app import create_app; create_app()')
+        
+        assert 'supabase' not in modules
+    
+    def test_manage_does_not_build_the_app(self):
+        modules, _ = import_profile('import manage')
+        
+        assert not {'app.blueprints', 'supabase', 'PIL'} & set(modules)
+    
+    def test_worker_rss_budget(self):
+        code = (
+            "from app import create_app\n"
+            "create_app().test_client().get('/health')\n"
+            "print(next(l for l in open('/proc/self/status') if l.startswith('VmRSS')).split()[1])"
+        )
+        if not os.path.exists('/proc/self/status'):
+            pytest.skip('needs /proc')
+        
+        result = subprocess.run([sys.executable, '-c', code], cwd=ROOT, capture_output=True, text=True, timeout=60)
+        assert result.returncode == 0, result.stderr[-2000:]
+        
+        rss_mb = int(result.stdout.split()[-1]) / 1024
+        assert rss_mb < WORKER_RSS_BUDGET_MB, f'worker RSS {rss_mb:.0f} MB'
+    
+    def test_config_preloads_the_app(self, boot_config):
+        assert boot_config['preload_app'] is True
+        assert callable(boot_config['when_ready'])
+        assert callable(boot_config['post_fork'])
+    
+    def test_post_fork_rebuilds_the_clients(self, boot_config, server, monkeypatch):
+        monkeypatch.setenv('SUPABASE_URL', 'https://example.supabase.co')
+        monkeypatch.setenv('SUPABASE_ANON_KEY', 'header.payload.signature')
+        monkeypatch.setenv('SUPABASE_SERVICE_ROLE_KEY', 'header.payload.signature')
+        inherited = object()
+        monkeypatch.setattr(supabase_module, '_supabase_client', inherited)
+        monkeypatch.setattr(supabase_module, '_supabase_admin_client', inherited)
+        
+        boot_config['post_fork'](server, None)
+        
+        assert supabase_module._supabase_client not in (None, inherited)
+        assert supabase_module._supabase_admin_client not in (None, inherited)
+    
+    def test_when_ready_warms_templates_and_caches(self, app, boot_config, server, fake_supabase):
+        fake_supabase.responses['categories'] = [{'id': 'c1', 'slug': 'laptops'}]
+        server.app = SimpleNamespace(wsgi=lambda: app)
+        
+        boot_config['when_ready'](server)
+        
+        assert 'catalog/product_detail.html' in {name for _, name in app.jinja_env.cache.keys()}
+        assert get_cache().get_or_set('categories:None:True', lambda: 'cold') == [{'id': 'c1', 'slug': 'laptops'}]
+        assert fake_supabase.calls_to('rpc:catalog_version')
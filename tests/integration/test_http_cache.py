@@ -0,0 +1,109 @@
+"""
+Integration tests for conditional responses on catalog pages
+"""
+import pytest
+
+VERSION = '2026-01-01T10:00:00.123456+00:00'
+
+
+def product_page(version=VERSION):
+    return {
+        'product': {
+            'id': 'p1', 'sku': 'LAP-1', 'name': 'Laptop', 'slug': 'laptop',
+            'base_price': 100, 'sale_price': None, 'category_id': 'c1',
+            'category': {'id': 'c1', 'name': 'Laptops', 'slug': 'laptops'}, 'brand': None
+        },
+        'images': [],
+        'variants': [{'id': 'v1', 'name': '16 GB', 'attributes': {}, 'price_adjustment': 0, 'stock': 99, 'is_active': True}],
+        'related': [],
+        'version': version
+    }
+
+
+@pytest.fixture
+def catalog(fake_supabase):
+    """A published product and the version of the whole catalog"""
+    fake_supabase.responses['rpc:product_page'] = lambda query: product_page()
+    fake_supabase.responses['rpc:catalog_version'] = lambda query: {'version': VERSION, 'products': 1}
+    fake_supabase.responses['product_variants'] = [{'id': 'v1', 'stock': 5}]
+    return fake_supabase
+
+
+class TestConditionalResponses:
+    """Anonymous visitors get validators and 304s; sessions with state do not"""
+    
+    def test_anonymous_listing_is_public(self, client, catalog):
+        response = client.get('/catalogo/')
+        
+        assert response.status_code == 200
+        assert response.headers['ETag'].startswith('W/"')
+        assert response.headers['Last-Modified'] == 'Thu, 01 Jan 2026 10:00:00 GMT'
+        assert response.headers['Cache-Control'] == 'public, max-age=60, stale-while-revalidate=600'
+        assert response.headers['Surrogate-Control'] == 'max-age=300, stale-while-revalidate=600'
+        assert 'Cookie' in response.headers['Vary']
+    
+    def test_product_page_is_always_revalidated(self, client, catalog):
+        response = client.get('/catalogo/producto/laptop')
+        
+        assert response.status_code == 200
+        assert response.headers['ETag'].startswith('W/"')
+        assert response.headers['Cache-Control'] == 'public, no-cache'
+        assert 'Surrogate-Control' not in response.headers
+        assert 'Cookie' in response.headers['Vary']
+    
+    def test_current_copy_gets_304(self, client, catalog):
+        first = client.get('/catalogo/producto/laptop')
+        
+        response = client.get('/catalogo/producto/laptop', headers={'If-None-Match': first.headers['ETag']})
+        assert response.status_code == 304
+        assert response.data == b''
+        assert response.headers['ETag'] == first.headers['ETag']
+        
+        first = client.get('/catalogo/')
+        response = client.get('/catalogo/', headers={'If-Modified-Since': first.headers['Last-Modified']})
+        assert response.status_code == 304
+    
+    def test_stock_is_live_and_moves_the_etag(self, client, catalog):
+        first = client.get('/catalogo/producto/laptop')
+        assert '(5 disponibles)' in first.get_data(as_text=True)
+        
+        # A sale: the cached product_page payload is untouched
+        catalog.responses['product_variants'] = [{'id': 'v1', 'stock': 4}]
+        
+        response = client.get('/catalogo/producto/laptop', headers={'If-None-Match': first.headers['ETag']})
+        assert response.status_code == 200
+        assert '(4 disponibles)' in response.get_data(as_text=True)
+        assert len(catalog.calls_to('rpc:product_page')) == 1
+    
+    def test_listing_304_skips_the_product_query(self, client, catalog):
+        first = client.get('/catalogo/')
+        assert first.status_code == 200
+        listing_queries = len(catalog.calls_to('product_listing'))
+        assert listing_queries == 1
+        
+        response = client.get('/catalogo/', headers={'If-None-Match': first.headers['ETag']})
+        assert response.status_code == 304
+        assert len(catalog.calls_to('product_listing')) == listing_queries
+        assert len(catalog.calls_to('rpc:catalog_version')) == 1
+    
+    @pytest.mark.parametrize('state', [
+        {'user_id': 'u1'},
+        {'guest_cart': [['p1', None, 1, 100.0]]},
+    ])
+    def test_logged_in_or_cart_bypasses_the_cache(self, client, catalog, state):
+        etag = client.get('/catalogo/producto/laptop').headers['ETag']
+        with client.session_transaction() as sess:
+            sess.update(state)
+        
+        response = client.get('/catalogo/producto/laptop', headers={'If-None-Match': etag})
+        assert response.status_code == 200
+        assert response.headers['Cache-Control'] == 'private, no-cache'
+        assert 'ETag' not in response.headers
+        assert 'Surrogate-Control' not in response.headers
+    
+    def test_missing_version_is_private(self, client, fake_supabase):
+        response = client.get('/catalogo/')
+        
+        assert response.status_code == 200
+        assert response.headers['Cache-Control'] == 'private, no-cache'
+        assert 'ETag' not in response.headers
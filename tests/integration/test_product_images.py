@@ -0,0 +1,90 @@
+"""
+Micro-benchmark: product detail page with 30 images
+"""
+import time
+
+import pytest
+from supabase import create_client
+
+from app.services import supabase as supabase_module
+from app.services.supabase import get_public_url, image_srcset
+
+IMAGES = 30
+RENDERS = 20
+STORAGE_URL = 'https://test.supabase.co/storage/v1/object/public/products'
+
+
+@pytest.fixture
+def product_with_images(fake_supabase, monkeypatch):
+    """A published product with IMAGES images; a third predate the url column"""
+    monkeypatch.setenv('SUPABASE_URL', 'https://test.supabase.co')
+    fake_supabase.responses['rpc:product_page'] = {
+        'product': {
+            'id': 'p1', 'sku': 'LAP-1', 'name': 'Laptop', 'slug': 'laptop',
+            'base_price': 100, 'sale_price': None, 'category_id': 'c1',
+            'category': {'id': 'c1', 'name': 'Laptops', 'slug': 'laptops'}, 'brand': None
+        },
+        'images': [
+            {
+                'id': f'img-{n}',
+                'storage_path': f'p1/{n}.jpg',
+                'url': None if n % 3 == 0 else f'{STORAGE_URL}/p1/{n}.jpg',
+                'alt_text': None,
+                'is_primary': n == 0,
+                'display_order': n
+            }
+            for n in range(IMAGES)
+        ],
+        'variants': [],
+        'related': [],
+        'version': '2026-01-01T00:00:00+00:00'
+    }
+    return fake_supabase
+
+
+@pytest.fixture
+def transforms(monkeypatch):
+    monkeypatch.setenv('SUPABASE_URL', 'https://test.supabase.co')
+    monkeypatch.setattr(supabase_module, '_public_url_bases', {})
+    monkeypatch.setattr(supabase_module, 'SUPABASE_IMAGE_TRANSFORMS', True)
+
+
+class TestProductImages:
+    """Image URLs are built without touching the storage client"""
+    
+    def test_public_urls_match_the_storage_client(self, monkeypatch):
+        monkeypatch.setenv('SUPABASE_URL', 'https://test.supabase.co')
+        monkeypatch.setattr(supabase_module, '_public_url_bases', {})
+        bucket = create_client('https://test.supabase.co', 'header.payload.signature').storage.from_('products')
+        
+        for path in ('p1/a.jpg', 'p1/sub dir/ñandú.webp'):
+            assert get_public_url(path) == bucket.get_public_url(path)
+    
+    def test_srcset_needs_transforms_and_a_storage_url(self, transforms, monkeypatch):
+        url = f'{STORAGE_URL}/p1/0.jpg'
+        
+        assert image_srcset(url, [320, 640]) == (
+            'https://test.supabase.co/storage/v1/render/image/public/products/p1/0.jpg?width=320&quality=75 320w, '
+            'https://test.supabase.co/storage/v1/render/image/public/products/p1/0.jpg?width=640&quality=75 640w'
+        )
+        assert image_srcset('https://cdn.example.com/a.jpg') == ''
+        
+        monkeypatch.setattr(supabase_module, 'SUPABASE_IMAGE_TRANSFORMS', False)
+        assert image_srcset(url) == ''
+    
+    def test_detail_page_with_30_images(self, client, product_with_images, transforms):
+        # FakeSupabase has no .storage: a per-image client call would fail the page
+        client.get('/catalogo/producto/laptop')
+        
+        start = time.perf_counter()
+        for _ in range(RENDERS):
+            response = client.get('/catalogo/producto/laptop')
+        elapsed = (time.perf_counter() - start) / RENDERS
+        print(f'\nproduct detail with {IMAGES} images: {elapsed * 1000:.2f} ms/render')
+        
+        html = response.get_data(as_text=True)
+        assert response.status_code == 200
+        for n in range(IMAGES):
+            assert f'{STORAGE_URL}/p1/{n}.jpg' in html
+        assert html.count('/render/image/public/products/p1/') >= IMAGES
+        assert len(product_with_images.calls_to('rpc:product_page')) == 1
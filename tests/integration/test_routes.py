@@ -22,6 +22,58 @@ class TestMainRoutes:
         """Test search page"""
         response = client.get('/buscar?q=laptop')
         assert response.status_code == 200
+    
+    def test_search_suggestions(self, client, fake_supabase):
+        """Test autocomplete returns JSON from a single RPC"""
+        fake_supabase.responses['rpc:search_suggestions'] = [{'name': 'Laptop Lenovo', 'slug': 'laptop-lenovo', 'price': 4999.0}]
+        
+        response = client.get('/buscar/sugerencias?q=lapt')
+        client.get('/buscar/sugerencias?q=lapt')
+        
+        assert response.json['results'] == [{
+            'name': 'Laptop Lenovo', 'slug': 'laptop-lenovo', 'price': 4999.0,
+            'url': '/catalogo/producto/laptop-lenovo'
+        }]
+        assert len(fake_supabase.calls_to('rpc:search_suggestions')) == 1
+    
+    def test_catalog_cards_are_cached_fragments(self, client, fake_supabase):
+        """Product cards render once per product version"""
+        from app.services.cache import get_cache, get_fragment_cache
+        fake_supabase.responses['product_listing'] = [
+            {'id': f'p{n}', 'name': f'Producto {n}', 'slug': f'producto-{n}', 'base_price': 100, 'sale_price': None,
+             'stock': 3, 'image_url': None, 'created_at': '2026-01-01T00:00:00+00:00', 'refreshed_at': '2026-01-01T00:00:00+00:00'}
+            for n in range(3)
+        ]
+        
+        first = client.get('/catalogo/')
+        second = client.get('/catalogo/')
+        
+        assert first.status_code == 200
+        assert b'/catalogo/producto/producto-2' in first.data
+        assert second.data == first.data
+        assert len([key for key in get_fragment_cache().local._data if key.startswith('product_cards:')]) == 3
+        # Cards never evict reference data: they live in their own LRU
+        assert not [key for key in get_cache().local._data if key.startswith('product_cards:')]
+    
+    def test_catalog_queries_run_concurrently(self, client, fake_supabase):
+        """Products, categories and brands are fetched in parallel"""
+        import time
+        delay = 0.3
+        
+        def slow(query):
+            time.sleep(delay)
+            return []
+        
+        for table in ('product_listing', 'categories', 'brands'):
+            fake_supabase.responses[table] = slow
+        
+        start = time.perf_counter()
+        response = client.get('/catalogo/')
+        elapsed = time.perf_counter() - start
+        
+        assert response.status_code == 200
+        assert {call.table for call in fake_supabase.calls} >= {'product_listing', 'categories', 'brands'}
+        assert elapsed < delay * 2
 
 
 class TestAuthRoutes:
@@ -46,6 +98,19 @@ class TestCartRoutes:
         response = client.get('/carrito/')
         assert response.status_code == 200
     
+    def test_add_to_cart_returns_count_from_the_rpc(self, client, fake_supabase):
+        """Test HTMX add-to-cart answers with the counters of the same call"""
+        fake_supabase.responses['carts'] = [{'id': 'cart-1'}]
+        fake_supabase.responses['rpc:add_to_cart'] = {'success': True, 'quantity': 1, 'item_count': 4, 'subtotal': 80.0}
+        
+        with client.session_transaction() as sess:
+            sess['cart_session_id'] = 'guest-1'
+        
+        response = client.post('/carrito/agregar', data={'product_id': 'p1'}, headers={'HX-Request': 'true'})
+        
+        assert response.json == {'success': True, 'cart_count': 4, 'cart_total': 80.0}
+        assert [call.table for call in fake_supabase.calls] == ['carts', 'rpc:add_to_cart']
+    
     def test_cart_count(self, client):
         """Test cart count endpoint"""
         response = client.get('/carrito/contador')
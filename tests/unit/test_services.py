@@ -1,9 +1,24 @@
 """
 Unit tests for services
 """
+import base64
+import io
+import re
+from contextlib import nullcontext
+from types import SimpleNamespace
+
+import httpx
 import pytest
+from flask import session
 from app.services.products import ProductService
 from app.services.cart import CartService
+from app.services.orders import OrderService
+from app.services.cache import TieredCache, LocalSharedStore, get_cache
+from app.services.pagination import decode_cursor, encode_cursor, iter_keyset, keyset_page
+from app.services.reports import ReportService
+from app.services import cart as cart_module
+from app.services import supabase as supabase_module
+from app.services.supabase import ConnectionPool, PoolTimeout, RetryTransport
 
 
 class TestProductService:
@@ -23,6 +38,49 @@ class TestProductService:
         """Test getting brands"""
         brands = ProductService.get_brands()
         assert isinstance(brands, list)
+    
+    def test_listing_reads_the_product_listing_model(self, fake_supabase):
+        ProductService.get_products(limit=20, min_price=100)
+        
+        assert fake_supabase.calls_to('products') == []
+        query = fake_supabase.calls_to('product_listing')[0]
+        select = next(args[0] for name, args, kwargs in query.ops if name == 'select')
+        assert 'description' not in select and 'technical_specs' not in select
+        assert '(' not in select
+        assert ('gte', ('price_min', 100), {}) in query.ops
+    
+    def test_name_search_matches_wildcards_literally(self, fake_supabase):
+        ProductService.get_products_page(search='  100%_a\\b*  ', status=None, projection='admin_row')
+        
+        query = fake_supabase.calls[0]
+        assert ('ilike', ('name', '%100\\%\\_a\\\\b_%'), {}) in query.ops
+    
+    def test_product_page_is_one_cached_rpc(self, fake_supabase, monkeypatch):
+        monkeypatch.setenv('SUPABASE_URL', 'https://test.supabase.co')
+        monkeypatch.setattr(supabase_module, '_public_url_bases', {})
+        version = '2026-01-01T00:00:00+00:00'
+        fake_supabase.responses['rpc:product_page'] = lambda query: {
+            'product': {'id': 'p1', 'slug': 'laptop'},
+            'images': [{'id': 'i1', 'url': None, 'storage_path': 'p1/a.jpg'}],
+            'variants': [], 'related': [], 'version': version
+        }
+        
+        page = ProductService.get_product_page('laptop')
+        assert ProductService.get_product_page('laptop') == page
+        
+        assert len(fake_supabase.calls) == 1
+        assert fake_supabase.calls[0].ops[0][1][0] == {'p_slug': 'laptop', 'p_related_limit': 4}
+        assert page['images'] == [{'id': 'i1', 'url': 'https://test.supabase.co/storage/v1/object/public/products/p1/a.jpg'}]
+        
+        version = '2026-01-02T00:00:00+00:00'
+        get_cache().invalidate('products')
+        assert ProductService.get_product_page('laptop')['etag'] != page['etag']
+    
+    def test_related_products_keep_their_order(self, fake_supabase):
+        fake_supabase.responses['related_products'] = [{'related_product_id': 'p2'}, {'related_product_id': 'p1'}]
+        fake_supabase.responses['product_listing'] = [{'id': 'p1'}, {'id': 'p2'}]
+        
+        assert [p['id'] for p in ProductService.get_related_products('p0')] == ['p2', 'p1']
 
 
 class TestCartService:
@@ -33,3 +91,699 @@ class TestCartService:
         count = CartService.get_cart_count()
         assert isinstance(count, int)
         assert count >= 0
+
+
+class TestCartSnapshot:
+    """Test the per-request cart snapshot"""
+    
+    def test_cart_is_fetched_once_per_request(self, app, fake_supabase):
+        fake_supabase.responses['carts'] = [{'id': 'cart-1', 'item_count': 3, 'subtotal': '25.50'}]
+        fake_supabase.responses['cart_items'] = [
+            {'id': 'i1', 'price': '10.00', 'quantity': 2},
+            {'id': 'i2', 'price': '5.50', 'quantity': 1},
+        ]
+        
+        with app.test_request_context('/carrito/'):
+            session['cart_session_id'] = 'guest-1'
+            assert CartService.get_cart_count() == 3
+            assert CartService.get_cart_total() == 25.5
+            assert len(CartService.get_cart_items()) == 2
+        
+        assert len(fake_supabase.calls_to('carts')) == 1
+        assert len(fake_supabase.calls_to('cart_items')) == 1
+    
+    def test_write_invalidates_snapshot(self, app, fake_supabase):
+        fake_supabase.responses['carts'] = [{'id': 'cart-1'}]
+        fake_supabase.responses['cart_items'] = [{'id': 'i1', 'price': '10.00', 'quantity': 1}]
+        
+        with app.test_request_context('/carrito/'):
+            session['cart_session_id'] = 'guest-1'
+            CartService.get_cart_items()
+            CartService.update_cart_item('i1', 3)
+            CartService.get_cart_items()
+        
+        reads = [call for call in fake_supabase.calls_to('cart_items') if call.ops[0][0] == 'select']
+        assert len(reads) == 2
+        assert len(fake_supabase.calls_to('carts')) == 2
+    
+    def test_header_counters_read_only_the_cart_row(self, app, fake_supabase):
+        fake_supabase.responses['carts'] = [{'id': 'cart-1', 'item_count': 4, 'subtotal': '99.90'}]
+        
+        with app.test_request_context('/'):
+            session['cart_session_id'] = 'guest-1'
+            assert CartService.get_cart_summary() == {'count': 4, 'total': 99.9}
+        
+        assert fake_supabase.calls_to('cart_items') == []
+    
+    def test_add_to_cart_is_a_single_rpc(self, app, fake_supabase):
+        fake_supabase.responses['carts'] = [{'id': 'cart-1'}]
+        fake_supabase.responses['rpc:add_to_cart'] = {'success': True, 'quantity': 3, 'item_count': 5, 'subtotal': 120.0}
+        
+        with app.test_request_context('/carrito/agregar'):
+            session['cart_session_id'] = 'guest-1'
+            result = CartService.add_to_cart('p1', 'v1', 2)
+        
+        assert result == {'success': True, 'quantity': 3, 'cart_count': 5, 'cart_total': 120.0}
+        assert [call.table for call in fake_supabase.calls] == ['carts', 'rpc:add_to_cart']
+        assert fake_supabase.calls[1].ops[0][1][0] == {
+            'p_cart_id': 'cart-1', 'p_product_id': 'p1', 'p_variant_id': 'v1', 'p_quantity': 2
+        }
+    
+    def test_add_to_cart_reports_insufficient_stock(self, app, fake_supabase):
+        fake_supabase.responses['carts'] = [{'id': 'cart-1'}]
+        fake_supabase.responses['rpc:add_to_cart'] = {'success': False, 'error': 'insufficient_stock', 'available': 1}
+        
+        with app.test_request_context('/carrito/agregar'):
+            session['cart_session_id'] = 'guest-1'
+            result = CartService.add_to_cart('p1', 'v1', 2)
+        
+        assert result == {'success': False, 'error': 'Insufficient stock (1 available)'}
+    
+    def test_guest_cart_merge_is_a_single_rpc(self, app, fake_supabase):
+        fake_supabase.responses['rpc:merge_guest_cart'] = {'cart_id': 'cart-u', 'merged': 20}
+        
+        with app.test_request_context('/auth/login'):
+            session['cart_session_id'] = 'guest-1'
+            CartService.merge_guest_cart('user-1')
+            assert 'cart_session_id' not in session
+        
+        assert len(fake_supabase.calls) == 1
+        assert fake_supabase.calls[0].ops[0][1][0] == {'p_session_id': 'guest-1', 'p_user_id': 'user-1'}
+    
+    def test_reads_never_create_a_cart(self, app, fake_supabase):
+        with app.test_request_context('/carrito/'):
+            session['user_id'] = 'user-1'
+            assert CartService.get_cart_summary() == {'count': 0, 'total': 0.0}
+            assert CartService.get_cart_items() == []
+            assert CartService.clear_cart() == {'success': True}
+        
+        assert [call.ops[0][0] for call in fake_supabase.calls_to('carts')] == ['select']
+        assert fake_supabase.calls_to('cart_items') == []
+    
+    def test_first_add_creates_the_cart(self, app, fake_supabase):
+        fake_supabase.responses['carts'] = lambda query: [{'id': 'cart-1'}] if query.ops[0][0] == 'insert' else []
+        fake_supabase.responses['rpc:add_to_cart'] = {'success': True, 'quantity': 1, 'item_count': 1, 'subtotal': 10.0}
+        
+        with app.test_request_context('/carrito/agregar'):
+            session['user_id'] = 'user-1'
+            assert CartService.get_cart_count() == 0
+            CartService.add_to_cart('p1', 'v1', 1)
+        
+        assert [call.ops[0][0] for call in fake_supabase.calls_to('carts')] == ['select', 'select', 'insert']
+        assert fake_supabase.calls_to('rpc:add_to_cart')[0].ops[0][1][0]['p_cart_id'] == 'cart-1'
+    
+    def test_purge_runs_batches_until_one_comes_back_short(self, fake_supabase):
+        batches = iter([2, 2, 1])
+        fake_supabase.responses['rpc:purge_abandoned_carts'] = lambda query: next(batches)
+        
+        assert CartService.purge_abandoned(days=7, batch_size=2) == 5
+        
+        calls = fake_supabase.calls_to('rpc:purge_abandoned_carts')
+        assert len(calls) == 3
+        assert calls[0].ops[0][1][0] == {'p_older_than_days': 7, 'p_batch_size': 2}
+
+
+class TestSessionCart:
+    """Test guest carts stored in the signed session"""
+    
+    def test_anonymous_counters_touch_no_tables(self, app, fake_supabase):
+        with app.test_request_context('/'):
+            assert CartService.get_cart_summary() == {'count': 0, 'total': 0}
+            assert CartService.get_cart_items() == []
+            assert 'cart_session_id' not in session
+        
+        assert fake_supabase.calls == []
+    
+    def test_add_keeps_lines_in_the_session(self, app, fake_supabase):
+        fake_supabase.responses['rpc:quote_cart_line'] = {'success': True, 'price': 12.5}
+        
+        with app.test_request_context('/carrito/agregar'):
+            CartService.add_to_cart('p1', None, 1)
+            result = CartService.add_to_cart('p1', None, 2)
+            
+            assert result == {'success': True, 'quantity': 3, 'cart_count': 3, 'cart_total': 37.5}
+            assert session['guest_cart'] == [['p1', None, 3, 12.5]]
+        
+        assert [call.table for call in fake_supabase.calls] == ['rpc:quote_cart_line'] * 2
+        assert fake_supabase.calls[1].ops[0][1][0]['p_quantity'] == 3
+    
+    def test_update_checks_stock_and_refreshes_the_price(self, app, fake_supabase):
+        with app.test_request_context('/carrito/actualizar'):
+            session['guest_cart'] = [['p1', 'v1', 1, 10.0]]
+            item_id = CartService._line_id('p1', 'v1')
+            
+            fake_supabase.responses['rpc:quote_cart_line'] = {'success': False, 'error': 'insufficient_stock'}
+            assert not CartService.update_cart_item(item_id, 50)['success']
+            assert session['guest_cart'] == [['p1', 'v1', 1, 10.0]]
+            
+            fake_supabase.responses['rpc:quote_cart_line'] = {'success': True, 'price': 8.0}
+            assert CartService.update_cart_item(item_id, 3) == {'success': True}
+            assert session['guest_cart'] == [['p1', 'v1', 3, 8.0]]
+        
+        assert fake_supabase.calls[1].ops[0][1][0]['p_quantity'] == 3
+    
+    def test_overflow_moves_the_cart_to_the_server(self, app, fake_supabase, monkeypatch):
+        monkeypatch.setattr(cart_module, 'GUEST_CART_MAX_LINES', 2)
+        fake_supabase.responses['rpc:quote_cart_line'] = {'success': True, 'price': 10.0}
+        fake_supabase.responses['rpc:import_cart_lines'] = {
+            'cart': {'id': 'cart-1', 'item_count': 3, 'subtotal': 30.0}, 'imported': 3
+        }
+        
+        with app.test_request_context('/carrito/agregar'):
+            for product_id in ('p1', 'p2', 'p3'):
+                result = CartService.add_to_cart(product_id)
+            
+            assert result['cart_count'] == 3
+            assert 'guest_cart' not in session
+            session_id = session['cart_session_id']
+        
+        params = fake_supabase.calls_to('rpc:import_cart_lines')[0].ops[0][1][0]
+        assert [item['product_id'] for item in params['p_items']] == ['p1', 'p2', 'p3']
+        assert params['p_session_id'] == session_id
+    
+    def test_login_imports_session_lines_into_the_user_cart(self, app, fake_supabase):
+        fake_supabase.responses['rpc:import_cart_lines'] = {'cart': {'id': 'cart-u'}, 'imported': 1}
+        
+        with app.test_request_context('/auth/login'):
+            session['guest_cart'] = [['p1', 'v1', 2, 10.0]]
+            CartService.merge_guest_cart('user-1')
+            assert 'guest_cart' not in session
+        
+        assert len(fake_supabase.calls) == 1
+        assert fake_supabase.calls[0].ops[0][1][0] == {
+            'p_items': [{'product_id': 'p1', 'variant_id': 'v1', 'quantity': 2}], 'p_user_id': 'user-1'
+        }
+
+
+class TestTieredCache:
+    """Test the two-tier reference data cache"""
+    
+    def test_lru_evicts_least_recently_used(self):
+        cache = TieredCache(maxsize=2)
+        cache.set('brands:a', 1)
+        cache.set('brands:b', 2)
+        cache.get('brands:a')
+        cache.set('brands:c', 3)
+        
+        assert cache.get_or_set('brands:a', lambda: 'reloaded') == 1
+        assert cache.get_or_set('brands:b', lambda: 'reloaded') == 'reloaded'
+    
+    def test_expired_entries_are_reloaded(self):
+        cache = TieredCache()
+        cache.set('pages:nosotros', {'title': 'old'}, ttl=-1)
+        
+        assert cache.get_or_set('pages:nosotros', lambda: {'title': 'new'}) == {'title': 'new'}
+    
+    def test_shared_tier_is_read_through_and_invalidated(self):
+        shared = LocalSharedStore()
+        writer = TieredCache(shared=shared)
+        reader = TieredCache(shared=shared)
+        
+        writer.set('categories:None:True', [{'slug': 'laptops'}])
+        assert reader.get_or_set('categories:None:True', lambda: []) == [{'slug': 'laptops'}]
+        
+        writer.invalidate('categories')
+        reader.local.clear()
+        assert reader.get_or_set('categories:None:True', lambda: 'reloaded') == 'reloaded'
+    
+    def test_invalidation_keeps_no_key_index(self):
+        shared = LocalSharedStore()
+        cache = TieredCache(shared=shared)
+        
+        for n in range(50):
+            cache.set(f'search:query-{n}:20:0', [n])
+        cache.invalidate('search')
+        cache.local.clear()
+        
+        # The old entries only wait for their TTL; the namespace adds one counter
+        assert [key for key in shared._data if not key.startswith('search@0:')] == ['_gen:search']
+        assert cache.get_or_set('search:query-0:20:0', lambda: 'reloaded') == 'reloaded'
+    
+    def test_loader_errors_are_not_cached(self):
+        cache = TieredCache()
+        
+        def failing():
+            raise RuntimeError('upstream down')
+        
+        with pytest.raises(RuntimeError):
+            cache.get_or_set('banners:active', failing)
+        assert cache.get_or_set('banners:active', lambda: ['banner']) == ['banner']
+    
+    def test_categories_hit_supabase_once(self, fake_supabase):
+        fake_supabase.responses['categories'] = [{'id': 'c1', 'slug': 'laptops'}]
+        
+        ProductService.get_categories()
+        ProductService.get_categories()
+        
+        assert len(fake_supabase.calls_to('categories')) == 1
+
+
+class TestOrderService:
+    """Test OrderService"""
+    
+    def test_create_order_is_a_single_rpc(self, app, fake_supabase):
+        fake_supabase.responses['carts'] = [{'id': 'cart-1'}]
+        fake_supabase.responses['cart_items'] = [
+            {
+                'product_id': f'p{n}', 'variant_id': None, 'price': '10.00', 'quantity': 1,
+                'product': {'sku': f'SKU{n}', 'name': f'Producto {n}'}, 'variant': None
+            }
+            for n in range(15)
+        ]
+        fake_supabase.responses['rpc:create_order'] = {'id': 'o1', 'order_number': 'ORD-1'}
+        
+        with app.test_request_context('/checkout/confirmar'):
+            session['cart_session_id'] = 'guest-1'
+            result = OrderService.create_order({
+                'customer_email': 'test@example.com',
+                'customer_name': 'Test',
+                'customer_phone': '12345678',
+                'shipping_address_line1': 'Zona 10',
+                'shipping_city': 'Guatemala',
+                'shipping_state': 'Guatemala'
+            })
+        
+        assert result == {'success': True, 'order': {'id': 'o1', 'order_number': 'ORD-1'}}
+        rpc_calls = fake_supabase.calls_to('rpc:create_order')
+        assert len(rpc_calls) == 1
+        params = rpc_calls[0].ops[0][1][0]
+        assert len(params['p_items']) == 15
+        assert params['p_cart_id'] == 'cart-1'
+        assert params['p_order']['subtotal'] == 150.0
+        for table in ('orders', 'order_items', 'product_variants', 'inventory_movements', 'payments'):
+            assert fake_supabase.calls_to(table) == []
+    
+    def test_dashboard_stats_are_one_cached_rpc(self, fake_supabase):
+        fake_supabase.responses['rpc:dashboard_stats'] = {
+            'total_products': 3, 'total_orders': 2, 'total_revenue': 150.0,
+            'orders_by_status': {'nuevo': 1, 'pagado': 1}, 'recent_orders': [], 'low_stock': []
+        }
+        
+        first = OrderService.get_dashboard_stats()
+        second = OrderService.get_dashboard_stats()
+        
+        assert first == second
+        assert first['orders_by_status'] == {'nuevo': 1, 'pagado': 1}
+        assert len(fake_supabase.calls) == 1
+        
+        OrderService.update_order_status('o1', 'enviado')
+        OrderService.get_dashboard_stats()
+        assert len(fake_supabase.calls_to('rpc:dashboard_stats')) == 2
+
+
+class FakeConnection:
+    """Minimal psycopg2 connection stand-in for pool tests"""
+    
+    def __init__(self):
+        self.closed = 0
+        self.rollbacks = 0
+    
+    def rollback(self):
+        self.rollbacks += 1
+    
+    def commit(self):
+        pass
+    
+    def cursor(self):
+        return nullcontext(SimpleNamespace())
+    
+    def close(self):
+        self.closed = 1
+
+
+class TestConnectionPool:
+    """Test the direct Postgres connection pool"""
+    
+    def test_connections_are_reused(self):
+        opened = []
+        pool = ConnectionPool(lambda: opened.append(FakeConnection()) or opened[-1], minconn=0)
+        
+        for _ in range(3):
+            pool.putconn(pool.getconn())
+        
+        assert len(opened) == 1
+        assert opened[0].rollbacks == 3
+    
+    def test_broken_and_expired_connections_are_replaced(self):
+        opened = []
+        pool = ConnectionPool(lambda: opened.append(FakeConnection()) or opened[-1], minconn=0, max_lifetime=0)
+        
+        conn = pool.getconn()
+        pool.putconn(conn)
+        assert pool.getconn() is not conn
+        assert conn.closed
+    
+    def test_bulk_mode_is_chosen_by_the_caller(self, monkeypatch):
+        import psycopg2.extras
+        sent = []
+        monkeypatch.setattr(psycopg2.extras, 'execute_values', lambda cursor, query, rows, page_size: sent.append('values'))
+        monkeypatch.setattr(psycopg2.extras, 'execute_batch', lambda cursor, query, rows, page_size: sent.append('batch'))
+        monkeypatch.setattr(supabase_module, '_db_pool', ConnectionPool(FakeConnection, minconn=0))
+        rows = [(1,), (2,), (3,)]
+        
+        assert supabase_module.execute_query('insert into t (n) values %s', rows, bulk='values') == 3
+        assert supabase_module.execute_query('UPDATE t SET n = %s', rows, bulk='batch') == 3
+        with pytest.raises(ValueError):
+            supabase_module.execute_query('UPDATE t SET n = %s', rows, bulk='many')
+        
+        assert sent == ['values', 'batch']
+    
+    def test_checkout_times_out_when_exhausted(self):
+        pool = ConnectionPool(FakeConnection, minconn=0, maxconn=1, timeout=0.01)
+        pool.getconn()
+        
+        with pytest.raises(PoolTimeout):
+            pool.getconn()
+
+
+class TestSupabaseHttp:
+    """Test the pooled HTTP client behind the Supabase clients"""
+    
+    def flaky(self, monkeypatch, statuses):
+        calls = []
+        
+        def handle_request(transport, request):
+            calls.append(request.method)
+            return httpx.Response(statuses[min(len(calls), len(statuses)) - 1])
+        
+        monkeypatch.setattr(httpx.HTTPTransport, 'handle_request', handle_request)
+        monkeypatch.setattr(supabase_module.time, 'sleep', lambda seconds: None)
+        return calls
+    
+    def test_reads_are_retried_on_gateway_errors(self, monkeypatch):
+        calls = self.flaky(monkeypatch, [503, 502, 200])
+        client = httpx.Client(transport=RetryTransport(retries=2))
+        
+        assert client.get('https://example.supabase.co/rest/v1/products').status_code == 200
+        assert calls == ['GET', 'GET', 'GET']
+    
+    def test_writes_are_not_retried(self, monkeypatch):
+        calls = self.flaky(monkeypatch, [503, 200])
+        client = httpx.Client(transport=RetryTransport(retries=2))
+        
+        assert client.post('https://example.supabase.co/rest/v1/rpc/create_order').status_code == 503
+        assert calls == ['POST']
+    
+    def test_read_rpcs_are_retried_on_connect_errors(self, monkeypatch):
+        calls = []
+        
+        def handle_request(transport, request):
+            calls.append((request.method, request.url.path, dict(request.url.params)))
+            if len(calls) == 1:
+                raise httpx.ConnectError('connection refused', request=request)
+            return httpx.Response(200, json={'version': '2026-01-01T00:00:00+00:00', 'products': 1}, request=request)
+        
+        monkeypatch.setattr(httpx.HTTPTransport, 'handle_request', handle_request)
+        monkeypatch.setattr(supabase_module.time, 'sleep', lambda seconds: None)
+        client = supabase_module.create_supabase_client('https://example.supabase.co', 'header.payload.signature')
+        
+        data = supabase_module.read_rpc(client, 'catalog_version', {'p_category_id': 'c1', 'p_brand_id': None}).execute().data
+        
+        assert data['products'] == 1
+        assert calls == [('GET', '/rest/v1/rpc/catalog_version', {'p_category_id': 'c1'})] * 2
+    
+    def test_clients_are_rebuilt_after_fork(self, monkeypatch):
+        monkeypatch.setenv('SUPABASE_URL', 'https://example.supabase.co')
+        monkeypatch.setenv('SUPABASE_ANON_KEY', 'anon-key')
+        monkeypatch.setattr(supabase_module, '_supabase_client', None)
+        
+        client = supabase_module.get_supabase_client()
+        assert supabase_module.get_supabase_client() is client
+        
+        monkeypatch.setattr(supabase_module, '_clients_pid', -1)
+        assert supabase_module.get_supabase_client() is not client
+    
+    def test_threads_share_one_client(self, monkeypatch):
+        import threading
+        import time
+        monkeypatch.setenv('SUPABASE_URL', 'https://example.supabase.co')
+        monkeypatch.setenv('SUPABASE_ANON_KEY', 'anon-key')
+        monkeypatch.setattr(supabase_module, '_supabase_client', None)
+        built = []
+        
+        def slow_create(url, key):
+            time.sleep(0.05)
+            built.append(object())
+            return built[-1]
+        
+        monkeypatch.setattr(supabase_module, 'create_supabase_client', slow_create)
+        clients = []
+        threads = [threading.Thread(target=lambda: clients.append(supabase_module.get_supabase_client())) for _ in range(16)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        
+        assert len(built) == 1
+        assert all(client is built[0] for client in clients)
+
+
+class ListQuery:
+    """Evaluates the filters keyset_page emits against an in-memory table"""
+    
+    def __init__(self, rows):
+        self.rows = rows
+        self.filters = []
+        self.sort = []
+        self.size = None
+    
+    def lte(self, column, value):
+        self.filters.append(lambda r: r[column] <= value)
+        return self
+    
+    def gte(self, column, value):
+        self.filters.append(lambda r: r[column] >= value)
+        return self
+    
+    def or_(self, expression):
+        key, op = expression.split('.')[:2]
+        value, row_id = re.findall(r'"([^"]*)"', expression)[1:]
+        value = type(self.rows[0][key])(value)
+        before = op == 'lt'
+        self.filters.append(lambda r: (r[key], r['id']) < (value, row_id) if before else (r[key], r['id']) > (value, row_id))
+        return self
+    
+    def order(self, column, desc=False):
+        self.sort.append((column, desc))
+        return self
+    
+    def limit(self, size):
+        self.size = size
+        return self
+    
+    def execute(self):
+        rows = [r for r in self.rows if all(f(r) for f in self.filters)]
+        rows.sort(key=lambda r: tuple(r[c] for c, _ in self.sort), reverse=self.sort[0][1])
+        return SimpleNamespace(data=rows[:self.size])
+
+
+class TestKeysetPagination:
+    """Test cursor pagination"""
+    
+    ROWS = [{'id': f'{n:03d}', 'base_price': n % 4} for n in range(23)]
+    
+    def walk(self, desc):
+        pages, cursor = [], None
+        while True:
+            page = keyset_page(ListQuery(self.ROWS), 'base_price', desc=desc, cursor=cursor, limit=5)
+            pages.append(page)
+            cursor = page['next_cursor']
+            if not cursor:
+                return pages
+    
+    def test_forward_walk_visits_every_row_once(self):
+        for desc in (True, False):
+            pages = self.walk(desc)
+            ids = [row['id'] for page in pages for row in page['items']]
+            
+            assert sorted(ids) == sorted(row['id'] for row in self.ROWS)
+            assert len(pages) == 5 and pages[0]['prev_cursor'] is None
+    
+    def test_prev_cursor_returns_the_previous_page(self):
+        pages = self.walk(desc=True)
+        
+        for earlier, later in zip(pages, pages[1:]):
+            back = keyset_page(ListQuery(self.ROWS), 'base_price', desc=True, cursor=later['prev_cursor'], limit=5)
+            assert back['items'] == earlier['items']
+            assert back['next_cursor'] is not None
+    
+    def test_foreign_or_tampered_cursors_restart_from_the_first_page(self):
+        cursor = encode_cursor('created_at.desc', {'created_at': 'x', 'id': '1'}, 'created_at', 'next')
+        
+        assert decode_cursor(cursor, 'base_price.desc') is None
+        assert decode_cursor('not-a-cursor', 'base_price.desc') is None
+    
+    def test_null_sort_keys_are_rejected(self):
+        rows = [{'id': '001', 'base_price': None}, {'id': '002', 'base_price': None}]
+        
+        with pytest.raises(ValueError):
+            keyset_page(ListQuery(rows), 'base_price', limit=1)
+        
+        token = encode_cursor('base_price.desc', {'base_price': 1, 'id': '1'}, 'base_price', 'next')
+        forged = base64.urlsafe_b64encode(
+            base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)).replace(b'[1,', b'[null,')
+        ).decode()
+        assert decode_cursor(forged, 'base_price.desc') is None
+    
+    def test_iter_keyset_streams_every_row_in_batches(self):
+        queries = []
+        
+        def make_query():
+            queries.append(ListQuery(self.ROWS))
+            return queries[-1]
+        
+        rows = list(iter_keyset(make_query, 'base_price', batch_size=10))
+        
+        assert [r['id'] for r in rows] == [r['id'] for r in sorted(self.ROWS, key=lambda r: (r['base_price'], r['id']))]
+        assert len(queries) == 3 and all(q.size == 11 for q in queries)
+
+
+class TestReportService:
+    """Test sales report exports"""
+    
+    ROWS = [
+        {'order_number': f'ORD-{n}', 'created_at': '2024-01-02T10:00:00+00:00', 'customer_name': 'Ana, "La" Cliente',
+         'customer_email': 'ana@example.com', 'payment_method': 'sandbox', 'subtotal': '90.00',
+         'shipping_amount': '10.00', 'discount_amount': '0.00', 'total': '100.00'}
+        for n in range(3)
+    ]
+    
+    def test_csv_export_yields_one_chunk_per_row(self):
+        chunks = list(ReportService.export_csv(iter(self.ROWS)))
+        
+        assert len(chunks) == 4
+        assert chunks[0].startswith('\ufeffPedido,Fecha,Cliente')
+        assert chunks[1] == 'ORD-0,2024-01-02T10:00:00+00:00,"Ana, ""La"" Cliente",ana@example.com,sandbox,90.00,10.00,0.00,100.00\r\n'
+    
+    def test_xlsx_export_is_a_readable_workbook(self):
+        from openpyxl import load_workbook
+        
+        data = b''.join(ReportService.export_xlsx(iter(self.ROWS)))
+        sheet = load_workbook(io.BytesIO(data), read_only=True)['Ventas']
+        rows = list(sheet.values)
+        
+        assert rows[0][0] == 'Pedido'
+        assert len(rows) == 4
+        assert rows[1][0] == 'ORD-0' and rows[1][-1] == 100.0
+
+
+class TestFragmentCache:
+    """Test {% cache %} template fragments"""
+    
+    TEMPLATE = "{% for p in products %}{% cache 'product_cards', 'test', p %}[{{ render(p) }}]{% endcache %}{% endfor %}"
+    
+    @staticmethod
+    def render_cards(products, rendered):
+        from flask import render_template_string
+        
+        def render(product):
+            rendered.append(product['id'])
+            return product['name']
+        
+        return render_template_string(TestFragmentCache.TEMPLATE, products=products, render=render)
+    
+    def test_fragments_render_once_per_version(self, app):
+        products = [
+            {'id': 'p1', 'name': 'Laptop', 'refreshed_at': 't1'},
+            {'id': 'p2', 'name': 'Mouse <USB>', 'refreshed_at': 't1'}
+        ]
+        rendered = []
+        
+        with app.test_request_context():
+            assert self.render_cards(products, rendered) == '[Laptop][Mouse &lt;USB&gt;]'
+            assert self.render_cards(products, rendered) == '[Laptop][Mouse &lt;USB&gt;]'
+            products[0] = dict(products[0], name='Laptop Pro', refreshed_at='t2')
+            assert self.render_cards(products, rendered) == '[Laptop Pro][Mouse &lt;USB&gt;]'
+        
+        assert rendered == ['p1', 'p2', 'p1']
+    
+    def test_unversioned_entities_are_not_cached(self, app):
+        rendered = []
+        
+        with app.test_request_context():
+            self.render_cards([{'id': 'p1', 'name': 'Laptop'}], rendered)
+            self.render_cards([{'id': 'p1', 'name': 'Laptop'}], rendered)
+        
+        assert rendered == ['p1', 'p1']
+    
+    def test_catalog_writes_invalidate_fragment_tags(self, app):
+        from app.services.cache import invalidate_catalog_cache
+        products = [{'id': 'p1', 'name': 'Laptop', 'refreshed_at': 't1'}]
+        rendered = []
+        
+        with app.test_request_context():
+            self.render_cards(products, rendered)
+            invalidate_catalog_cache()
+            self.render_cards(products, rendered)
+        
+        assert rendered == ['p1', 'p1']
+
+
+class TestGather:
+    """Test the concurrent fan-out helper"""
+    
+    DELAY = 0.2
+    
+    @staticmethod
+    def slow(value, delay=DELAY):
+        import time
+        
+        def load():
+            time.sleep(delay)
+            return value
+        return load
+    
+    def test_latency_is_the_slowest_loader(self):
+        import time
+        from app.services.concurrency import gather
+        
+        start = time.perf_counter()
+        results = gather(a=self.slow(1), b=self.slow(2), c=self.slow(3))
+        elapsed = time.perf_counter() - start
+        
+        assert results == {'a': 1, 'b': 2, 'c': 3}
+        assert elapsed < self.DELAY * 2
+    
+    def test_loaders_see_the_request_context(self, app):
+        from flask import g, request
+        from app.services.concurrency import gather
+        
+        with app.test_request_context('/catalogo/?orden=name'):
+            session['user_id'] = 'u1'
+            g.marker = 'request-1'
+            results = gather(
+                order=lambda: request.args['orden'],
+                user=lambda: session['user_id'],
+                marker=lambda: g.marker
+            )
+        
+        assert results == {'order': 'name', 'user': 'u1', 'marker': 'request-1'}
+    
+    def test_nested_fanout_cannot_exhaust_the_pool(self, monkeypatch):
+        from app.services import concurrency
+        concurrency.shutdown_executor()
+        monkeypatch.setattr(concurrency, 'FANOUT_MAX_WORKERS', 1)
+        
+        def inner():
+            return concurrency.gather(x=self.slow('x'), y=self.slow('y'))
+        
+        try:
+            assert concurrency.gather(a=inner, b=inner) == {'a': {'x': 'x', 'y': 'y'}, 'b': {'x': 'x', 'y': 'y'}}
+        finally:
+            concurrency.shutdown_executor()
+    
+    def test_errors_propagate_after_every_loader_finishes(self):
+        from app.services.concurrency import gather
+        finished = []
+        
+        def failing():
+            raise RuntimeError('upstream down')
+        
+        def slow():
+            import time
+            time.sleep(self.DELAY)
+            finished.append('slow')
+        
+        with pytest.raises(RuntimeError):
+            gather(a=failing, b=slow)
+        assert finished == ['slow']